@@ -0,0 +1,67 @@
+"""
+Compare the metrics of the 'analyze' mode computed from a DataFrame by each function,
+deriving its own features as before, and from one shared AnalysisContext.
+
+Word frequencies and plots are left out, their cost is the same either way.
+
+Usage: python benchmarks/bench_analysis_context.py [path/to/api_output.csv] [scale]
+"""
+import sys
+import time
+import pandas as pd
+from chatanalyzer.analysis_context import AnalysisContext
+from chatanalyzer.schema import read_results_csv
+from chatanalyzer.sentiment_utils import (
+    calculate_emotional_variability,
+    calculate_sentiment_proportion,
+    calculate_silence_breakers,
+    get_active_days_count,
+    get_date_difference,
+    get_longest_silence,
+    get_peak_hour_activity,
+    get_peak_month_activity,
+)
+
+METRICS = [
+    get_date_difference,
+    get_active_days_count,
+    get_peak_hour_activity,
+    get_peak_month_activity,
+    get_longest_silence,
+    calculate_silence_breakers,
+    calculate_sentiment_proportion,
+    calculate_emotional_variability,
+]
+
+
+def run_metrics(data):
+    for metric in METRICS:
+        metric(data)
+    frame = data.df if isinstance(data, AnalysisContext) else data
+    frame['Text'].str.count('哈').groupby(frame['User'], observed=True).sum()
+
+
+def main():
+    file_path = sys.argv[1] if len(sys.argv) > 1 else "samples/api_output.csv"
+    scale = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    df = read_results_csv(file_path)
+    # Shift each copy by a second so that the history stays in time order
+    df = pd.concat([df.assign(StrTime=df['StrTime'] + pd.Timedelta(seconds=i)) for i in range(scale)])
+    df = df.sort_values('StrTime', kind='stable', ignore_index=True)
+    print(f"{len(df)} results ({scale}x {file_path})")
+
+    start = time.perf_counter()
+    run_metrics(df)
+    per_function = time.perf_counter() - start
+
+    start = time.perf_counter()
+    run_metrics(AnalysisContext(df))
+    shared = time.perf_counter() - start
+
+    print(f"{'features derived by each function':36} {per_function:6.2f} s")
+    print(f"{'one shared AnalysisContext':36} {shared:6.2f} s ({per_function / shared:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Measure the throughput of the batch mode with one worker and with every CPU.
+
+Each conversation is a copy of the sample export along with a copy of the sample
+API results, so the preprocessing and summary stages run without API requests.
+
+Usage: python benchmarks/bench_batch.py [conversations] [max_workers]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+from chatanalyzer.batch_analysis import run_batch
+
+SAMPLES_DIR = os.path.join(os.path.dirname(__file__), '..', 'samples')
+
+
+def prepare(temp_dir, conversations):
+    exports_dir = os.path.join(temp_dir, 'exports')
+    output_dir = os.path.join(temp_dir, 'batch_output')
+    os.makedirs(exports_dir)
+    for i in range(conversations):
+        name = f"conversation{i:04d}"
+        shutil.copy(os.path.join(SAMPLES_DIR, 'full_data.csv'), os.path.join(exports_dir, f"{name}.csv"))
+        os.makedirs(os.path.join(output_dir, name))
+        shutil.copy(os.path.join(SAMPLES_DIR, 'api_output.csv'), os.path.join(output_dir, name, 'api_output.csv'))
+    return exports_dir, output_dir
+
+
+def main():
+    conversations = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count() or 1
+
+    timings = {}
+    for workers in sorted({1, max_workers}):
+        # Fresh copies every time, so that no run benefits from the caches of another
+        temp_dir = tempfile.mkdtemp()
+        try:
+            exports_dir, output_dir = prepare(temp_dir, conversations)
+            start = time.perf_counter()
+            run_batch(exports_dir, output_dir, workers=workers, request=False)
+            timings[workers] = time.perf_counter() - start
+        finally:
+            shutil.rmtree(temp_dir)
+
+    print(f"\n{conversations} conversations")
+    for workers, seconds in timings.items():
+        speedup = timings[1] / seconds
+        print(f"{workers:>3} workers: {seconds:7.2f} s, {conversations / seconds:6.2f} conversations/s, "
+              f"speedup {speedup:.2f}x ({speedup / workers:.0%} of linear)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Measure how the throughput of the sentiment client grows with the number of API keys,
+against a local mock of the sentiment endpoint that throttles each key above its QPS quota.
+
+Usage: python benchmarks/bench_credential_pool.py [qps_per_key] [seconds]
+"""
+import json
+import sys
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from chatanalyzer.sentiment_client import Credential, CredentialPool, SentimentClient
+
+LATENCY = 0.05
+QPS = 10
+RESPONSE = json.dumps({"items": [{"sentiment": 2, "confidence": 0.9, "positive_prob": 0.95, "negative_prob": 0.05}]}).encode()
+THROTTLED = json.dumps({"error_code": 18, "error_msg": "Open api qps request limit reached"}).encode()
+
+
+class MockSentimentHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    lock = threading.Lock()
+    # Times of the requests accepted for each key over the last second
+    accepted = defaultdict(list)
+    throttled = 0
+
+    def do_POST(self):
+        cls = type(self)
+        self.rfile.read(int(self.headers['Content-Length']))
+        token = parse_qs(urlparse(self.path).query)["access_token"][0]
+        with cls.lock:
+            now = time.monotonic()
+            recent = [t for t in cls.accepted[token] if now - t < 1]
+            allowed = len(recent) < QPS
+            if allowed:
+                recent.append(now)
+            else:
+                cls.throttled += 1
+            cls.accepted[token] = recent
+        time.sleep(LATENCY)
+        body = RESPONSE if allowed else THROTTLED
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    global QPS
+    QPS = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockSentimentHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/sentiment"
+    print(f"{QPS} QPS per key, {LATENCY * 1000:.0f} ms latency")
+
+    try:
+        for keys in (1, 2, 4, 8):
+            MockSentimentHandler.accepted.clear()
+            MockSentimentHandler.throttled = 0
+            messages = int(QPS * keys * seconds)
+            pool = CredentialPool([Credential(f"key{i}", qps=QPS, name=f"key{i}") for i in range(keys)])
+            with SentimentClient(url=url, concurrency=64, credentials=pool) as client:
+                start = time.perf_counter()
+                client.analyze_many([f"今天天气真好 {keys} {i}" for i in range(messages)])
+                elapsed = time.perf_counter() - start
+            print(f"{keys} keys: {messages:4d} messages in {elapsed:5.2f} s, {messages / elapsed:6.1f} msg/s, "
+                  f"{MockSentimentHandler.throttled} throttled")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Compare counting many keywords per user and month with one Series.str.count scan per
+keyword, as before, with count_keywords matching all of them in one pass over the texts.
+
+The keywords are the most common words of the sample (of two characters or more), with "哈".
+Each copy of the sample results gets its own texts (a number is added to every message),
+so that no copy is answered by the matches of another.
+
+Usage: python benchmarks/bench_keyword_matcher.py [path/to/api_output.csv] [scale] [keywords]
+"""
+import re
+import sys
+import time
+import pandas as pd
+from chatanalyzer.analysis_context import AnalysisContext
+from chatanalyzer.keyword_matcher import count_keywords
+from chatanalyzer.schema import read_results_csv
+from chatanalyzer.sentiment_utils import word_frequency_analysis
+
+
+def count_each(context, keywords):
+    df = context.df
+    return {keyword: df['Text'].str.count(re.escape(keyword)).groupby([df['User'], df['Month']], observed=True).sum()
+            for keyword in keywords}
+
+
+def main():
+    file_path = sys.argv[1] if len(sys.argv) > 1 else "samples/api_output.csv"
+    scale = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    keyword_count = int(sys.argv[3]) if len(sys.argv) > 3 else 300
+
+    df = read_results_csv(file_path)
+    # Shift each copy by a second so that the history stays in time order
+    df = pd.concat([df.assign(StrTime=df['StrTime'] + pd.Timedelta(seconds=i), Text=df['Text'] + f" {i}")
+                    for i in range(scale)])
+    context = AnalysisContext(df.sort_values('StrTime', kind='stable', ignore_index=True))
+    keywords = ['哈'] + [word for word, _ in word_frequency_analysis(context).most_common(keyword_count - 1)]
+    print(f"{len(context)} messages ({scale}x {file_path}), {len(keywords)} keywords")
+
+    start = time.perf_counter()
+    count_each(context, keywords)
+    per_keyword = time.perf_counter() - start
+
+    start = time.perf_counter()
+    count_keywords(context, keywords)
+    one_pass = time.perf_counter() - start
+
+    print(f"{'one str.count scan per keyword':32} {per_keyword:6.2f} s")
+    print(f"{'one Aho-Corasick pass':32} {one_pass:6.2f} s ({per_keyword / one_pass:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+"""
+Measure how fast the offline lexicon backend scores a million chat messages.
+
+The sample's text messages are repeated with a running number appended, so that
+every message is distinct and none is scored from the deduplication.
+
+Usage: python benchmarks/bench_lexicon_backend.py [path/to/full_data.csv] [messages]
+"""
+import sys
+import time
+import numpy as np
+import pandas as pd
+from chatanalyzer.data_preprocessing import load_and_preprocess_data
+from chatanalyzer.sentiment_backends import LexiconSentimentBackend
+
+
+def main():
+    file_path = sys.argv[1] if len(sys.argv) > 1 else "samples/full_data.csv"
+    messages = int(sys.argv[2]) if len(sys.argv) > 2 else 1000000
+
+    df = load_and_preprocess_data(file_path)
+    texts = df.loc[df['MessageType'] == 'text', 'StrContent'].to_numpy()
+    texts = pd.Series(np.resize(texts, messages)) + pd.Series(np.arange(messages)).astype(str)
+
+    backend = LexiconSentimentBackend()
+    start = time.perf_counter()
+    scores = backend.score(texts)
+    seconds = time.perf_counter() - start
+
+    print(f"{messages} distinct messages scored in {seconds:.2f} s ({messages / seconds:,.0f} msg/s)")
+    print(scores['Sentiment'].value_counts(normalize=True).rename({0: 'negative', 1: 'neutral', 2: 'positive'}))
+
+
+if __name__ == "__main__":
+    main()
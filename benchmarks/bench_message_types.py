@@ -0,0 +1,36 @@
+"""
+Benchmark the vectorized message type classifier against the row-by-row one.
+
+Usage: python benchmarks/bench_message_types.py [path/to/full_data.csv] [scale]
+"""
+import sys
+import time
+import pandas as pd
+from chatanalyzer.data_preprocessing import classify_message_type, classify_message_types
+
+
+def main():
+    file_path = sys.argv[1] if len(sys.argv) > 1 else "samples/full_data.csv"
+    scale = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+    df = pd.read_csv(file_path)
+    df = pd.concat([df] * scale, ignore_index=True)
+    contents = df['StrContent'].fillna('')
+    print(f"Classifying {len(df)} messages ({scale}x {file_path})")
+
+    start = time.perf_counter()
+    expected = contents.apply(classify_message_type)
+    row_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = classify_message_types(contents)
+    vectorized_seconds = time.perf_counter() - start
+
+    assert actual.equals(expected.astype(object)), "Vectorized labels differ from classify_message_type"
+    print(f"Series.apply(classify_message_type): {row_seconds:.2f}s")
+    print(f"classify_message_types:              {vectorized_seconds:.2f}s")
+    print(f"Speedup: {row_seconds / vectorized_seconds:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
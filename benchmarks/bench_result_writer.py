@@ -0,0 +1,52 @@
+"""
+Compare writing sentiment results batch by batch as CSV and as an Arrow stream,
+and reading them back for the 'analyze' mode.
+
+Usage: python benchmarks/bench_result_writer.py [path/to/api_output.csv] [scale] [batch_size]
+"""
+import os
+import sys
+import tempfile
+import time
+import pandas as pd
+from chatanalyzer.result_writer import ResultWriter
+from chatanalyzer.schema import read_results_arrow, read_results_csv
+
+
+def time_write(df, output_path, batch_size):
+    start = time.perf_counter()
+    writer = ResultWriter(output_path)
+    for offset in range(0, len(df), batch_size):
+        writer.write(df.iloc[offset:offset + batch_size])
+    writer.close()
+    return time.perf_counter() - start
+
+
+def time_read(read, output_path):
+    start = time.perf_counter()
+    df = read(output_path)
+    return time.perf_counter() - start, len(df)
+
+
+def main():
+    file_path = sys.argv[1] if len(sys.argv) > 1 else "samples/api_output.csv"
+    scale = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    batch_size = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+
+    # Results as batch_request_api builds them, before any schema is applied
+    df = pd.read_csv(file_path)
+    df['StrTime'] = pd.to_datetime(df['StrTime'])
+    df = pd.concat([df] * scale, ignore_index=True)
+    print(f"{len(df)} results, batches of {batch_size}")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for name, read in [("csv", read_results_csv), ("arrow", read_results_arrow)]:
+            output_path = os.path.join(temp_dir, f"api_output.{name}")
+            write_seconds = time_write(df, output_path, batch_size)
+            read_seconds, rows = time_read(read, output_path)
+            size = os.path.getsize(output_path) / 2 ** 20
+            print(f"{name:>5}: write {write_seconds:6.2f} s, read {read_seconds:6.2f} s ({rows} rows), {size:6.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Compare memory use and groupby times of the analysis columns before and after apply_schema.
+
+Usage: python benchmarks/bench_schema.py [path/to/full_data.csv] [scale]
+"""
+import sys
+import time
+import numpy as np
+import pandas as pd
+from chatanalyzer.data_preprocessing import load_and_preprocess_data
+from chatanalyzer.schema import apply_schema
+
+
+def time_groupbys(df):
+    timings = {}
+    for name, run in [
+        ("groupby User size", lambda: df.groupby('User', observed=True).size()),
+        ("groupby User prob std", lambda: df.groupby('User', observed=True)[['Positive_Prob', 'Negative_Prob']].std()),
+        ("groupby User sentiment counts", lambda: df.groupby('User', observed=True)['Sentiment'].value_counts()),
+        ("groupby Hour, User size", lambda: df.groupby([df['StrTime'].dt.hour, 'User'], observed=True).size()),
+        ("MessageType counts", lambda: df['MessageType'].value_counts()),
+    ]:
+        start = time.perf_counter()
+        run()
+        timings[name] = time.perf_counter() - start
+    return timings
+
+
+def main():
+    file_path = sys.argv[1] if len(sys.argv) > 1 else "samples/full_data.csv"
+    scale = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+
+    # The message text is left out: its size is the same either way
+    df = load_and_preprocess_data(file_path)[['StrTime', 'User', 'MessageType']]
+    df = pd.concat([df] * scale, ignore_index=True)
+
+    # Sentiment columns as the API results are loaded without a schema
+    rng = np.random.default_rng(0)
+    positive = rng.random(len(df))
+    df['Sentiment'] = rng.integers(0, 3, len(df))
+    df['Confidence'] = rng.random(len(df))
+    df['Positive_Prob'] = positive
+    df['Negative_Prob'] = 1 - positive
+    before = df.astype({'User': object, 'MessageType': object})
+    after = apply_schema(before)
+
+    print(f"{len(df)} rows ({scale}x {file_path}), StrContent excluded")
+    before_mb = before.memory_usage(deep=True).sum() / 2**20
+    after_mb = after.memory_usage(deep=True).sum() / 2**20
+    print(f"{'memory':32} {before_mb:9.1f} MB {after_mb:9.1f} MB")
+
+    before_times = time_groupbys(before)
+    after_times = time_groupbys(after)
+    for name in before_times:
+        print(f"{name:32} {before_times[name]:10.3f}s {after_times[name]:10.3f}s")
+
+
+if __name__ == "__main__":
+    main()
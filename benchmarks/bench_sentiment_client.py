@@ -0,0 +1,78 @@
+"""
+Compare sequential sentiment requests, each on a new client and connection, with the
+pooled, concurrent client against a local mock of the sentiment endpoint that answers
+after a fixed latency.
+
+Usage: python benchmarks/bench_sentiment_client.py [messages] [latency_ms]
+"""
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from chatanalyzer.sentiment_client import SentimentClient
+
+LATENCY = 0.05
+RESPONSE = json.dumps({"items": [{"sentiment": 2, "confidence": 0.9, "positive_prob": 0.95, "negative_prob": 0.05}]}).encode()
+
+
+class MockSentimentHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; without this, delayed ACKs stall kept-alive connections
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        time.sleep(LATENCY)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(RESPONSE)))
+        self.end_headers()
+        self.wfile.write(RESPONSE)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    global LATENCY
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    LATENCY = (float(sys.argv[2]) if len(sys.argv) > 2 else 50) / 1000
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockSentimentHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/sentiment"
+    texts = [f"今天天气真好 {i}" for i in range(messages)]
+
+    try:
+        start = time.perf_counter()
+        for text in texts:
+            with SentimentClient("token", url=url, concurrency=1) as client:
+                client.analyze(text)
+        sequential = time.perf_counter() - start
+        print(f"{messages} messages, {LATENCY * 1000:.0f} ms latency")
+        print(f"sequential, new connections: {sequential:6.2f} s, {messages / sequential:7.1f} msg/s")
+
+        with SentimentClient("token", url=url) as client:
+            start = time.perf_counter()
+            for text in texts:
+                client.analyze(text)
+            elapsed = time.perf_counter() - start
+        print(f"sequential, keep-alive:      {elapsed:6.2f} s, {messages / elapsed:7.1f} msg/s, "
+              f"speedup {sequential / elapsed:.1f}x")
+
+        for concurrency in [4, 16, 64]:
+            with SentimentClient("token", url=url, concurrency=concurrency) as client:
+                start = time.perf_counter()
+                client.analyze_many(texts)
+                elapsed = time.perf_counter() - start
+            print(f"concurrency {concurrency:>2}, keep-alive:  {elapsed:6.2f} s, {messages / elapsed:7.1f} msg/s, "
+                  f"speedup {sequential / elapsed:.1f}x")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
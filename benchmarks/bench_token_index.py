@@ -0,0 +1,51 @@
+"""
+Compare counting words per user by scanning every message with Series.str.count, as
+before, with looking them up in a TokenIndex of the messages' tokens.
+
+The queries are "哈" and the most common words. Cutting the messages is left out: the
+'analyze' mode cuts them for the word frequencies anyway, and the index is built from
+those tokens.
+
+Usage: python benchmarks/bench_token_index.py [path/to/api_output.csv] [scale] [queries]
+"""
+import re
+import sys
+import time
+import pandas as pd
+from chatanalyzer.analysis_context import AnalysisContext
+from chatanalyzer.schema import read_results_csv
+from chatanalyzer.sentiment_utils import word_frequency_analysis
+
+
+def main():
+    file_path = sys.argv[1] if len(sys.argv) > 1 else "samples/api_output.csv"
+    scale = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    query_count = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+
+    df = read_results_csv(file_path)
+    # Shift each copy by a second so that the history stays in time order
+    df = pd.concat([df.assign(StrTime=df['StrTime'] + pd.Timedelta(seconds=i)) for i in range(scale)])
+    context = AnalysisContext(df.sort_values('StrTime', kind='stable', ignore_index=True))
+    words = ['哈'] + [word for word, _ in word_frequency_analysis(context).most_common(query_count - 1)]
+    print(f"{len(context)} messages ({scale}x {file_path}), {len(words)} queries")
+
+    start = time.perf_counter()
+    for word in words:
+        context.df['Text'].str.count(re.escape(word)).groupby(context.df['User'], observed=True).sum()
+    scanned = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index = context.token_index()
+    built = time.perf_counter() - start
+    start = time.perf_counter()
+    for word in words:
+        index.frequency(index.count(word), 'User')
+    looked_up = time.perf_counter() - start
+
+    print(f"{'str.count over every message':32} {scanned:6.2f} s ({scanned / len(words) * 1000:.1f} ms per query)")
+    print(f"{'building the token index':32} {built:6.2f} s")
+    print(f"{'token index queries':32} {looked_up:6.2f} s ({looked_up / len(words) * 1000:.1f} ms per query)")
+
+
+if __name__ == "__main__":
+    main()
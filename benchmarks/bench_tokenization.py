@@ -0,0 +1,56 @@
+"""
+Compare the word counts of word_frequency_analysis cut from one string joining every
+message, as before, with cutting each message in a process pool, then from the token cache.
+
+Each copy of the sample results gets its own texts (a number is added to every message),
+so that no copy is answered by the cut of another.
+
+Usage: python benchmarks/bench_tokenization.py [path/to/api_output.csv] [scale] [workers]
+"""
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+import jieba
+import pandas as pd
+from chatanalyzer.schema import read_results_csv
+from chatanalyzer.tokenization import tokenize_texts
+
+
+def count_joined(texts):
+    words = [word for word in jieba.lcut(' '.join(texts)) if len(word.strip()) > 1]
+    return Counter(words)
+
+
+def count_tokens(token_lists):
+    word_counts = Counter()
+    for tokens in token_lists:
+        word_counts.update(word for word in tokens if len(word.strip()) > 1)
+    return word_counts
+
+
+def main():
+    file_path = sys.argv[1] if len(sys.argv) > 1 else "samples/api_output.csv"
+    scale = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else os.cpu_count()
+
+    df = read_results_csv(file_path)
+    texts = pd.concat([df['Text'].dropna() + f" {i}" for i in range(scale)]).tolist()
+    print(f"{len(texts)} messages ({scale}x {file_path}), {len(set(texts))} distinct, {workers} workers")
+    jieba.initialize()
+
+    start = time.perf_counter()
+    count_joined(texts)
+    print(f"{'one joined string':28} {time.perf_counter() - start:6.2f} s")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        cache_path = os.path.join(temp_dir, "token_cache.sqlite")
+        for label in ("per message, cold cache", "per message, warm cache"):
+            start = time.perf_counter()
+            count_tokens(tokenize_texts(texts, cache_path=cache_path, workers=workers))
+            print(f"{label:28} {time.perf_counter() - start:6.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import functools
+import numpy as np
+import pandas as pd
+from chatanalyzer.token_index import TokenIndex
+from chatanalyzer.tokenization import tokenize_texts
+
+# A message after more than SILENCE_HOURS without any breaks the silence, and one
+# after more than VANISH_HOURS (but at most SILENCE_HOURS) follows a vanisher
+SILENCE_HOURS = 12
+VANISH_HOURS = 1
+
+class AnalysisContext:
+    """
+    The sentiment results of a conversation in time order, along with the feature
+    columns read by the metric and plotting functions, each derived once:
+    - Time_Diff (float64): Hours since the previous message, 0 for the first one.
+    - Hour (int8): Hour of the day the message was sent at.
+    - Date (datetime64): Day the message was sent on, at midnight.
+    - Month (period[M]): Month the message was sent in.
+    - Text_Length (int32): Number of characters of the message.
+
+    The DataFrame given is left unchanged; the context holds a sorted copy in `df`.
+
+    Parameters:
+    - df (pd.DataFrame): Sentiment results, with at least 'Text', 'StrTime' (datetime) and 'User'.
+    """
+    def __init__(self, df):
+        if df['StrTime'].is_monotonic_increasing:
+            df = df.reset_index(drop=True)
+        else:
+            df = df.sort_values('StrTime', kind='stable', ignore_index=True)
+        times = df['StrTime']
+        df['Time_Diff'] = times.diff().dt.total_seconds().div(3600).fillna(0)
+        df['Hour'] = times.dt.hour.astype(np.int8)
+        df['Date'] = times.dt.floor('D')
+        df['Month'] = times.dt.to_period('M')
+        df['Text_Length'] = df['Text'].str.len().fillna(0).astype(np.int32)
+        self.df = df
+        # Occurrences of each counted word in every message, see count_occurrences
+        self.occurrences = {}
+        # Tokens of every message and their inverted index, see tokens and token_index
+        self.token_lists = None
+        self.index = None
+
+    def __len__(self):
+        return len(self.df)
+
+    @functools.cached_property
+    def by_user(self):
+        """
+        The messages grouped by user, shared by every per-user statistic.
+        """
+        return self.df.groupby('User', observed=True)
+
+    @functools.cached_property
+    def message_counts(self):
+        """
+        The number of messages of each user.
+        """
+        return self.by_user.size()
+
+    @functools.cached_property
+    def active_days(self):
+        """
+        The number of days with messages.
+        """
+        return self.df['Date'].nunique()
+
+    def count_occurrences(self, word):
+        """
+        Return the number of occurrences of word (a literal string) in each message,
+        looked up in the token index and counted once per word.
+        """
+        if word not in self.occurrences:
+            self.occurrences[word] = self.token_index().count(word)
+        return self.occurrences[word]
+
+    def tokens(self, cache_path=None, workers=None):
+        """
+        Return the jieba tokens of every message as a Series of lists, cut on the first
+        call only (see tokenize_texts for cache_path and workers).
+        """
+        if self.token_lists is None:
+            self.token_lists = pd.Series(tokenize_texts(self.df['Text'], cache_path, workers),
+                                         index=self.df.index, dtype=object)
+        return self.token_lists
+
+    def token_index(self, cache_path=None, workers=None):
+        """
+        Return the TokenIndex of the messages' tokens, built on the first call only
+        (cutting the messages first if tokens was not called yet).
+        """
+        if self.index is None:
+            self.index = TokenIndex(self, self.tokens(cache_path, workers))
+        return self.index
+
+def as_context(df):
+    """
+    Return df if it is already an AnalysisContext, or a new context of the DataFrame df.
+    """
+    return df if isinstance(df, AnalysisContext) else AnalysisContext(df)
@@ -1,13 +1,69 @@
+import contextlib
+import hashlib
+import json
+import os
+import threading
+import time
 import requests
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+TOKEN_FILE = "access_token.txt"
+
+# Refresh the access token this many seconds before it expires (Baidu tokens last 30 days)
+REFRESH_MARGIN = 24 * 3600
+
+# Seconds between attempts of the background refresh after a failure
+REFRESH_RETRY_INTERVAL = 60
+
+@contextlib.contextmanager
+def locked_file(path):
+    """
+    Hold an exclusive lock on path, created if needed, shared by all processes using it.
+    """
+    with open(path, "a+") as file:
+        if fcntl is not None:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+        else:
+            file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:  # Still locked after msvcrt's 10 attempts
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+            else:
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+
 class BaiduAuth:
     """
     A class to handle authentication for Baidu API.
+
+    The token file holds the access token and its expiry time as JSON, and is replaced
+    atomically under a lock (<file>.lock), so that worker processes sharing it read
+    a complete token and only one of them asks for a new token when it expires.
     """
-    def __init__(self, api_key=None, secret_key=None):
+    def __init__(self, api_key=None, secret_key=None, refresh_margin=REFRESH_MARGIN, token_path=TOKEN_FILE):
         self.api_key = api_key
         self.secret_key = secret_key
+        # Token file used by the methods called without a file_path
+        self.token_path = token_path
         self.access_token = None
+        # Unix time the token expires at, None when unknown
+        self.expires_at = None
+        self.refresh_margin = refresh_margin
+        self.refresh_thread = None
+        self.stop_event = threading.Event()
 
     def get_access_token(self):
         """
@@ -22,7 +78,10 @@ class BaiduAuth:
 
         response = requests.post(url, params=params)
         if response.status_code == 200:
-            self.access_token = response.json().get("access_token")
+            response_json = response.json()
+            self.access_token = response_json.get("access_token")
+            expires_in = response_json.get("expires_in")
+            self.expires_at = time.time() + expires_in if expires_in else None
             print("New Access Token generated successfully.")
             return self.access_token
         else:
@@ -35,40 +94,148 @@ class BaiduAuth:
         if not self.access_token:
             raise ValueError("Access token is not available. Please authenticate first.")
         return {"Content-Type": "application/json", "Authorization": f"Bearer {self.access_token}"}
-    
-    def save_access_token(self, file_path="access_token.txt"):
-        """Save the current access token to a file."""
+
+    def save_access_token(self, file_path=None):
+        """Save the current access token and its expiry time to a file, replacing it atomically."""
+        file_path = file_path or self.token_path
         if self.access_token:
-            with open(file_path, "w") as file:
-                file.write(self.access_token)
+            temp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, "w") as file:
+                file.write(json.dumps({"access_token": self.access_token, "expires_at": self.expires_at}))
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temp_path, file_path)
             print(f"Access token saved to {file_path}.")
         else:
             raise ValueError("No access token available to save.")
 
-    def load_access_token(self, file_path="access_token.txt"):
-        """Load access token from a file."""
+    def load_access_token(self, file_path=None):
+        """
+        Load the access token from a file. A file holding only the token, as written by
+        earlier versions, is still read, with an unknown expiry time.
+
+        Raises FileNotFoundError when there is no token file.
+        """
+        file_path = file_path or self.token_path
+        with open(file_path, "r") as file:
+            content = file.read().strip()
         try:
-            with open(file_path, "r") as file:
-                self.access_token = file.read().strip()
-            print(f"Access token loaded from {file_path}.")
-        except FileNotFoundError:
-            print(f"No access token file found at {file_path}.")
-        except Exception as e:
-            print(f"Failed to load access token: {e}")
+            saved = json.loads(content)
+        except ValueError:
+            saved = None
+        if isinstance(saved, dict):
+            self.access_token = saved.get("access_token")
+            self.expires_at = saved.get("expires_at")
+        else:
+            self.access_token = content or None
+            self.expires_at = None
+        print(f"Access token loaded from {file_path}.")
 
-    def is_token_valid(self):
+    def is_token_valid(self, margin=0):
         """
-        Check if the current access token is valid.
+        Check if the current access token is valid for at least margin more seconds.
+        A token of unknown expiry time is taken as valid.
         """
-        return self.access_token is not None
+        if self.access_token is None:
+            return False
+        return self.expires_at is None or time.time() < self.expires_at - margin
 
-    def load_or_generate_access_token(self, file_path="access_token.txt"):
+    def refresh_access_token(self, file_path=None, stale_token=None):
         """
-        Load the access token from a file or generate a new one if the file is not found.
+        Get a new access token, unless another process or thread has already saved one.
+
+        The token file is reloaded under its lock: a token in it that is not stale_token
+        (the one the API rejected, if any) and not about to expire is used as is.
+        Otherwise a new token is fetched and saved.
         """
+        file_path = file_path or self.token_path
+        with locked_file(f"{file_path}.lock"):
+            try:
+                self.load_access_token(file_path)
+            except FileNotFoundError:
+                print(f"{file_path} not found. Generating new access token.")
+            if self.access_token != stale_token and self.is_token_valid(self.refresh_margin):
+                return self.access_token
+            self.get_access_token()
+            self.save_access_token(file_path)
+        return self.access_token
+
+    def load_or_generate_access_token(self, file_path=None):
+        """
+        Load the access token from a file or generate a new one if the file is not found,
+        or if its token has expired or is about to.
+        """
+        file_path = file_path or self.token_path
         try:
             self.load_access_token(file_path)
         except FileNotFoundError:
-            print(f"{file_path} not found. Generating new access token.")
-            self.get_access_token()
-            self.save_access_token(file_path)
+            print(f"No access token file found at {file_path}.")
+        if not self.is_token_valid(self.refresh_margin):
+            self.refresh_access_token(file_path)
+
+    def seconds_until_refresh(self):
+        """
+        Return the seconds left before the token should be refreshed, or None when its expiry time is unknown.
+        """
+        if self.expires_at is None:
+            return None
+        return max(0, self.expires_at - self.refresh_margin - time.time())
+
+    def start_background_refresh(self, file_path=None):
+        """
+        Refresh the token from a daemon thread refresh_margin seconds before it expires,
+        so that long runs never send an expired token.
+        """
+        if self.refresh_thread is not None:
+            return
+        self.stop_event.clear()
+        self.refresh_thread = threading.Thread(target=self._refresh_loop, args=(file_path or self.token_path,),
+                                               name="TokenRefresh", daemon=True)
+        self.refresh_thread.start()
+
+    def stop_background_refresh(self):
+        """
+        Stop the background refresh thread, if started.
+        """
+        if self.refresh_thread is not None:
+            self.stop_event.set()
+            self.refresh_thread.join()
+            self.refresh_thread = None
+
+    def _refresh_loop(self, file_path):
+        wait = self.seconds_until_refresh()
+        while not self.stop_event.wait(wait):
+            try:
+                self.refresh_access_token(file_path)
+                wait = self.seconds_until_refresh()
+                if wait is not None:
+                    # A token lasting less than the margin is not refreshed in a loop
+                    wait = max(wait, REFRESH_RETRY_INTERVAL)
+            except Exception as error:
+                print(f"Failed to refresh the access token, retrying in {REFRESH_RETRY_INTERVAL} seconds: {error}")
+                wait = REFRESH_RETRY_INTERVAL
+
+def load_credentials(file_path):
+    """
+    Read the API keys of a credentials file, a JSON list of objects with 'api_key' and
+    'secret_key' and optionally 'qps', the requests per second allowed for that key.
+
+    Returns:
+    - list: A (BaiduAuth, qps) pair for each key, the BaiduAuth keeping its token in its own
+      file next to the credentials file, and qps None when not given.
+    """
+    with open(file_path, "r", encoding="utf-8") as file:
+        entries = json.load(file)
+    if not isinstance(entries, list) or not all(isinstance(entry, dict) for entry in entries):
+        raise ValueError(f"{file_path} must hold a list of objects with 'api_key' and 'secret_key'.")
+
+    directory = os.path.dirname(os.path.abspath(file_path))
+    credentials = []
+    for entry in entries:
+        if not entry.get("api_key") or not entry.get("secret_key"):
+            raise ValueError(f"Every credential of {file_path} needs an 'api_key' and a 'secret_key'.")
+        name = hashlib.sha1(entry["api_key"].encode("utf-8")).hexdigest()[:12]
+        auth_client = BaiduAuth(entry["api_key"], entry["secret_key"],
+                                token_path=os.path.join(directory, f"access_token.{name}.txt"))
+        credentials.append((auth_client, entry.get("qps")))
+    return credentials
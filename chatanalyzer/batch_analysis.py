@@ -0,0 +1,215 @@
+import contextlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+from tqdm import tqdm
+from chatanalyzer.analysis_context import AnalysisContext
+from chatanalyzer.msg_database import is_msg_database
+
+# Files written for each conversation, in output_dir/<conversation>/
+RESULTS_FILE_NAME = "api_output.{}"
+SUMMARY_FILE_NAME = "summary.json"
+WATERMARKS_FILE_NAME = "watermarks.json"
+LOG_FILE_NAME = "log.txt"
+INDEX_FILE_NAME = "index.csv"
+# Shared by every conversation, in output_dir/
+SENTIMENT_CACHE_FILE_NAME = "sentiment_cache.sqlite"
+TOKEN_CACHE_FILE_NAME = "token_cache.sqlite"
+
+# Columns of the summary index, one row per conversation
+INDEX_COLUMNS = ['Conversation', 'Source', 'Status', 'Messages', 'Text_Messages', 'Results', 'Users',
+                 'First_Time', 'Last_Time', 'Positive_Proportion', 'Negative_Proportion', 'Seconds', 'Error']
+
+def find_exports(source):
+    """
+    List the chat exports to analyze, with a unique conversation name for each.
+
+    Parameters:
+    - source (str): A directory holding CSV exports and MSG databases, or a manifest
+      file listing one export path per line (relative to the manifest; blank lines
+      and lines starting with '#' are skipped).
+
+    Returns:
+    - list: (conversation, file_path) tuples, named after the export files.
+    """
+    if os.path.isdir(source):
+        file_paths = [
+            os.path.join(source, name) for name in sorted(os.listdir(source))
+            if name.lower().endswith('.csv')
+            or (name.lower().endswith('.db') and is_msg_database(os.path.join(source, name)))
+        ]
+    elif os.path.isfile(source):
+        base_dir = os.path.dirname(os.path.abspath(source))
+        with open(source, "r", encoding="utf-8") as file:
+            lines = [line.strip() for line in file]
+        file_paths = [os.path.join(base_dir, line) for line in lines if line and not line.startswith('#')]
+    else:
+        raise ValueError(f"{source} is neither a directory of exports nor a manifest file.")
+
+    exports = []
+    used_names = set()
+    for file_path in file_paths:
+        name = os.path.splitext(os.path.basename(file_path))[0]
+        conversation, suffix = name, 1
+        while conversation in used_names:
+            suffix += 1
+            conversation = f"{name}-{suffix}"
+        used_names.add(conversation)
+        exports.append((conversation, file_path))
+    return exports
+
+def init_worker():
+    """
+    Load the heavy dependencies once per worker process, before its first conversation.
+    """
+    import jieba
+    import chatanalyzer.full_analysis  # noqa: F401 (imports the API client and preprocessing)
+    jieba.setLogLevel(60)
+    jieba.initialize()
+
+def analyze_conversation(conversation, file_path, conversation_dir, request=True, chunksize=100000, timezone=None,
+                         qps=None, sentiment_cache_path=None, result_format="csv", backend="baidu",
+                         backend_options=None, token_cache_path=None):
+    """
+    Run the pipeline for one conversation and describe the outcome as a row of the summary index.
+
+    The export is preprocessed (filling the cache), scored through the API when request
+    is True, and the results found in conversation_dir are summarized to summary.json.
+    Messages are counted in the same single pass over the export: with request, only
+    those newer than the conversation's last run are read and counted.
+    Output of the pipeline goes to log.txt; errors are recorded instead of raised,
+    so that one broken export does not stop the batch.
+    """
+    from chatanalyzer.cache import iter_cached_preprocessed_data, load_cached_results
+    from chatanalyzer.full_analysis import batch_request_api, iter_text_messages
+
+    os.makedirs(conversation_dir, exist_ok=True)
+    results_path = os.path.join(conversation_dir, RESULTS_FILE_NAME.format(result_format))
+    row = {'Conversation': conversation, 'Source': os.path.abspath(file_path), 'Status': 'ok'}
+    start = time.perf_counter()
+
+    log_path = os.path.join(conversation_dir, LOG_FILE_NAME)
+    with open(log_path, "w", encoding="utf-8") as log, \
+            contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        try:
+            if request:
+                # The messages are counted in the same pass as they are scored
+                counts = batch_request_api(file_path, results_path, chunksize=chunksize, timezone=timezone,
+                                           watermark_path=os.path.join(conversation_dir, WATERMARKS_FILE_NAME),
+                                           qps=qps, sentiment_cache_path=sentiment_cache_path, backend=backend,
+                                           backend_options=backend_options)
+            else:
+                counts = {"messages": 0, "text_messages": 0}
+                for _ in iter_text_messages(iter_cached_preprocessed_data(file_path, chunksize, timezone=timezone), counts):
+                    pass
+            row.update({'Messages': counts['messages'], 'Text_Messages': counts['text_messages']})
+
+            if os.path.exists(results_path):
+                summary = summarize_results(load_cached_results(results_path), token_cache_path=token_cache_path)
+                with open(os.path.join(conversation_dir, SUMMARY_FILE_NAME), "w", encoding="utf-8") as file:
+                    json.dump(summary, file, ensure_ascii=False, indent=2)
+                row.update({
+                    'Results': summary['messages'],
+                    'Users': ', '.join(summary['users']),
+                    'First_Time': summary['first_time'],
+                    'Last_Time': summary['last_time'],
+                    'Positive_Proportion': summary['sentiment_proportion'].get('positive'),
+                    'Negative_Proportion': summary['sentiment_proportion'].get('negative'),
+                })
+            else:
+                row['Status'] = 'preprocessed'
+        except Exception as error:
+            print(f"Failed to analyze {file_path}: {error!r}")
+            row.update({'Status': 'failed', 'Error': repr(error)})
+
+    row['Seconds'] = round(time.perf_counter() - start, 3)
+    return row
+
+def summarize_results(df, top_words=20, token_cache_path=None):
+    """
+    Summarize the sentiment results of a conversation without printing, prompting or plotting.
+    Messages are cut into words in this process, through the token cache at token_cache_path if given.
+
+    Returns:
+    - dict: Message counts per user, time range, sentiment proportions and most common words.
+    """
+    from chatanalyzer.sentiment_utils import word_frequency_analysis
+
+    if df.empty:
+        return {'messages': 0, 'users': [], 'first_time': None, 'last_time': None,
+                'active_days': 0, 'messages_per_user': {}, 'sentiment_proportion': {}, 'top_words': []}
+
+    context = AnalysisContext(df)
+    sentiment_names = {0: 'negative', 1: 'neutral', 2: 'positive'}
+    sentiment_proportion = df['Sentiment'].value_counts(normalize=True)
+    messages_per_user = context.message_counts
+    return {
+        'messages': len(df),
+        'users': [str(user) for user in messages_per_user.index],
+        'first_time': str(context.df['StrTime'].iloc[0]),
+        'last_time': str(context.df['StrTime'].iloc[-1]),
+        'active_days': int(context.active_days),
+        'messages_per_user': {str(user): int(count) for user, count in messages_per_user.items()},
+        'sentiment_proportion': {sentiment_names.get(int(sentiment), str(sentiment)): round(float(proportion), 4)
+                                 for sentiment, proportion in sentiment_proportion.items()},
+        'top_words': word_frequency_analysis(context, cache_path=token_cache_path, workers=1).most_common(top_words),
+    }
+
+def run_batch(source, output_dir, workers=None, request=True, chunksize=100000, timezone=None, qps=None,
+              result_format="csv", backend="baidu", backend_options=None):
+    """
+    Analyze every export of a directory or manifest in a pool of worker processes.
+
+    Each conversation gets its own directory output_dir/<conversation>/ holding its API
+    results, watermarks, summary.json and log.txt, and output_dir/index.csv lists the
+    outcome of every conversation. Sentiment results and the words of each message are
+    cached in output_dir/sentiment_cache.sqlite and output_dir/token_cache.sqlite, shared by all workers.
+
+    Parameters:
+    - source (str): Directory of exports or manifest file, see find_exports.
+    - output_dir (str): Directory for the per-conversation outputs and the index.
+    - workers (int): Number of worker processes, the number of CPUs by default.
+    - request (bool): Score new messages through the API; otherwise only preprocess
+      and summarize the results already in output_dir.
+    - qps (float): Requests per second allowed by the API quota, shared evenly by the workers
+      (as are the quotas of the keys of a credentials file).
+    - result_format (str): 'csv' or 'arrow', the format of each conversation's API results.
+    - backend (str): The sentiment backend, one of chatanalyzer.sentiment_backends.SENTIMENT_BACKENDS.
+    - backend_options (dict): Other options of create_sentiment_backend, such as the model_path of 'hybrid'.
+
+    Returns:
+    - pd.DataFrame: The summary index.
+    """
+    exports = find_exports(source)
+    if not exports:
+        raise ValueError(f"No chat exports found in {source}.")
+    os.makedirs(output_dir, exist_ok=True)
+    workers = min(workers or os.cpu_count() or 1, len(exports))
+    print(f"Analyzing {len(exports)} conversations with {workers} workers.")
+    worker_qps = qps / workers if qps else None
+    backend_options = {**(backend_options or {}), "qps_share": 1 / workers}
+    sentiment_cache_path = os.path.join(output_dir, SENTIMENT_CACHE_FILE_NAME)
+    token_cache_path = os.path.join(output_dir, TOKEN_CACHE_FILE_NAME)
+
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+        futures = [
+            executor.submit(analyze_conversation, conversation, file_path,
+                            os.path.join(output_dir, conversation), request, chunksize, timezone, worker_qps,
+                            sentiment_cache_path, result_format, backend, backend_options, token_cache_path)
+            for conversation, file_path in exports
+        ]
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Analyzing Conversations", unit="conversation"):
+            rows.append(future.result())
+
+    index = pd.DataFrame(rows, columns=INDEX_COLUMNS).sort_values('Conversation', ignore_index=True)
+    index_path = os.path.join(output_dir, INDEX_FILE_NAME)
+    index.to_csv(index_path, index=False)
+
+    failed = index[index['Status'] == 'failed']
+    print(f"Batch complete. {len(index) - len(failed)} of {len(index)} conversations analyzed, index saved to {index_path}")
+    for _, row in failed.iterrows():
+        print(f"{row['Conversation']} failed: {row['Error']}")
+    return index
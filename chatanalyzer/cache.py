@@ -0,0 +1,225 @@
+import hashlib
+import json
+import os
+import pandas as pd
+import pyarrow as pa
+from chatanalyzer.data_preprocessing import iter_preprocessed_data
+from chatanalyzer.msg_database import is_msg_database, iter_msg_database
+from chatanalyzer.result_writer import is_arrow_results
+from chatanalyzer.schema import apply_schema, read_results_arrow, read_results_csv
+
+# Bump when the format of the cached frames changes, so that old caches are rebuilt
+CACHE_VERSION = 3
+CACHE_DIR_NAME = ".chatanalyzer_cache"
+METADATA_KEY = b"chatanalyzer_source"
+
+# Arrow types of the columns of the frames yielded by iter_preprocessed_data.
+# Categories are stored as plain strings, as an Arrow file cannot hold a
+# different dictionary for each chunk, and converted back when read
+PREPROCESSED_FIELDS = {
+    "StrContent": pa.string(),
+    "StrTime": pa.timestamp("ns"),
+    "User": pa.string(),
+    "MessageType": pa.string(),
+    "localId": pa.int64(),
+    "TalkerId": pa.int64(),
+    "CreateTime": pa.int64(),
+}
+
+def get_source_fingerprint(file_path, options=None):
+    """
+    Describe the source file by its path, size, modification time and content hash,
+    along with the options the cached frame was built with.
+    """
+    stat = os.stat(file_path)
+    return {
+        "version": CACHE_VERSION,
+        "options": options or {},
+        "path": os.path.abspath(file_path),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": hash_file(file_path),
+    }
+
+def hash_file(file_path, block_size=1 << 20):
+    """
+    Return the SHA-256 hex digest of a file's content.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def get_cache_path(file_path, kind, cache_dir=None):
+    """
+    Return the cache file used for a source file and kind of frame ('preprocessed' or 'results').
+    """
+    source_path = os.path.abspath(file_path)
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(source_path), CACHE_DIR_NAME)
+    name = hashlib.sha1(source_path.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(cache_dir, f"{os.path.basename(source_path)}.{name}.{kind}.arrow")
+
+def is_cache_valid(cache_path, file_path, options=None):
+    """
+    Check whether the cache file was built from the current content of file_path.
+
+    Size and modification time are compared first; the content hash is only
+    computed when the modification time differs, e.g. after the file was copied.
+    When the content is unchanged, the new modification time is saved next to the
+    cache (see get_mtime_path), so that later checks do not hash the file again.
+    """
+    if not os.path.exists(cache_path):
+        return False
+    try:
+        with pa.memory_map(cache_path) as source:
+            metadata = pa.ipc.open_file(source).schema.metadata or {}
+        cached = json.loads(metadata[METADATA_KEY])
+    except (pa.ArrowInvalid, KeyError, ValueError):
+        return False
+
+    stat = os.stat(file_path)
+    if (cached.get("version") != CACHE_VERSION
+            or cached.get("options") != (options or {})
+            or cached.get("path") != os.path.abspath(file_path)
+            or cached.get("size") != stat.st_size):
+        return False
+    if stat.st_mtime_ns in (cached.get("mtime_ns"), read_checked_mtime(cache_path, cached.get("sha256"))):
+        return True
+    if cached.get("sha256") != hash_file(file_path):
+        return False
+    save_checked_mtime(cache_path, cached.get("sha256"), stat.st_mtime_ns)
+    return True
+
+def get_mtime_path(cache_path):
+    """
+    Return the file holding the last modification time of the source found to match a cache's hash.
+    """
+    return f"{cache_path}.mtime.json"
+
+def read_checked_mtime(cache_path, sha256):
+    """
+    Return the modification time of the source last found to have the content hash
+    sha256, or None when it was never checked.
+    """
+    try:
+        with open(get_mtime_path(cache_path), encoding="utf-8") as file:
+            checked = json.load(file)
+    except (OSError, ValueError):
+        return None
+    return checked.get("mtime_ns") if checked.get("sha256") == sha256 else None
+
+def save_checked_mtime(cache_path, sha256, mtime_ns):
+    """
+    Save the modification time of a source found to have the content hash sha256, atomically.
+    """
+    temp_path = f"{get_mtime_path(cache_path)}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as file:
+        json.dump({"sha256": sha256, "mtime_ns": mtime_ns}, file)
+    os.replace(temp_path, get_mtime_path(cache_path))
+
+def read_cache(cache_path):
+    """
+    Yield the DataFrames stored in a cache file, one record batch at a time.
+
+    The file is memory-mapped, so nothing is parsed and only the batch being read is
+    paged in, but each batch is still copied into a new DataFrame by to_pandas().
+    """
+    offset = 0
+    with pa.memory_map(cache_path) as source:
+        reader = pa.ipc.open_file(source)
+        for i in range(reader.num_record_batches):
+            df = reader.get_batch(i).to_pandas()
+            # Restore the row numbers of the source, as chunked CSV reading does
+            df.index = pd.RangeIndex(offset, offset + len(df))
+            offset += len(df)
+            yield df
+
+def write_cache(cache_path, file_path, frames, fields=None, options=None):
+    """
+    Write DataFrames to a cache file while yielding them back unchanged.
+
+    The cache is written to a temporary file and only moved into place once
+    every frame has been consumed, so an interrupted run never leaves a partial cache.
+    fields maps column names to Arrow types, which are otherwise inferred from the first frame.
+    """
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    fingerprint = json.dumps(get_source_fingerprint(file_path, options))
+    temp_path = f"{cache_path}.{os.getpid()}.tmp"
+    writer = None
+    schema = None
+    try:
+        for df in frames:
+            if schema is None and fields is not None:
+                schema = pa.schema([(column, fields[column]) for column in df.columns])
+            table = pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+            if writer is None:
+                schema = table.schema.with_metadata({**(table.schema.metadata or {}), METADATA_KEY: fingerprint})
+                writer = pa.ipc.new_file(temp_path, schema)
+            writer.write_table(table.replace_schema_metadata(schema.metadata))
+            yield df
+        if writer is not None:
+            writer.close()
+            writer = None
+            os.replace(temp_path, cache_path)
+    finally:
+        if writer is not None:
+            writer.close()
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def get_preprocessed_options(timezone=None):
+    """
+    Return the options a preprocessed cache is built with: message times depend on
+    the time zone they were converted to, inferred from 'StrTime' by default.
+    """
+    return {"timezone": timezone or "inferred from StrTime"}
+
+def iter_cached_preprocessed_data(file_path, chunksize=100000, cache_dir=None, timezone=None, row_filter=None):
+    """
+    Yield preprocessed chunks of a chat export, from the cache when it is up to date.
+
+    Otherwise the CSV is parsed with iter_preprocessed_data and the cache is written along the way.
+    A WeChat MSG database needs no parsing and is always read directly.
+
+    With a row_filter (see iter_preprocessed_data), only the rows it keeps are yielded.
+    When the cache is out of date, e.g. for a new daily export, the other rows are
+    dropped before preprocessing and no cache is written, as it would be incomplete.
+    """
+    if is_msg_database(file_path):
+        yield from iter_msg_database(file_path, chunksize=chunksize, timezone=timezone, row_filter=row_filter)
+        return
+
+    cache_path = get_cache_path(file_path, "preprocessed", cache_dir)
+    options = get_preprocessed_options(timezone)
+    if is_cache_valid(cache_path, file_path, options):
+        print(f"Loading preprocessed data from cache {cache_path}")
+        for df in read_cache(cache_path):
+            df = apply_schema(df)
+            yield df if row_filter is None else row_filter(df)
+    elif row_filter is not None:
+        yield from iter_preprocessed_data(file_path, chunksize, timezone, row_filter=row_filter)
+    else:
+        yield from write_cache(cache_path, file_path, iter_preprocessed_data(file_path, chunksize, timezone),
+                               fields=PREPROCESSED_FIELDS, options=options)
+
+def load_cached_results(file_path, cache_dir=None):
+    """
+    Load saved sentiment results, from the cache when it is up to date.
+    Results written in the Arrow format need no parsing and are always read directly.
+    """
+    if is_arrow_results(file_path):
+        return read_results_arrow(file_path)
+
+    cache_path = get_cache_path(file_path, "results", cache_dir)
+    if is_cache_valid(cache_path, file_path):
+        frames = list(read_cache(cache_path))
+        if frames:
+            print(f"Loading results from cache {cache_path}")
+            return pd.concat(frames)
+
+    df = read_results_csv(file_path)
+    for _ in write_cache(cache_path, file_path, [df]):
+        pass
+    return df
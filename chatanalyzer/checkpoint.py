@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+import pandas as pd
+
+class RequestCheckpoint:
+    """
+    Durable progress of a request run, so that an interrupted run resumes where it stopped.
+
+    Two files are kept next to the output:
+    - <output>.checkpoint.json, the manifest: the options of the run, the number of
+      completed batches, the size of the output and the number of processed keys
+      after the last completed batch, replaced atomically after every batch;
+    - <output>.checkpoint.keys, the keys of the processed messages, one per line, appended.
+
+    Anything written after the last manifest (a partly written batch) is cut off when resuming.
+    """
+    def __init__(self, output_path, options=None):
+        self.output_path = output_path
+        self.manifest_path = f"{output_path}.checkpoint.json"
+        self.keys_path = f"{output_path}.checkpoint.keys"
+        self.options = options or {}
+        self.batches = 0
+        self.output_size = 0
+        self.keys = set()
+        self.key_count = 0
+
+    def resume(self):
+        """
+        Load the checkpoint of an interrupted run with the same options, if any.
+
+        The output and the key file are truncated to their state after the last
+        completed batch. Returns True when a run is resumed.
+        """
+        if not os.path.exists(self.manifest_path):
+            return False
+        with open(self.manifest_path, "r") as file:
+            manifest = json.load(file)
+        if manifest.get("options") != self.options:
+            print(f"Ignoring the checkpoint {self.manifest_path} of a run with other options.")
+            self.clear()
+            return False
+
+        if (not os.path.exists(self.output_path) or os.path.getsize(self.output_path) < manifest["output_size"]
+                or not os.path.exists(self.keys_path)):
+            print(f"Ignoring the checkpoint {self.manifest_path}, the output it describes is missing.")
+            self.clear()
+            return False
+
+        self.batches = manifest["batches"]
+        self.output_size = manifest["output_size"]
+        self.key_count = manifest["key_count"]
+        with open(self.output_path, "r+b") as file:
+            file.truncate(self.output_size)
+        with open(self.keys_path, "r+", encoding="utf-8") as file:
+            keys = [file.readline().rstrip("\n") for _ in range(self.key_count)]
+            file.truncate(file.tell())
+        self.keys = set(keys)
+        return True
+
+    def filter_new(self, df):
+        """
+        Drop the messages processed by the interrupted run. Batches committed since
+        are not taken into account, so this is safe while another thread commits.
+        """
+        if not self.keys or df.empty:
+            return df
+        return df[~get_message_keys(df).isin(self.keys)]
+
+    def commit(self, df, output_size):
+        """
+        Record a completed batch, once its results are durably written and output_path has output_size bytes.
+        """
+        keys = get_message_keys(df).tolist()
+        with open(self.keys_path, "a", encoding="utf-8") as file:
+            file.writelines(f"{key}\n" for key in keys)
+            file.flush()
+            os.fsync(file.fileno())
+        self.key_count += len(keys)
+        self.batches += 1
+        self.output_size = output_size
+
+        manifest = {"options": self.options, "batches": self.batches,
+                    "output_size": self.output_size, "key_count": self.key_count}
+        temp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump(manifest, file, indent=2)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.manifest_path)
+
+    def clear(self):
+        """
+        Remove the checkpoint files, once the run is complete.
+        """
+        for path in (self.manifest_path, self.keys_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+def get_message_keys(df):
+    """
+    Return a key identifying each message: its conversation and 'localId' when known,
+    otherwise a hash of its time, sender and text.
+    """
+    if df.empty:
+        return pd.Series([], index=df.index, dtype=object)
+
+    hashed = [
+        "sha1:" + hashlib.sha1(f"{time}\x1f{user}\x1f{text}".encode("utf-8")).hexdigest()
+        for time, user, text in zip(df['StrTime'].astype(str), df['User'].astype(str), df['StrContent'])
+    ]
+    keys = pd.Series(hashed, index=df.index, dtype=object)
+    if 'localId' in df.columns:
+        talker_ids = df['TalkerId'].astype(object) if 'TalkerId' in df.columns else pd.Series('', index=df.index)
+        known = df['localId'].notna()
+        keys[known] = [f"id:{talker_id if pd.notna(talker_id) else ''}:{local_id}"
+                       for talker_id, local_id in zip(talker_ids[known], df.loc[known, 'localId'])]
+    return keys
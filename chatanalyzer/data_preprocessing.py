@@ -1,28 +1,114 @@
+import heapq
+import os
+import numpy as np
 import pandas as pd
 import re
+from chatanalyzer.schema import apply_schema
 
-def load_and_preprocess_data(file_path):
+# The patterns of classify_message_type split at their lazy '.*?', so that the
+# vectorized path never scans a whole message with a backtracking regex
+IMAGE_HEAD = re.compile(r'<msg>\s*<img')
+IMAGE_TAIL = re.compile(r'>\s*</msg>')
+EMOJI_HEAD = re.compile(r'<msg>\s*<emoji')
+
+# Export columns needed for preprocessing and the types they are read as
+CHAT_COLUMN_DTYPES = {
+    'StrContent': str, 'StrTime': str, 'Remark': str, 'Name': str,
+    'localId': 'Int64', 'TalkerId': 'Int64', 'CreateTime': 'Int64',
+}
+
+# Columns identifying a message, kept after preprocessing when the export has them
+ID_COLUMNS = ['localId', 'TalkerId', 'CreateTime']
+
+# Columns identifying a duplicated row of sentiment results when merging
+DEFAULT_MERGE_KEY = ('StrTime', 'User', 'Text')
+
+# Most time-ordered runs a file may be split into when merging
+MAX_MERGE_RUNS = 64
+
+# UTC offsets only change at multiples of 15 minutes, so one lookup per slot is exact
+UTC_OFFSET_SLOT = 15 * 60
+
+# Time zone of exports without StrTime strings to infer it from (WeChat exports are
+# written in China Standard Time unless made elsewhere)
+DEFAULT_TIMEZONE = 'Asia/Shanghai'
+
+def load_and_preprocess_data(file_path, timezone=None):
     """
     Load and preprocess chat data from a CSV file.
 
     Parameters:
     - file_path (str): Path to the CSV file containing chat data.
+    - timezone (str, optional): Time zone of the message times, see parse_message_times.
 
     Returns:
     - pd.DataFrame: Preprocessed DataFrame with relevant columns.
     """
-    # Load CSV file
-    df = pd.read_csv(file_path)
+    # Load only the columns used below
+    df = pd.read_csv(file_path, **get_chat_csv_options(file_path))
+    return preprocess_chat_data(df, timezone)
+
+def iter_preprocessed_data(file_path, chunksize=100000, timezone=None, row_filter=None):
+    """
+    Load and preprocess chat data from a CSV file in chunks of bounded size.
+
+    Parameters:
+    - file_path (str): Path to the CSV file containing chat data.
+    - chunksize (int): Number of CSV rows read per chunk.
+    - timezone (str, optional): Time zone of the message times, see parse_message_times.
+    - row_filter (callable, optional): Applied to each chunk of raw rows before it is
+      preprocessed, e.g. WatermarkStore.filter_new, so that the rows it drops are
+      never classified or converted.
+
+    Yields:
+    - pd.DataFrame: Preprocessed chunk, in the same format as load_and_preprocess_data.
+    """
+    with pd.read_csv(file_path, chunksize=chunksize, **get_chat_csv_options(file_path)) as reader:
+        for chunk in reader:
+            if row_filter is not None:
+                chunk = row_filter(chunk)
+                if chunk.empty:
+                    continue
+            yield preprocess_chat_data(chunk, timezone)
+
+def get_chat_csv_options(file_path):
+    """
+    Build the pd.read_csv options that restrict a chat export to the columns used in preprocessing.
+    """
+    # Only the header is read here
+    columns = pd.read_csv(file_path, nrows=0).columns
 
     # Check if 'Remark' column exists, if not, prompt a warning or try another name
-    if 'Remark' not in df.columns:
+    if 'Remark' not in columns:
         print("Warning: 'Remark' column not found, please check your CSV file columns.")
-        # Example to handle a different column name, modify as necessary
-        if 'Name' in df.columns:
-            df = df.rename(columns={'Name': 'Remark'})
+
+    usecols = [column for column in columns if column in CHAT_COLUMN_DTYPES]
+    dtype = {column: CHAT_COLUMN_DTYPES[column] for column in usecols}
+    return {'usecols': usecols, 'dtype': dtype}
+
+def preprocess_chat_data(df, timezone=None):
+    """
+    Preprocess a DataFrame of raw chat export rows.
+
+    Parameters:
+    - df (pd.DataFrame): Rows with 'StrContent', 'StrTime' and 'Remark' (or 'Name') columns,
+      and optionally the 'localId', 'TalkerId' and integer epoch 'CreateTime' columns.
+    - timezone (str, optional): Time zone of the message times, see parse_message_times.
+
+    Returns:
+    - pd.DataFrame: Preprocessed DataFrame with relevant columns, followed by
+      whichever of the ID_COLUMNS the export has.
+    """
+    # Example to handle a different column name, modify as necessary
+    if 'Remark' not in df.columns and 'Name' in df.columns:
+        df = df.rename(columns={'Name': 'Remark'})
+
+    # Take message times from the epoch column when available, without parsing strings
+    create_time = df['CreateTime'] if 'CreateTime' in df.columns else None
 
     # Keep only relevant columns
-    df = df[['StrContent', 'StrTime', 'Remark']]
+    id_columns = [column for column in ID_COLUMNS if column in df.columns]
+    df = df[['StrContent', 'StrTime', 'Remark'] + id_columns]
 
     # Rename Remark column to User
     df = df.rename(columns={'Remark': 'User'}) 
@@ -31,12 +117,109 @@ def load_and_preprocess_data(file_path):
     df['StrContent'] = df['StrContent'].fillna('')
 
     # Parse message type (e.g., emoji, image)
-    df['MessageType'] = df['StrContent'].apply(classify_message_type)
+    df['MessageType'] = classify_message_types(df['StrContent'])
 
     # Ensure time format is correct
-    df['StrTime'] = pd.to_datetime(df['StrTime'], format='%Y-%m-%d %H:%M:%S')
+    df['StrTime'] = parse_message_times(df['StrTime'], create_time, timezone)
+
+    # Store users and message types as categories
+    df = df[['StrContent', 'StrTime', 'User', 'MessageType'] + id_columns]
+    return apply_schema(df)
+
+def parse_message_times(str_time, create_time=None, timezone=None):
+    """
+    Convert message times to naive datetimes, preferring the export's epoch column.
+
+    Parameters:
+    - str_time (pd.Series): 'StrTime' strings in '%Y-%m-%d %H:%M:%S' format.
+    - create_time (pd.Series, optional): 'CreateTime' epoch seconds. Only rows
+      missing an epoch fall back to parsing their 'StrTime' string.
+    - timezone (str, optional): Time zone of the message times. By default it is
+      inferred from the 'StrTime' strings, see epochs_to_export_times.
+
+    Returns:
+    - pd.Series: datetime64 message times, aligned with str_time.
+    """
+    if create_time is None:
+        return pd.to_datetime(str_time, format='%Y-%m-%d %H:%M:%S')
+
+    missing = create_time.isna().to_numpy()
+    epochs = create_time.fillna(0).to_numpy(dtype='int64')
+    if timezone is None:
+        times = epochs_to_export_times(epochs, str_time, ~missing)
+    else:
+        times = epoch_to_datetime(epochs, timezone)
+    times = pd.Series(times, index=str_time.index)
+    if missing.any():
+        times[missing] = pd.to_datetime(str_time[missing], format='%Y-%m-%d %H:%M:%S')
+    return times
+
+def epoch_to_datetime(epochs, timezone=None):
+    """
+    Convert integer epoch seconds to naive wall-clock datetimes.
+
+    Timezone policy: epochs are UTC instants, and the result holds the wall-clock
+    time they show in `timezone`, without time zone information, just like the
+    'StrTime' strings of the export. The time zone of the machine running the
+    analysis is never used, so that results do not depend on it.
+
+    Parameters:
+    - epochs (np.ndarray): Integer epoch seconds.
+    - timezone (str, optional): IANA time zone name, defaults to DEFAULT_TIMEZONE.
+
+    Returns:
+    - pd.DatetimeIndex: Naive wall-clock datetimes.
+    """
+    epochs = np.asarray(epochs, dtype='int64')
+    return pd.to_datetime(epochs, unit='s', utc=True).tz_convert(timezone or DEFAULT_TIMEZONE).tz_localize(None)
+
+def epochs_to_export_times(epochs, str_time, valid=None):
+    """
+    Convert integer epoch seconds to the wall-clock times of the export's 'StrTime'
+    strings, whatever time zone (and daylight saving time) it was made in.
+
+    The UTC offset is read from the difference between 'StrTime' and the epoch of one
+    message in each 15-minute slot, so only one string per slot is parsed. Slots without
+    any 'StrTime' string use the offset of DEFAULT_TIMEZONE.
+
+    Parameters:
+    - epochs (np.ndarray): Integer epoch seconds.
+    - str_time (pd.Series): 'StrTime' strings of the same messages.
+    - valid (np.ndarray, optional): Mask of the epochs to read offsets from, all by default.
+
+    Returns:
+    - pd.DatetimeIndex: Naive wall-clock datetimes.
+    """
+    epochs = np.asarray(epochs, dtype='int64')
+    slots, slot_index = np.unique(epochs // UTC_OFFSET_SLOT, return_inverse=True)
+    slot_index = slot_index.reshape(-1)
+    slot_starts = slots * UTC_OFFSET_SLOT
+    offsets = epoch_to_datetime(slot_starts).to_numpy('datetime64[s]').astype('int64') - slot_starts
+
+    known = str_time.notna().to_numpy()
+    if valid is not None:
+        known = known & valid
+    rows = np.flatnonzero(known)
+    if len(rows):
+        # The first message with a 'StrTime' string in each slot
+        known_slots, first = np.unique(slot_index[rows], return_index=True)
+        rows = rows[first]
+        wall_clock = pd.to_datetime(str_time.iloc[rows], format='%Y-%m-%d %H:%M:%S')
+        offsets[known_slots] = wall_clock.to_numpy('datetime64[s]').astype('int64') - epochs[rows]
+    return pd.to_datetime(epochs + offsets[slot_index], unit='s')
 
-    return df
+def datetime_to_epoch(value, timezone=None):
+    """
+    Convert a naive wall-clock time to epoch seconds, the inverse of epoch_to_datetime.
+
+    Parameters:
+    - value (str or datetime): Wall-clock time, e.g. '2024-01-01 00:00:00'.
+    - timezone (str, optional): IANA time zone name, defaults to DEFAULT_TIMEZONE.
+
+    Returns:
+    - int: Epoch seconds.
+    """
+    return int(pd.Timestamp(value).tz_localize(timezone or DEFAULT_TIMEZONE).timestamp())
 
 def classify_message_type(content):
     """
@@ -63,6 +246,47 @@ def classify_message_type(content):
     else:
         return 'text'
 
+def classify_message_types(contents):
+    """
+    Classify a whole column of messages, returning the same labels as classify_message_type.
+
+    Only messages containing '<msg>' can be anything other than 'text' or 'empty',
+    so the patterns are matched against that subset alone.
+
+    Parameters:
+    - contents (pd.Series): Message contents, missing values are treated as ''.
+
+    Returns:
+    - pd.Series: Type of each message, aligned with contents.
+    """
+    contents = contents.fillna('')
+    labels = pd.Series('text', index=contents.index, dtype=object)
+    labels[contents.str.strip() == ''] = 'empty'
+
+    has_markup = contents.str.contains('<msg>', regex=False).astype(bool)
+    if has_markup.any():
+        labels[has_markup] = [_classify_markup(content) for content in contents[has_markup].tolist()]
+    return labels
+
+def _classify_markup(content):
+    """
+    Classify a message containing '<msg>', in the same order as classify_message_type.
+    """
+    # Same as re.search(r'<msg>\s*<img.*?>\s*</msg>', content, re.DOTALL)
+    image = IMAGE_HEAD.search(content)
+    if image and IMAGE_TAIL.search(content, image.end()):
+        return 'image'
+    # Same as re.search(r'<msg>\s*<emoji.*?>.*?</msg>', content, re.DOTALL)
+    emoji = EMOJI_HEAD.search(content)
+    if emoji:
+        tag_end = content.find('>', emoji.end())
+        if tag_end != -1 and content.find('</msg>', tag_end + 1) != -1:
+            return 'emoji'
+    # Same as re.search(r'<msg>.*?</msg>', content, re.DOTALL)
+    if content.find('</msg>', content.find('<msg>') + len('<msg>')) != -1:
+        return 'other'
+    return 'text'
+
 def append_csv_files(file1, file2, output_file):
     """
     Append the contents of file1 and file2 and save the result to output_file.
@@ -76,4 +300,170 @@ def append_csv_files(file1, file2, output_file):
 
     # Save to the new output file
     combined_df.to_csv(output_file, index=False)
-    print(f"Files {file1} and {file2} have been combined and saved to {output_file}")
\ No newline at end of file
+    print(f"Files {file1} and {file2} have been combined and saved to {output_file}")
+
+def merge_csv_files(input_files, output_file, key=DEFAULT_MERGE_KEY, time_column='StrTime', chunksize=100000):
+    """
+    Merge CSV files into one file ordered by time, dropping duplicate rows.
+
+    Each file is cut into runs of rows already ordered by time (usually the whole
+    file, or one run per partial output appended to it), and all runs are merged
+    in a single streaming pass, each run read from the byte offset it starts at,
+    so memory use does not depend on the file sizes.
+    Values are copied as text, unchanged. Duplicates share the same time (e.g. the
+    same message scored by two partial runs), so only the keys seen at the current
+    time are remembered.
+
+    Parameters:
+    - input_files (list): Paths of the CSV files to merge, all with the same columns.
+    - output_file (str): Path of the merged CSV file, may be one of input_files.
+    - key (tuple): Columns identifying a row, e.g. ('localId',) for raw exports, or None
+      to keep every row, for files known not to overlap.
+    - time_column (str): Column holding '%Y-%m-%d %H:%M:%S' times to order by.
+    - chunksize (int): Number of rows read from each run, and written, at a time.
+
+    Returns:
+    - tuple: (number of rows written, number of duplicate rows dropped).
+    """
+    columns = list(pd.read_csv(input_files[0], nrows=0).columns)
+    for file_path in input_files[1:]:
+        if list(pd.read_csv(file_path, nrows=0).columns) != columns:
+            raise ValueError(f"Columns of {file_path} differ from those of {input_files[0]}.")
+    missing = [column for column in (time_column, *(key or ())) if column not in columns]
+    if missing:
+        raise ValueError(f"Columns {missing} not found in {input_files[0]}.")
+
+    runs = []
+    for file_path in input_files:
+        row_ranges = find_time_ordered_runs(file_path, time_column, chunksize)
+        offsets = find_row_offsets(file_path, [start for start, _ in row_ranges])
+        for offset, (run_start, run_stop) in zip(offsets, row_ranges):
+            runs.append(_iter_csv_rows(file_path, offset, run_stop - run_start, columns, chunksize))
+
+    time_index = columns.index(time_column)
+    key_indices = [columns.index(column) for column in key] if key is not None else None
+    rows = heapq.merge(*runs, key=lambda row: row[time_index])
+
+    temp_file = f"{output_file}.{os.getpid()}.tmp"
+    written_count = 0
+    duplicate_count = 0
+    try:
+        with open(temp_file, 'w', encoding='utf-8', newline='') as output:
+            pd.DataFrame(columns=columns).to_csv(output, index=False)
+            buffer = []
+            current_time = None
+            seen_keys = set()
+            for row in rows:
+                if row[time_index] != current_time:
+                    current_time = row[time_index]
+                    seen_keys.clear()
+                if key_indices is not None:
+                    row_key = tuple(row[i] for i in key_indices)
+                    if row_key in seen_keys:
+                        duplicate_count += 1
+                        continue
+                    seen_keys.add(row_key)
+                buffer.append(row)
+                if len(buffer) >= chunksize:
+                    pd.DataFrame(buffer, columns=columns).to_csv(output, header=False, index=False)
+                    written_count += len(buffer)
+                    buffer = []
+            pd.DataFrame(buffer, columns=columns).to_csv(output, header=False, index=False)
+            written_count += len(buffer)
+        os.replace(temp_file, output_file)
+    finally:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+
+    print(f"{len(input_files)} files have been merged and saved to {output_file}: "
+          f"{written_count} rows, {duplicate_count} duplicates dropped")
+    return written_count, duplicate_count
+
+def find_time_ordered_runs(file_path, time_column='StrTime', chunksize=100000, max_runs=MAX_MERGE_RUNS):
+    """
+    Split the rows of a CSV file into runs that are each ordered by time.
+
+    Only the time column is read. A file with more than max_runs runs is not
+    ordered at all and raises a ValueError, as merging it would open too many readers.
+
+    Returns:
+    - list: (start, stop) row ranges of the runs, in file order.
+    """
+    starts = [0]
+    row_count = 0
+    last_time = None
+    with pd.read_csv(file_path, usecols=[time_column], dtype=str, keep_default_na=False, chunksize=chunksize) as reader:
+        for chunk in reader:
+            times = chunk[time_column].to_numpy(dtype=object)
+            if not len(times):
+                continue
+            if last_time is not None and times[0] < last_time:
+                starts.append(row_count)
+            starts.extend(row_count + np.flatnonzero(times[1:] < times[:-1]) + 1)
+            row_count += len(times)
+            last_time = times[-1]
+
+    if len(starts) > max_runs:
+        raise ValueError(f"{file_path} is not ordered by {time_column}, please sort it before merging.")
+    return [(int(start), int(stop)) for start, stop in zip(starts, starts[1:] + [row_count]) if stop > start]
+
+def find_row_offsets(file_path, rows, block_size=1 << 24):
+    """
+    Return the byte offsets at which data rows of a CSV file start, row 0 being the
+    first row after the header, reading the file once in binary blocks.
+
+    As for pd.read_csv, newlines inside quoted values do not end a row, and blank
+    lines are not rows.
+
+    Parameters:
+    - file_path (str): Path of the CSV file.
+    - rows (list): Numbers of the data rows, each less than the number of rows.
+
+    Returns:
+    - list: The byte offset of each row of rows, in the same order.
+    """
+    # Rows are counted from the header, which is record 0
+    wanted = {row + 1: None for row in rows}
+    targets = np.array(sorted(wanted), dtype=np.int64)
+    record_count = 0
+    record_start = 0
+    in_quotes = False
+    last_byte = 0
+    position = 0
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            data = np.frombuffer(block, dtype=np.uint8)
+            # A newline ends a record when an even number of quotes came before it
+            quote_parity = (np.cumsum(data == ord('"')) + in_quotes) % 2
+            ends = np.flatnonzero((data == ord('\n')) & (quote_parity == 0))
+            in_quotes = bool(quote_parity[-1])
+
+            starts = np.concatenate(([record_start], position + ends[:-1] + 1))
+            lengths = position + ends - starts
+            before_end = np.concatenate(([last_byte], data))[ends]
+            record_starts = starts[(lengths > 1) | ((lengths == 1) & (before_end != ord('\r')))]
+
+            found = targets[(targets >= record_count) & (targets < record_count + len(record_starts))]
+            for record, offset in zip(found, record_starts[found - record_count]):
+                wanted[int(record)] = int(offset)
+            record_count += len(record_starts)
+            if len(ends):
+                record_start = position + int(ends[-1]) + 1
+            position += len(data)
+            last_byte = data[-1]
+
+    # The last row may have no newline after it
+    if record_start < position and record_count in wanted:
+        wanted[record_count] = record_start
+    return [wanted[row + 1] for row in rows]
+
+def _iter_csv_rows(file_path, offset, row_count, columns, chunksize):
+    """
+    Yield row_count rows of a CSV file as tuples of strings, starting at a byte offset.
+    """
+    with open(file_path, 'rb') as file:
+        file.seek(offset)
+        with pd.read_csv(file, header=None, names=columns, dtype=str, keep_default_na=False,
+                         nrows=row_count, chunksize=chunksize) as reader:
+            for chunk in reader:
+                yield from chunk.itertuples(index=False, name=None)
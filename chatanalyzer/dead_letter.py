@@ -0,0 +1,119 @@
+import functools
+import os
+import pandas as pd
+from chatanalyzer.checkpoint import RequestCheckpoint
+from chatanalyzer.result_writer import ResultWriter
+from chatanalyzer.sentiment_backends import create_sentiment_backend
+from chatanalyzer.sentiment_client import DEFAULT_CONCURRENCY
+from chatanalyzer.sentiment_utils import is_failed
+
+# Columns of a dead-letter file: the message, and why it could not be scored
+DEAD_LETTER_COLUMNS = ['Text', 'StrTime', 'User', 'MessageType', 'Error']
+
+def get_dead_letter_path(output_path):
+    """
+    Return the dead-letter file of a result file, e.g. api_output.deadletter.csv for api_output.csv.
+    """
+    return f"{os.path.splitext(output_path)[0]}.deadletter.csv"
+
+def append_dead_letters(dead_letter_path, df):
+    """
+    Append messages that could not be scored to a dead-letter file, durably, as they are
+    only recorded there once their batch is checkpointed.
+    """
+    header = not os.path.exists(dead_letter_path) or os.path.getsize(dead_letter_path) == 0
+    with open(dead_letter_path, 'a', newline='', encoding='utf-8') as file:
+        df[DEAD_LETTER_COLUMNS].to_csv(file, header=header, index=False)
+        file.flush()
+        os.fsync(file.fileno())
+
+def read_dead_letters(dead_letter_path):
+    """
+    Read a dead-letter file, each message once (a resumed run may have recorded a batch twice).
+    """
+    df = pd.read_csv(dead_letter_path, dtype={'Text': str, 'User': str, 'MessageType': str, 'Error': str},
+                     keep_default_na=False)
+    df['StrTime'] = pd.to_datetime(df['StrTime'], format='%Y-%m-%d %H:%M:%S')
+    return df.drop_duplicates(['Text', 'StrTime', 'User'], keep='last', ignore_index=True)
+
+def write_dead_letters(dead_letter_path, df):
+    """
+    Replace a dead-letter file atomically with the messages of df, or remove it when df is empty.
+    """
+    if df.empty:
+        if os.path.exists(dead_letter_path):
+            os.remove(dead_letter_path)
+        return
+    temp_path = f"{dead_letter_path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w', newline='', encoding='utf-8') as file:
+        df[DEAD_LETTER_COLUMNS].to_csv(file, index=False)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, dead_letter_path)
+
+def replay_dead_letters(output_path, batch_size=100, concurrency=DEFAULT_CONCURRENCY, qps=None,
+                        sentiment_cache_path=None, backend='baidu', backend_options=None):
+    """
+    Score again the messages that failed in earlier 'request' runs, appending their
+    results to output_path without running the whole request again.
+
+    After each batch is written, the dead-letter file is replaced with the messages
+    still to replay and those that failed again, so an interrupted replay can be resumed
+    without scoring a message twice.
+
+    Returns:
+    - int: The number of results added to output_path.
+    """
+    dead_letter_path = get_dead_letter_path(output_path)
+    if not os.path.exists(dead_letter_path):
+        print(f"No failed messages to replay for {output_path}.")
+        return 0
+    if os.path.exists(RequestCheckpoint(output_path).manifest_path):
+        raise ValueError(f"A 'request' run of {output_path} was interrupted, finish it before replaying failed messages.")
+
+    dead_letters = read_dead_letters(dead_letter_path)
+    print(f"Replaying {len(dead_letters)} failed messages from {dead_letter_path}")
+    client = create_sentiment_backend(backend, qps=qps, concurrency=concurrency, retries=5, timeout=15,
+                                      cache_path=sentiment_cache_path, **(backend_options or {}))
+    failed_again = []
+    replayed_count = 0
+
+    def record_batch(end, failed, output_size):
+        # Called from the writer thread once the results of a batch are on disk
+        failed_again.extend(failed)
+        write_dead_letters(dead_letter_path, pd.concat([pd.DataFrame(failed_again, columns=DEAD_LETTER_COLUMNS),
+                                                        dead_letters.iloc[end:]], ignore_index=True))
+
+    writer = ResultWriter(output_path, append=True, backend=client.name)
+    try:
+        for start in range(0, len(dead_letters), batch_size):
+            batch = dead_letters.iloc[start:start + batch_size]
+            results, failed = [], []
+            for (_, row), result in zip(batch.iterrows(), client.analyze_many(batch['Text'].tolist())):
+                if result is None:
+                    continue
+                if is_failed(result):
+                    failed.append({**row[['Text', 'StrTime', 'User', 'MessageType']].to_dict(), 'Error': result['Error']})
+                    continue
+                results.append({
+                    "Text": row['Text'],
+                    "StrTime": row['StrTime'],
+                    "User": row['User'],
+                    "MessageType": row['MessageType'],
+                    "Sentiment": result['Sentiment'],
+                    "Confidence": result['Confidence'],
+                    "Positive_Prob": result['Positive_Prob'],
+                    "Negative_Prob": result['Negative_Prob'],
+                })
+            writer.write(pd.DataFrame(results) if results else None,
+                         functools.partial(record_batch, start + len(batch), failed))
+            replayed_count += len(results)
+    finally:
+        writer.close()
+    client.close()
+    client.print_statistics()
+
+    print(f"{replayed_count} results added to {output_path}.")
+    if failed_again:
+        print(f"{len(failed_again)} messages failed again and remain in {dead_letter_path}.")
+    return replayed_count
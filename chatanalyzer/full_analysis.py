@@ -1,69 +1,224 @@
+import functools
 import os
 import pandas as pd
 from tqdm import tqdm
-from chatanalyzer.auth import BaiduAuth
-from chatanalyzer.data_preprocessing import load_and_preprocess_data
-from chatanalyzer.sentiment_utils import analyze_sentiment
+from chatanalyzer.cache import iter_cached_preprocessed_data
+from chatanalyzer.checkpoint import RequestCheckpoint
+from chatanalyzer.dead_letter import DEAD_LETTER_COLUMNS, append_dead_letters, get_dead_letter_path
+from chatanalyzer.result_writer import RESULT_FIELDS, ResultWriter, export_results_csv, is_arrow_results, record_result_backend
+from chatanalyzer.sentiment_backends import create_sentiment_backend
+from chatanalyzer.sentiment_client import DEFAULT_CONCURRENCY
+from chatanalyzer.sentiment_utils import is_failed
+from chatanalyzer.sharding import filter_shard, get_shard_run
+from chatanalyzer.telemetry import DEFAULT_INTERVAL, Telemetry, TelemetryExporter
+from chatanalyzer.watermark import WatermarkStore
 
-def batch_request_api(file_path, output_path, batch_size=100):
+def batch_request_api(file_path, output_path, batch_size=100, chunksize=100000, timezone=None,
+                      watermark_path=None, incremental=True, concurrency=DEFAULT_CONCURRENCY, qps=None,
+                      sentiment_cache_path=None, csv_export_path=None, backend='baidu', backend_options=None,
+                      metrics_path=None, metrics_interval=DEFAULT_INTERVAL, shard=None):
     """
     Perform sentiment analysis via API in batches and save intermediate results.
+
+    The export is streamed in chunks, and each batch is checkpointed once written, so an
+    interrupted run resumes after its last batch. With a watermark_path, incremental runs
+    only score messages newer than the last run. Messages that could not be scored go
+    to a dead-letter file (see replay_dead_letters), and a shard (i, N) scores one of N
+    shards (see chatanalyzer.sharding).
+
+    Returns:
+    - dict: The numbers of 'messages' and 'text_messages' read (with watermarks, only
+      those newer than the last run), of 'results' saved and of 'failed' messages.
+    """
+    if shard is not None:
+        output_path, watermark_path, metrics_path, qps, backend_options = get_shard_run(
+            shard, output_path, watermark_path, metrics_path, qps, backend_options)
+
+    # Skip the messages processed by earlier runs before they are even preprocessed
+    watermarks = None
+    row_filter = None
+    conversation = os.path.basename(file_path)
+    if watermark_path is not None:
+        # Filter with the watermarks as they were at the start, while recording new ones
+        previous_watermarks = WatermarkStore(watermark_path)
+        watermarks = WatermarkStore(watermark_path)
+        if not incremental:
+            previous_watermarks.clear()
+        if not previous_watermarks.is_empty():
+            row_filter = functools.partial(previous_watermarks.filter_new, default_conversation=conversation)
+
+    # Load and preprocess data chunk by chunk, only processing text messages
+    counts = {"messages": 0, "text_messages": 0}
+    chunks = iter_text_messages(iter_cached_preprocessed_data(file_path, chunksize, timezone=timezone,
+                                                              row_filter=row_filter), counts)
+    if shard is not None:
+        chunks = (filter_shard(chunk, *shard) for chunk in chunks)
+
+    # Resume an interrupted run, skipping the messages of its completed batches
+    run_options = {"source": os.path.abspath(file_path), "incremental": incremental}
+    if shard is not None:
+        run_options["shard"] = list(shard)
+    checkpoint = RequestCheckpoint(output_path, run_options)
+    resumed = checkpoint.resume()
+    if resumed:
+        print(f"Resuming the interrupted run after batch {checkpoint.batches} "
+              f"({checkpoint.key_count} messages already processed).")
+    chunks = (checkpoint.filter_new(chunk) for chunk in chunks)
+
+    # A full run forgets the watermarks, but a resumed one keeps those of its completed batches
+    if watermarks is not None and not incremental and not resumed:
+        watermarks.clear()
+    append_output = resumed or (watermarks is not None and not watermarks.is_empty() and os.path.exists(output_path))
+
+    # A full run replaces the failed messages of earlier runs along with their output
+    dead_letter_path = get_dead_letter_path(output_path)
+    if not append_output and os.path.exists(dead_letter_path):
+        os.remove(dead_letter_path)
+
+    # Initialize the sentiment backend, authenticating with the API if needed
+    labels = {"source": conversation}
+    if shard is not None:
+        labels["shard"] = "{}/{}".format(*shard)
+    telemetry = Telemetry(labels)
+    client = create_sentiment_backend(backend, qps=qps, concurrency=concurrency, retries=5, timeout=15,
+                                      cache_path=sentiment_cache_path, telemetry=telemetry, **(backend_options or {}))
+    exporter = TelemetryExporter(telemetry, metrics_path, interval=metrics_interval) if metrics_path else None
+    recorder = BatchRecorder(output_path, checkpoint, telemetry, watermarks, conversation)
+    saved_count = 0
+    failed_count = 0
+
+    # Process data in batches and save intermediate results, replacing the
+    # output of any previous full run with the first batch
+    writer = ResultWriter(output_path, append=append_output, backend=client.name)
+    progress = tqdm(desc="Requesting Sentiment Analysis", unit="msg")
+    try:
+        for batch_number, batch in enumerate(iter_batches(chunks, batch_size), start=checkpoint.batches + 1):
+            # Perform sentiment analysis on the messages concurrently, results come back in order
+            batch_results, failed_messages = split_results(batch, client.analyze_many(batch['StrContent'].tolist()))
+            progress.update(len(batch))
+            telemetry.increment("chatanalyzer_messages_total", len(batch))
+
+            if batch_results:
+                # Print one result from every 100 records
+                print(f"Batch {batch_number} Completed. Sample Result:\n{batch_results[0]}")
+
+            # Hand each batch's results to the writer thread, and request the next batch meanwhile
+            batch_df = pd.DataFrame(batch_results) if batch_results else None
+            failed_df = pd.DataFrame(failed_messages, columns=DEAD_LETTER_COLUMNS) if failed_messages else None
+            writer.write(batch_df, functools.partial(recorder.record, batch_number, batch, len(batch_results), failed_df))
+            saved_count += len(batch_results)
+            failed_count += len(failed_messages)
+    finally:
+        progress.close()
+        # Completed batches are still written and checkpointed when a later one fails
+        writer.close()
+        if exporter is not None:
+            exporter.close()
+    checkpoint.clear()
+    if shard is not None and not os.path.exists(output_path):
+        # An empty shard still leaves an output, telling the merge that it was run
+        pd.DataFrame(columns=RESULT_FIELDS.names).to_csv(output_path, index=False)
+        record_result_backend(output_path, client.name)
+    client.close()
+    client.print_statistics()
+
+    if saved_count:
+        print(f"Analysis complete. {saved_count} results saved to {output_path}")
+    elif watermarks is not None:
+        print(f"No new messages since the last run, {output_path} is up to date.")
+    if failed_count:
+        print(f"{failed_count} messages could not be scored and were saved to {dead_letter_path}, "
+              f"run the 'replay' mode to score them again.")
+
+    if csv_export_path is not None and is_arrow_results(output_path) and os.path.exists(output_path):
+        export_results_csv(output_path, csv_export_path)
+    return {**counts, "results": saved_count, "failed": failed_count}
+
+class BatchRecorder:
+    """
+    Record the batches of a 'request' run once their results are on disk, from the
+    writer thread: their failed messages are saved to the dead-letter file before the
+    checkpoint moves past them, so that none are lost, then the watermarks advance.
+    """
+    def __init__(self, output_path, checkpoint, telemetry, watermarks=None, conversation=None):
+        self.output_path = output_path
+        self.dead_letter_path = get_dead_letter_path(output_path)
+        self.checkpoint = checkpoint
+        self.telemetry = telemetry
+        self.watermarks = watermarks
+        self.conversation = conversation
+
+    def record(self, batch_number, batch, result_count, failed_df, output_size):
+        if failed_df is not None:
+            append_dead_letters(self.dead_letter_path, failed_df)
+        self.checkpoint.commit(batch, output_size)
+        self.telemetry.increment("chatanalyzer_batches_total")
+        self.telemetry.increment("chatanalyzer_results_saved_total", result_count)
+        if self.watermarks is not None:
+            self.watermarks.advance(batch, self.conversation)
+            self.watermarks.save()
+        if result_count:
+            print(f"Batch {batch_number} saved to {self.output_path}")
+
+def split_results(batch, sentiment_results):
+    """
+    Pair the messages of a batch with their sentiment results, leaving out blank ones.
+
+    Returns:
+    - tuple: (result rows, failed message rows with their 'Error').
     """
-    # Load and preprocess data
-    df = load_and_preprocess_data(file_path)
-    df = df[df['MessageType'] == 'text']  # Only process text messages
-
-    # Initialize authentication
-    auth_client = BaiduAuth()
-    auth_client.load_access_token()
-    if not auth_client.is_token_valid():
-        auth_client.get_access_token()
-        auth_client.save_access_token()
-
-    results = []
-
-    # Process data in batches and save intermediate results
-    for i in tqdm(range(0, len(df), batch_size), desc="Requesting Sentiment Analysis"):
-        batch = df.iloc[i:i + batch_size]
-
-        batch_results = []
-
-        # Perform sentiment analysis on each message
-        for _, row in batch.iterrows():
-            sentiment_result = analyze_sentiment(auth_client.access_token, row['StrContent'], retries=5, timeout=15)
-            if sentiment_result:
-                batch_results.append({
-                    "Text": row['StrContent'],
-                    "StrTime": row['StrTime'],
-                    "User": row['User'],
-                    "MessageType": row['MessageType'],
-                    "Sentiment": sentiment_result.get('Sentiment', None),
-                    "Confidence": sentiment_result.get('Confidence', 0.0),
-                    "Positive_Prob": sentiment_result.get('Positive_Prob', 0.0),
-                    "Negative_Prob": sentiment_result.get('Negative_Prob', 0.0),
-                })
-
-        if batch_results:
-            results.extend(batch_results)
-            # Print one result from every 100 records
-            print(f"Batch {i//batch_size + 1} Completed. Sample Result:\n{batch_results[0]}")
-
-            # Convert each batch's results to a DataFrame and save as a CSV file
-            batch_df = pd.DataFrame(batch_results)
-            if os.path.exists(output_path):
-                batch_df.to_csv(output_path, mode='a', header=False, index=False)
-            else:
-                batch_df.to_csv(output_path, index=False)
-            print(f"Batch {i//batch_size + 1} saved to {output_path}")
-
-    # Save all results at the end
-    if results:
-        results_df = pd.DataFrame(results)
-        results_df.to_csv(output_path, index=False)
-        print(f"Analysis complete. Results saved to {output_path}")
+    batch_results = []
+    failed_messages = []
+    for (_, row), sentiment_result in zip(batch.iterrows(), sentiment_results):
+        if not sentiment_result:
+            continue
+        message = {
+            "Text": row['StrContent'],
+            "StrTime": row['StrTime'],
+            "User": row['User'],
+            "MessageType": row['MessageType'],
+        }
+        if is_failed(sentiment_result):
+            failed_messages.append({**message, "Error": sentiment_result['Error']})
+        else:
+            batch_results.append({
+                **message,
+                "Sentiment": sentiment_result.get('Sentiment', None),
+                "Confidence": sentiment_result.get('Confidence', 0.0),
+                "Positive_Prob": sentiment_result.get('Positive_Prob', 0.0),
+                "Negative_Prob": sentiment_result.get('Negative_Prob', 0.0),
+            })
+    return batch_results, failed_messages
+
+def iter_text_messages(chunks, counts):
+    """
+    Yield the text messages of each preprocessed chunk, adding up in counts the
+    'messages' and 'text_messages' read.
+    """
+    for chunk in chunks:
+        is_text = chunk['MessageType'] == 'text'
+        counts["messages"] += len(chunk)
+        counts["text_messages"] += int(is_text.sum())
+        yield chunk[is_text]
+
+def iter_batches(chunks, batch_size):
+    """
+    Regroup a stream of DataFrame chunks into batches of exactly batch_size rows (except the last).
+    """
+    pending = None
+    for chunk in chunks:
+        if pending is not None and len(pending):
+            chunk = pd.concat([pending, chunk])
+        full_length = len(chunk) - len(chunk) % batch_size
+        for start in range(0, full_length, batch_size):
+            yield chunk.iloc[start:start + batch_size]
+        pending = chunk.iloc[full_length:]
+
+    if pending is not None and len(pending):
+        yield pending
 
 if __name__ == "__main__":
     # Specify default file paths
     input_file = "full_data.csv"  
     output_file = "api_output.csv"  
-    batch_request_api(input_file, output_file)
\ No newline at end of file
+    batch_request_api(input_file, output_file)
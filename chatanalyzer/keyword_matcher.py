@@ -0,0 +1,127 @@
+from collections import deque
+import numpy as np
+import pandas as pd
+from chatanalyzer.analysis_context import as_context
+
+KEYWORD_COUNTS_FILE = "keyword_counts.csv"
+
+def read_keywords(file_path):
+    """
+    Read the keywords to count from a text file with one literal keyword per line,
+    leaving out blank lines and repeated keywords.
+
+    Returns:
+    - list: The keywords, in the order of the file.
+    """
+    with open(file_path, encoding="utf-8") as file:
+        keywords = [line.strip() for line in file]
+    keywords = list(dict.fromkeys(keyword for keyword in keywords if keyword))
+    if not keywords:
+        raise ValueError(f"No keywords found in {file_path}.")
+    return keywords
+
+class KeywordMatcher:
+    """
+    An Aho-Corasick automaton of many literal keywords, finding all of them in a text
+    in one pass over its characters, whatever the number of keywords.
+
+    Parameters:
+    - keywords (list): The keywords, matched as literal strings (nothing is a pattern).
+    """
+    def __init__(self, keywords):
+        self.keywords = list(dict.fromkeys(keywords))
+        if not self.keywords or not all(self.keywords):
+            raise ValueError("Keywords must be non-empty strings.")
+        self.lengths = [len(keyword) for keyword in self.keywords]
+
+        # A trie of the keywords: the transitions of each state, and the keywords ending there
+        self.transitions = [{}]
+        self.outputs = [[]]
+        for keyword_id, keyword in enumerate(self.keywords):
+            state = 0
+            for char in keyword:
+                if char not in self.transitions[state]:
+                    self.transitions.append({})
+                    self.outputs.append([])
+                    self.transitions[state][char] = len(self.transitions) - 1
+                state = self.transitions[state][char]
+            self.outputs[state].append(keyword_id)
+
+        # Each state fails over to the longest proper suffix of its string that is also
+        # in the trie, and outputs the keywords ending there too (breadth first, so that
+        # the failure of a state is complete before its children are reached)
+        self.failures = [0] * len(self.transitions)
+        queue = deque(self.transitions[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self.transitions[state].items():
+                queue.append(child)
+                failure = self.failures[state]
+                while failure and char not in self.transitions[failure]:
+                    failure = self.failures[failure]
+                if state:
+                    self.failures[child] = self.transitions[failure].get(char, 0)
+                self.outputs[child] = self.outputs[child] + self.outputs[self.failures[child]]
+
+    def count(self, text):
+        """
+        Count each keyword in a text, the same way as str.count: occurrences of one
+        keyword do not overlap, while different keywords may (a text "哈哈哈" holds
+        "哈" three times and "哈哈" once).
+
+        Returns:
+        - dict: The number of occurrences of each keyword id found.
+        """
+        transitions, failures, outputs, lengths = self.transitions, self.failures, self.outputs, self.lengths
+        counts = {}
+        # End of the last counted occurrence of each keyword
+        last_ends = {}
+        state = 0
+        for end, char in enumerate(text):
+            while state and char not in transitions[state]:
+                state = failures[state]
+            state = transitions[state].get(char, 0)
+            for keyword_id in outputs[state]:
+                if end - lengths[keyword_id] >= last_ends.get(keyword_id, -1):
+                    counts[keyword_id] = counts.get(keyword_id, 0) + 1
+                    last_ends[keyword_id] = end
+        return counts
+
+def count_keywords(df, keywords, period='M'):
+    """
+    Count many literal keywords in the messages in one pass over each text, for each
+    user and time period.
+
+    Parameters:
+    - df (pd.DataFrame or AnalysisContext): Messages with 'Text', 'StrTime' and 'User'.
+    - keywords (list): The keywords to count, e.g. read with read_keywords.
+    - period (str): The time periods to count in, as a pandas period frequency ('D', 'W', 'M', 'Y').
+
+    Returns:
+    - pd.DataFrame: One row for each keyword, user and period with any occurrence, with
+      columns 'Keyword', 'User', 'Period' and 'Count'.
+    """
+    context = as_context(df)
+    matcher = KeywordMatcher(keywords)
+    message_ids, keyword_ids, counts = [], [], []
+    # Repeated texts ("哈哈", "好的") are matched once
+    found = {}
+    for message_id, text in enumerate(context.df['Text']):
+        if not isinstance(text, str):
+            continue
+        if text not in found:
+            found[text] = matcher.count(text)
+        for keyword_id, count in found[text].items():
+            message_ids.append(message_id)
+            keyword_ids.append(keyword_id)
+            counts.append(count)
+
+    message_ids = np.asarray(message_ids, dtype=np.int64)
+    periods = context.df['Month'] if period == 'M' else context.df['StrTime'].dt.to_period(period)
+    matches = pd.DataFrame({
+        'Keyword': pd.Categorical.from_codes(keyword_ids, categories=matcher.keywords),
+        'User': context.df['User'].iloc[message_ids].array,
+        'Period': periods.iloc[message_ids].array,
+        'Count': np.asarray(counts, dtype=np.int64),
+    })
+    return matches.groupby(['Keyword', 'User', 'Period'], observed=True, sort=True)['Count'].sum().reset_index()
@@ -2,29 +2,170 @@ import argparse
 from chatanalyzer.sample_analysis import analyze_sample_data
 from chatanalyzer.full_analysis import batch_request_api
 from chatanalyzer.result_analysis import analyze_saved_results
+from chatanalyzer.batch_analysis import run_batch
+from chatanalyzer.dead_letter import replay_dead_letters
+from chatanalyzer.sentiment_backends import DEFAULT_CONFIDENCE_THRESHOLD, SENTIMENT_BACKENDS
+from chatanalyzer.sentiment_model import DEFAULT_MODEL_PATH, train_sentiment_model
+from chatanalyzer.sharding import get_shard_path, merge_shard_outputs, parse_shard
+from chatanalyzer.telemetry import DEFAULT_INTERVAL
 
 def main():
     parser = argparse.ArgumentParser(description="Chat Analyzer Main Script")
     parser.add_argument(
         "mode",
         type=str,
-        choices=["sample", "request", "analyze"],
+        choices=["sample", "request", "analyze", "batch", "train", "replay", "merge"],
         help=(
             "Select 'sample' for small sample analysis, "
             "'request' for full dataset API requests, "
-            "or 'analyze' for analysis of saved results."
+            "'analyze' for analysis of saved results, "
+            "'batch' to process many conversations in parallel, "
+            "'train' to train the local sentiment model on saved API results, "
+            "'replay' to score again the messages the API failed on in 'request' mode, "
+            "or 'merge' to reassemble the outputs of a 'request' run split with --shard."
         )
     )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="In 'request' mode, score every message again instead of only those newer than the last run."
+    )
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        default=None,
+        help=(
+            "In 'request' and 'replay' modes, only process shard i of N, given as i/N (e.g. 3/16), "
+            "so that N processes or hosts sharing the working directory split the run; "
+            "'merge' then reassembles api_output.csv."
+        )
+    )
+    parser.add_argument(
+        "--source",
+        default="exports",
+        help="In 'batch' mode, a directory of chat exports or a manifest file listing them."
+    )
+    parser.add_argument(
+        "--output-dir",
+        default="batch_output",
+        help="In 'batch' mode, the directory for the per-conversation results and the summary index."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="In 'batch' mode, the number of worker processes (the number of CPUs by default)."
+    )
+    parser.add_argument(
+        "--no-request",
+        action="store_true",
+        help="In 'batch' mode, only preprocess the exports and summarize existing results, without API requests."
+    )
+    parser.add_argument(
+        "--qps",
+        type=float,
+        default=None,
+        help="In 'sample', 'request', 'batch' and 'replay' modes, the requests per second allowed by the API quota (no limit by default)."
+    )
+    parser.add_argument(
+        "--format",
+        choices=["csv", "arrow"],
+        default="csv",
+        help="Format of the API results written by 'request' and 'batch' and read by 'analyze': api_output.csv or api_output.arrow."
+    )
+    parser.add_argument(
+        "--export-csv",
+        action="store_true",
+        help="In 'request' mode with --format arrow, also export the results to api_output.csv at the end of the run."
+    )
+    parser.add_argument(
+        "--backend",
+        choices=SENTIMENT_BACKENDS,
+        default="baidu",
+        help=(
+            "Sentiment backend of 'sample', 'request', 'batch' and 'replay': the Baidu API, the offline lexicon backend, "
+            "the local model trained with 'train', or 'hybrid' to only ask the API when the model is unsure."
+        )
+    )
+    parser.add_argument(
+        "--model",
+        default=DEFAULT_MODEL_PATH,
+        help="The local sentiment model written by 'train' and used by the 'model' and 'hybrid' backends."
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_CONFIDENCE_THRESHOLD,
+        help="With --backend hybrid, the model confidence below which a message is sent to the API."
+    )
+    parser.add_argument(
+        "--credentials",
+        default=None,
+        help=(
+            "A JSON file listing several Baidu API keys ([{\"api_key\": ..., \"secret_key\": ..., \"qps\": ...}]) "
+            "to spread the requests over, each with its own token and --qps limit."
+        )
+    )
+    parser.add_argument(
+        "--metrics",
+        default=None,
+        help=(
+            "In 'request' mode, write request telemetry (latency histogram, status and retry counts, "
+            "cache hits, messages per second) to this Prometheus textfile, e.g. chatanalyzer.prom, "
+            "and a JSON summary next to it."
+        )
+    )
+    parser.add_argument(
+        "--metrics-interval",
+        type=float,
+        default=DEFAULT_INTERVAL,
+        help="Seconds between two writes of the --metrics files."
+    )
+    parser.add_argument(
+        "--keywords",
+        default=None,
+        help=(
+            "In 'analyze' mode, a text file with one keyword per line to count for each user and period "
+            "(saved to keyword_counts.csv) instead of asking for a word, for headless runs."
+        )
+    )
+    parser.add_argument(
+        "--period",
+        choices=["D", "W", "M", "Y"],
+        default="M",
+        help="Periods the --keywords are counted in: days, weeks, months or years."
+    )
     args = parser.parse_args()
+    results_file = f"api_output.{args.format}"
+    backend_options = {"model_path": args.model, "confidence_threshold": args.threshold,
+                       "credentials_path": args.credentials}
 
     if args.mode == 'sample':
-        analyze_sample_data('sample_data.csv', 'output_sample.csv')
+        analyze_sample_data('sample_data.csv', 'output_sample.csv', qps=args.qps,
+                            sentiment_cache_path='sentiment_cache.sqlite', backend=args.backend,
+                            backend_options=backend_options)
     elif args.mode == 'request':
-        batch_request_api('full_data.csv', 'api_output.csv')
+        batch_request_api('full_data.csv', results_file, watermark_path='watermarks.json', incremental=not args.full, qps=args.qps,
+                          sentiment_cache_path='sentiment_cache.sqlite',
+                          csv_export_path='api_output.csv' if args.export_csv else None, backend=args.backend,
+                          backend_options=backend_options, metrics_path=args.metrics, metrics_interval=args.metrics_interval,
+                          shard=args.shard)
     elif args.mode == 'analyze':
-        analyze_saved_results('api_output.csv', 'final_analysis.csv')
+        analyze_saved_results(results_file, 'final_analysis.csv', token_cache_path='token_cache.sqlite',
+                              keywords_path=args.keywords, keyword_period=args.period)
+    elif args.mode == 'batch':
+        run_batch(args.source, args.output_dir, workers=args.workers, request=not args.no_request, qps=args.qps,
+                  result_format=args.format, backend=args.backend, backend_options=backend_options)
+    elif args.mode == 'train':
+        train_sentiment_model(results_file, args.model)
+    elif args.mode == 'replay':
+        replay_file = get_shard_path(results_file, *args.shard) if args.shard else results_file
+        replay_dead_letters(replay_file, qps=args.qps, sentiment_cache_path='sentiment_cache.sqlite',
+                            backend=args.backend, backend_options=backend_options)
+    elif args.mode == 'merge':
+        merge_shard_outputs(results_file)
     else:
-        print("Invalid mode. Please choose 'sample', 'request', or 'analyze'.")
+        print("Invalid mode. Please choose 'sample', 'request', 'analyze', 'batch', 'train', 'replay', or 'merge'.")
 
 if __name__ == "__main__":
     main()
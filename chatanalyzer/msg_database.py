@@ -0,0 +1,96 @@
+import sqlite3
+import pandas as pd
+from chatanalyzer.data_preprocessing import datetime_to_epoch, preprocess_chat_data
+
+# Columns of the WeChat MSG table that preprocessing needs
+MSG_COLUMNS = ['localId', 'TalkerId', 'Type', 'SubType', 'IsSender', 'CreateTime', 'StrContent']
+
+def is_msg_database(file_path):
+    """
+    Check whether a file is an SQLite database rather than a CSV export.
+    """
+    with open(file_path, 'rb') as file:
+        return file.read(16) == b'SQLite format 3\x00'
+
+def iter_msg_database(db_path, talker_id=None, types=None, start_time=None, end_time=None,
+                      user_names=None, chunksize=100000, timezone=None, row_filter=None):
+    """
+    Load and preprocess chat messages straight from a WeChat MSG SQLite database, in chunks.
+
+    The filters are applied by SQLite, so only the selected conversation, message
+    types and time range are read, and rows are fetched from the cursor chunksize
+    at a time.
+
+    Parameters:
+    - db_path (str): Path to the (decrypted) MSG database.
+    - talker_id (int, optional): Only read messages of this conversation.
+    - types (list, optional): Only read messages of these WeChat 'Type' codes, e.g. [1] for text.
+    - start_time (str, optional): Only read messages at or after this time, e.g. '2024-01-01'.
+    - end_time (str, optional): Only read messages before this time.
+    - user_names (dict, optional): Name of the sender by 'IsSender' value, e.g. {1: 'R', 0: 'Matteo'}.
+      By default messages sent by the owner of the database are from 'Me' and the others
+      from the conversation's 'StrTalker' (or 'TalkerId' if the table has no such column).
+    - chunksize (int): Number of rows fetched per chunk.
+    - timezone (str, optional): Time zone of the message times and of start_time/end_time,
+      see data_preprocessing.epoch_to_datetime.
+    - row_filter (callable, optional): Applied to each chunk of rows before it is
+      preprocessed, see data_preprocessing.iter_preprocessed_data.
+
+    Yields:
+    - pd.DataFrame: Preprocessed chunk, in the same format as load_and_preprocess_data.
+    """
+    connection = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        table_columns = [row[1] for row in connection.execute("PRAGMA table_info(MSG)")]
+        talker_column = 'StrTalker' if 'StrTalker' in table_columns else 'TalkerId'
+        columns = MSG_COLUMNS + ([talker_column] if talker_column not in MSG_COLUMNS else [])
+
+        conditions = []
+        params = []
+        if talker_id is not None:
+            conditions.append("TalkerId = ?")
+            params.append(talker_id)
+        if types is not None:
+            types = list(types)
+            conditions.append(f"Type IN ({', '.join('?' * len(types))})")
+            params.extend(types)
+        if start_time is not None:
+            conditions.append("CreateTime >= ?")
+            params.append(datetime_to_epoch(start_time, timezone))
+        if end_time is not None:
+            conditions.append("CreateTime < ?")
+            params.append(datetime_to_epoch(end_time, timezone))
+
+        query = f"SELECT {', '.join(columns)} FROM MSG"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY CreateTime, localId"
+
+        for chunk in pd.read_sql_query(query, connection, params=params, chunksize=chunksize):
+            if chunk.empty:
+                continue
+            chunk = _to_export_columns(chunk, talker_column, user_names)
+            if row_filter is not None:
+                chunk = row_filter(chunk)
+                if chunk.empty:
+                    continue
+            yield preprocess_chat_data(chunk, timezone)
+    finally:
+        connection.close()
+
+def _to_export_columns(chunk, talker_column, user_names=None):
+    """
+    Give rows of the MSG table the columns of a CSV export expected by preprocess_chat_data.
+    """
+    names = {1: 'Me'}
+    names.update(user_names or {})
+    other_names = chunk[talker_column].astype(str)
+    remark = chunk['IsSender'].map(names)
+    return pd.DataFrame({
+        'StrContent': chunk['StrContent'],
+        'StrTime': None,
+        'Remark': remark.where(remark.notna(), other_names),
+        'localId': chunk['localId'].astype('Int64'),
+        'TalkerId': chunk['TalkerId'].astype('Int64'),
+        'CreateTime': chunk['CreateTime'].astype('Int64'),
+    })
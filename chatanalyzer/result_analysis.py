@@ -1,5 +1,8 @@
 import pandas as pd
-from chatanalyzer.data_preprocessing import append_csv_files
+from chatanalyzer.analysis_context import SILENCE_HOURS, AnalysisContext
+from chatanalyzer.cache import load_cached_results
+from chatanalyzer.data_preprocessing import merge_csv_files
+from chatanalyzer.keyword_matcher import KEYWORD_COUNTS_FILE, read_keywords
 from chatanalyzer.visualization import (
     assign_colors,
     plot_sentiment_distribution,
@@ -23,15 +26,21 @@ from chatanalyzer.sentiment_utils import (
     count_specific_word
 )
 
-# append_csv_files("api_output1.csv", "api_output2.csv", "api_output.csv")
+# merge_csv_files(["api_output1.csv", "api_output2.csv"], "api_output.csv")
 
-def analyze_saved_results(input_path, analysis_output_path):
+def analyze_saved_results(input_path, analysis_output_path, token_cache_path=None, keywords_path=None,
+                          keyword_output_path=KEYWORD_COUNTS_FILE, keyword_period='M'):
     """
     Analyze the results saved from API requests.
+    With a token_cache_path, the words of each message are cached there between runs.
+    With a keywords_path (one keyword per line), those keywords are counted for each user
+    and keyword_period and saved to keyword_output_path, instead of asking for a word.
     """
-    # Read input data and convert the time string to datetime format
-    df = pd.read_csv(input_path)
-    df['StrTime'] = pd.to_datetime(df['StrTime'])
+    # Read input data with the time string converted to datetime format, cached between runs,
+    # and derive the features of every message once. The context sorts the messages by
+    # time, as replayed failed messages are appended after newer ones
+    context = AnalysisContext(load_cached_results(input_path))
+    df = context.df
 
     # 1. Output the chat summary
     # Get usernames of all participants
@@ -46,30 +55,30 @@ def analyze_saved_results(input_path, analysis_output_path):
     print(f"{first_chat_row['User']} said: \"{first_chat_row['Text']}\"")
     print(f"Date of the last chat: {last_chat_row['StrTime'].date()}")
     print(f"{last_chat_row['User']} said: \"{last_chat_row['Text']}\"")
-    date_difference = get_date_difference(df)
-    active_days = get_active_days_count(df)
+    date_difference = get_date_difference(context)
+    active_days = get_active_days_count(context)
 
     # Calculate the average number of messages per day
     avg_daily_messages = df.shape[0] / active_days
     print(f"On average, {avg_daily_messages:.2f} messages are exchanged per day.")
 
     # Peak activity analysis (hourly and monthly)
-    peak_hour, peak_count, peak_percentage = get_peak_hour_activity(df)
-    peak_month, peak_month_count, peak_month_percentage = get_peak_month_activity(df)
-    max_silence, silence_breaker = get_longest_silence(df)
+    peak_hour, peak_count, peak_percentage = get_peak_hour_activity(context)
+    peak_month, peak_month_count, peak_month_percentage = get_peak_month_activity(context)
+    max_silence, silence_breaker = get_longest_silence(context)
     silence_break_text = df.loc[df['Time_Diff'].idxmax(), 'Text']
     print(f"The longest silence lasted {max_silence:.2f} hours, broken by {silence_breaker} who said: \"{silence_break_text}\".")
     print("————————————————————")
     
     # Compare message counts and word counts between users
     total_message_count = df.shape[0]
-    total_word_count = df['Text'].str.len().sum()
+    total_word_count = df['Text_Length'].sum()
     print(f"A total of {total_message_count} messages were exchanged, containing {total_word_count} words.")
 
     # Statistics of each user's messages
-    user_stats = df.groupby('User').agg(
+    user_stats = context.by_user.agg(
         Message_Count=('Text', 'count'),
-        Total_Words=('Text', lambda x: x.str.len().sum())
+        Total_Words=('Text_Length', 'sum')
     )
     user_stats['Message_Percentage'] = user_stats['Message_Count'] / total_message_count * 100
     user_stats['Word_Percentage'] = user_stats['Total_Words'] / total_word_count * 100
@@ -79,15 +88,15 @@ def analyze_saved_results(input_path, analysis_output_path):
         print(f"{user} sent {stats['Total_Words']} words, accounting for {stats['Word_Percentage']:.2f}% of total words.")
 
     # Who is more active, and whose message timing is more random
-    time_stats = df.groupby('User')['Time_Diff'].agg(['mean', 'var']).fillna(0)
+    time_stats = context.by_user['Time_Diff'].agg(['mean', 'var']).fillna(0)
     most_active_user = time_stats['mean'].idxmin()
     most_random_user = time_stats['var'].idxmax()
     print(f"{most_active_user} is more active with shorter average intervals.")
     print(f"{most_random_user}'s message timing is more random, making their messages unpredictable.")
 
     # Ice-breaker and vanisher analysis
-    silence_break_stats = calculate_silence_breakers(df)
-    num_freeze_periods = df[df['Time_Diff'] > 12].shape[0]
+    silence_break_stats = calculate_silence_breakers(context)
+    num_freeze_periods = (df['Time_Diff'] > SILENCE_HOURS).sum()
     print(f"There were {num_freeze_periods} instances of silence lasting over 12 hours.")
     if not silence_break_stats['breaker_ratio'].isna().all():
         print(f"{silence_break_stats['breaker_ratio'].idxmax()} is more likely to break the silence.")
@@ -97,46 +106,52 @@ def analyze_saved_results(input_path, analysis_output_path):
     print("————————————————————")
     
     # Sentiment analysis
-    sentiment_proportion = calculate_sentiment_proportion(df)
+    sentiment_proportion = calculate_sentiment_proportion(context)
     most_positive_user = sentiment_proportion['Positive_Proportion'].idxmax()
     most_negative_user = sentiment_proportion['Negative_Proportion'].idxmax()
     print(f"It seems that {most_positive_user} is more positive, while {most_negative_user} tends to complain more during chats.")
 
     # Emotional variability
-    variability = calculate_emotional_variability(df)
+    variability = calculate_emotional_variability(context)
     most_variable_user = variability['Positive_Prob'].idxmax()
     print(f"{most_variable_user} shows the most emotional variability.")
 
     # Word frequency analysis
-    word_counts = word_frequency_analysis(df)
+    word_counts = word_frequency_analysis(context, cache_path=token_cache_path)
     common_words = word_counts.most_common()
     print(f"The most frequently used word is \"{common_words[2][0]}\", appearing {common_words[2][1]} times.")
     print("Other commonly used words include:")
     for word, count in common_words[3:9]:
         print(f"\"{word}\", appearing {count} times.")
 
-    # Analysis of the usage of "哈" or "ha"
-    ha_counts = df['Text'].str.count('哈').sum()
+    # Analysis of the usage of "哈" or "ha", looked up in the index of the tokens cut above
+    ha_occurrences = context.count_occurrences('哈')
+    ha_counts = ha_occurrences.sum()
     avg_ha_per_day = ha_counts / active_days
     print(f"A total of {ha_counts} instances of \"哈\" were exchanged, averaging {avg_ha_per_day:.2f} per day.")
-    ha_counts_per_user = df.groupby('User')['Text'].apply(lambda x: x.str.count('哈').sum())
+    ha_counts_per_user = context.token_index().frequency(ha_occurrences, 'User')
     for user, count in ha_counts_per_user.items():
         print(f"{user} said \"哈\" {count} times.")
 
-    # User input word count functionality
-    print("Try entering a word you want to count.")
-    count_specific_word(df)
+    # Count the keywords of the file given, or a word entered by the user
+    if keywords_path is not None:
+        keyword_counts = count_specific_word(context, keywords=read_keywords(keywords_path), period=keyword_period)
+        keyword_counts.to_csv(keyword_output_path, index=False, encoding='utf-8')
+        print(f"Keyword counts by user and period saved to {keyword_output_path}.")
+    else:
+        print("Try entering a word you want to count.")
+        count_specific_word(context)
 
     print("————————————————————")
     print("\nBelow is the detailed data source:\n")
 
     # Visualization section (unchanged)
-    user_colors = assign_colors(df)
-    plot_sentiment_distribution(df, user_colors)
-    plot_monthly_message_distribution(df, user_colors)
-    plot_sentiment_trend(df, user_colors)
-    plot_active_hours_distribution(df, user_colors)
-    plot_sentiment_volatility(df, user_colors)
+    user_colors = assign_colors(context)
+    plot_sentiment_distribution(context, user_colors)
+    plot_monthly_message_distribution(context, user_colors)
+    plot_sentiment_trend(context, user_colors)
+    plot_active_hours_distribution(context, user_colors)
+    plot_sentiment_volatility(context, user_colors)
 
     generate_word_cloud(word_counts, output_path="word_cloud.png", colormap="viridis")
 
@@ -0,0 +1,179 @@
+import json
+import os
+import queue
+import threading
+import pyarrow as pa
+
+# Extensions of result files written as Arrow IPC streams rather than CSV
+ARROW_EXTENSIONS = ('.arrow', '.arrows')
+
+# Arrow types of the result columns. Probabilities stay float64, so that exporting
+# to CSV gives the same text as writing the results to CSV directly
+RESULT_FIELDS = pa.schema([
+    ("Text", pa.string()),
+    ("StrTime", pa.timestamp("ns")),
+    ("User", pa.string()),
+    ("MessageType", pa.string()),
+    ("Sentiment", pa.int8()),
+    ("Confidence", pa.float64()),
+    ("Positive_Prob", pa.float64()),
+    ("Negative_Prob", pa.float64()),
+])
+
+def is_arrow_results(file_path):
+    """
+    Check whether a result file is written in the Arrow format, by its extension.
+    """
+    return file_path.lower().endswith(ARROW_EXTENSIONS)
+
+def get_backend_record_path(output_path):
+    """
+    Return the file naming the backends that scored a result file, e.g. api_output.csv.backends.json.
+    """
+    return f"{output_path}.backends.json"
+
+def read_result_backends(output_path):
+    """
+    Return the sorted names of the backends that scored a result file ('baidu',
+    'lexicon', 'model', 'hybrid'), or None for results written without a record.
+    """
+    record_path = get_backend_record_path(output_path)
+    if not os.path.exists(record_path):
+        return None
+    with open(record_path, encoding="utf-8") as file:
+        return json.load(file)["backends"]
+
+def write_result_backends(output_path, backends):
+    """
+    Replace the record of the backends that scored a result file, atomically.
+    """
+    record_path = get_backend_record_path(output_path)
+    temp_path = f"{record_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as file:
+        json.dump({"backends": sorted(set(backends))}, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, record_path)
+
+def record_result_backend(output_path, backend, append=False):
+    """
+    Record that a backend scored the results of a file, adding it to the backends of
+    the results already there when append is True.
+
+    Results appended to a file written without a record leave it without one, as the
+    backend of its earlier results is unknown.
+    """
+    backends = {backend}
+    if append and os.path.exists(output_path):
+        earlier = read_result_backends(output_path)
+        if earlier is None:
+            return
+        backends.update(earlier)
+    write_result_backends(output_path, backends)
+
+class ResultWriter:
+    """
+    Write batches of sentiment results to a file from a background thread,
+    so that requests for the next batch are sent while the previous one is written.
+
+    A path ending in .arrow is written as an Arrow IPC stream: the schema, then one
+    record batch per write, so results are appended without rewriting the file and
+    read back without parsing text. Other paths are written as CSV.
+
+    Parameters:
+    - output_path (str): The result file.
+    - append (bool): Add to an existing file instead of replacing it.
+    - max_pending (int): Batches queued before write() waits for the thread.
+    - backend (str): Name of the backend that scored the results, recorded next to the
+      file with the first batch written (see record_result_backend).
+    """
+    def __init__(self, output_path, append=False, max_pending=4, backend=None):
+        self.output_path = output_path
+        self.backend = backend
+        self.arrow = is_arrow_results(output_path)
+        self.needs_header = not (append and os.path.exists(output_path))
+        self.error = None
+        self.queue = queue.Queue(max_pending)
+        self.thread = threading.Thread(target=self._run, name="ResultWriter", daemon=True)
+        self.thread.start()
+
+    def write(self, df, on_written=None):
+        """
+        Queue a DataFrame of results, or None for a batch without results. Once it is
+        durably written, on_written is called from the writer thread with the size of the file.
+        """
+        if self.error is not None:
+            raise self.error
+        self.queue.put((df, on_written))
+
+    def close(self):
+        """
+        Wait for the queued results to be written, raising the error of a failed write.
+        """
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            if self.error is not None:
+                # Nothing more is written after a failure, as the file would have a gap
+                continue
+            df, on_written = item
+            try:
+                if df is not None:
+                    size = self._write(df)
+                else:
+                    size = os.path.getsize(self.output_path) if os.path.exists(self.output_path) else 0
+                if on_written is not None:
+                    on_written(size)
+            except Exception as error:
+                self.error = error
+
+    def _write(self, df):
+        if self.backend is not None:
+            # Recorded before the results, so no result is ever on disk without its backend
+            record_result_backend(self.output_path, self.backend, append=not self.needs_header)
+            self.backend = None
+        mode = 'wb' if self.needs_header else 'ab'
+        with open(self.output_path, mode) as file:
+            if self.arrow:
+                table = pa.Table.from_pandas(df, schema=RESULT_FIELDS, preserve_index=False)
+                if self.needs_header:
+                    file.write(RESULT_FIELDS.serialize())
+                for batch in table.to_batches():
+                    file.write(batch.serialize())
+            else:
+                df.to_csv(file, header=self.needs_header, index=False, encoding='utf-8')
+            # Make the batch durable before anyone records it as written
+            file.flush()
+            os.fsync(file.fileno())
+            size = file.tell()
+        self.needs_header = False
+        return size
+
+def export_results_csv(arrow_path, csv_path):
+    """
+    Convert results written in the Arrow format to CSV, one record batch at a time,
+    giving the same file as writing the results to CSV directly.
+
+    Returns:
+    - int: The number of results exported.
+    """
+    count = 0
+    with pa.memory_map(arrow_path) as source, open(csv_path, 'w', newline='', encoding='utf-8') as file:
+        for batch in pa.ipc.open_stream(source):
+            batch.to_pandas().to_csv(file, header=count == 0, index=False)
+            count += batch.num_rows
+    # The export is scored by the same backends
+    backends = read_result_backends(arrow_path)
+    if backends is not None:
+        write_result_backends(csv_path, backends)
+    elif os.path.exists(get_backend_record_path(csv_path)):
+        os.remove(get_backend_record_path(csv_path))
+    print(f"{count} results exported to {csv_path}")
+    return count
@@ -1,42 +1,52 @@
 import random
+import numpy as np
 import pandas as pd
 import requests
 from tqdm import tqdm
-from chatanalyzer.auth import BaiduAuth
-from chatanalyzer.data_preprocessing import load_and_preprocess_data
-from chatanalyzer.sentiment_utils import calculate_emotional_variability, get_peak_hour_activity, analyze_sentiment
+from chatanalyzer.cache import iter_cached_preprocessed_data
+from chatanalyzer.dead_letter import DEAD_LETTER_COLUMNS, get_dead_letter_path, write_dead_letters
+from chatanalyzer.result_writer import record_result_backend
+from chatanalyzer.sentiment_backends import create_sentiment_backend
+from chatanalyzer.sentiment_utils import calculate_emotional_variability, get_peak_hour_activity, is_failed
 
 
-def analyze_sample_data(file_path, output_path, sample_size=30):
+def analyze_sample_data(file_path, output_path, sample_size=30, chunksize=100000, timezone=None, qps=None,
+                        sentiment_cache_path=None, backend='baidu', backend_options=None):
     """
     Perform sentiment analysis on a sample of the data and generate summary.
-    """
-    # Load and preprocess data
-    df = load_and_preprocess_data(file_path)
-    df = df[df['MessageType'] == 'text']  # Only analyze text messages
 
-    total_records = len(df)
+    Messages the backend could not score are left out of the results and the summary,
+    and saved to a dead-letter file next to output_path (see get_dead_letter_path).
+    """
+    # Load and preprocess data chunk by chunk
+    chunks = iter_cached_preprocessed_data(file_path, chunksize, timezone=timezone)
 
     # Random sampling
     random_state = random.randint(1, 10000)
     print(f"Random State Used: {random_state}")
-    sampled_df = df.sample(sample_size, random_state=random_state)
-
-    # Get and check Baidu API access token
-    auth_client = BaiduAuth()
-    auth_client.load_access_token()
-    if not auth_client.is_token_valid():
-        auth_client.get_access_token()
-        auth_client.save_access_token()
+    sampled_df, total_records = sample_text_messages(chunks, sample_size, random_state)
 
-    access_token = auth_client.access_token
+    # Initialize the sentiment backend, getting and checking the Baidu API access token if needed
+    client = create_sentiment_backend(backend, qps=qps, retries=3, timeout=10, cache_path=sentiment_cache_path,
+                                      **(backend_options or {}))
     results = []
+    failed_messages = []
 
     # Perform sentiment analysis row by row
     for _, row in tqdm(sampled_df.iterrows(), total=sampled_df.shape[0], desc="Analyzing Sentiment"):
         content = row['StrContent']
         if content.strip():  # Skip empty text
-            sentiment_result = analyze_sentiment(access_token, content, retries=3, timeout=10)
+            sentiment_result = client.analyze(content)
+            if is_failed(sentiment_result):
+                # Not a neutral answer: keep it out of the statistics
+                failed_messages.append({
+                    "Text": content,
+                    "StrTime": row['StrTime'],
+                    "User": row['User'],
+                    "MessageType": row['MessageType'],
+                    "Error": sentiment_result['Error']
+                })
+                continue
             sentiment_data = {
                 "Text": content,
                 "StrTime": row['StrTime'],
@@ -61,6 +71,15 @@ def analyze_sample_data(file_path, output_path, sample_size=30):
                 "Negative_Prob": 0.0
             })
 
+    client.close()
+
+    # Save the messages that could not be scored, replacing those of an earlier sample
+    dead_letter_path = get_dead_letter_path(output_path)
+    write_dead_letters(dead_letter_path, pd.DataFrame(failed_messages, columns=DEAD_LETTER_COLUMNS))
+    if failed_messages:
+        print(f"{len(failed_messages)} of {len(sampled_df)} sampled messages could not be scored and were "
+              f"saved to {dead_letter_path}; they are left out of the results and the summary.")
+
     # Create a result DataFrame
     result_df = pd.DataFrame(results)
 
@@ -69,21 +88,53 @@ def analyze_sample_data(file_path, output_path, sample_size=30):
     print(result_df.info())
 
     # Save to CSV file
+    record_result_backend(output_path, client.name)
     result_df.to_csv(output_path, index=False)
     print(f"Analysis complete. Results saved to {output_path}")
 
     # Generate summary report
-    generate_summary_report(result_df, total_records, sample_size)
+    if result_df.empty:
+        print("No sampled message could be scored, no summary to generate.")
+        return
+    generate_summary_report(result_df, total_records, len(result_df))
+
+def sample_text_messages(chunks, sample_size, random_state=None):
+    """
+    Draw a uniform random sample of text messages from a stream of preprocessed chunks.
+
+    Every message gets a random key and the sample_size smallest keys are kept,
+    so at most one chunk plus the sample is held in memory.
+
+    Returns:
+    - tuple: (sampled DataFrame, total number of text messages).
+    """
+    rng = np.random.RandomState(random_state)
+    sampled_df = None
+    total_records = 0
+
+    for chunk in chunks:
+        chunk = chunk[chunk['MessageType'] == 'text']  # Only analyze text messages
+        total_records += len(chunk)
+        chunk = chunk.assign(_SampleKey=rng.random_sample(len(chunk)))
+        if sampled_df is not None:
+            chunk = pd.concat([sampled_df, chunk])
+        sampled_df = chunk.nsmallest(sample_size, '_SampleKey')
+
+    if sampled_df is None or len(sampled_df) < sample_size:
+        raise ValueError(f"Cannot sample {sample_size} messages out of {total_records} text messages.")
+    return sampled_df.drop(columns='_SampleKey'), total_records
 
 def generate_summary_report(df, total_records, sample_size):
     """
     Generate a textual summary of the analysis results.
     """
     unique_users = df['User'].nunique()
+    # Users of the categories that sent nothing are left out
     records_per_user = df['User'].value_counts()
-    avg_words_per_user = df.groupby('User')['Text'].apply(lambda x: x.str.len().mean())
+    records_per_user = records_per_user[records_per_user > 0]
+    avg_words_per_user = df.groupby('User', observed=True)['Text'].apply(lambda x: x.str.len().mean())
 
-    user_summary = df.groupby("User")[["Positive_Prob", "Negative_Prob"]].mean()
+    user_summary = df.groupby("User", observed=True)[["Positive_Prob", "Negative_Prob"]].mean()
 
     # Ensure users are output in order (e.g., 'User1', 'User2')
     user_1 = records_per_user.index[0]
@@ -0,0 +1,66 @@
+import pandas as pd
+import pyarrow as pa
+
+# Every label classify_message_type can return
+MESSAGE_TYPES = ['text', 'image', 'emoji', 'other', 'empty']
+MESSAGE_TYPE_DTYPE = pd.CategoricalDtype(MESSAGE_TYPES)
+
+# Compact dtypes of the analysis columns: users and message types are repeated
+# strings, sentiment is 0/1/2 (nullable, as failed requests may leave it empty)
+# and float32 is precise enough for the API's probabilities
+COLUMN_DTYPES = {
+    'User': 'category',
+    'MessageType': MESSAGE_TYPE_DTYPE,
+    'Sentiment': 'Int8',
+    'Confidence': 'float32',
+    'Positive_Prob': 'float32',
+    'Negative_Prob': 'float32',
+}
+
+# Columns of the saved sentiment results, in file order
+RESULT_COLUMNS = ['Text', 'StrTime', 'User', 'MessageType', 'Sentiment', 'Confidence', 'Positive_Prob', 'Negative_Prob']
+
+def apply_schema(df):
+    """
+    Convert the analysis columns present in a DataFrame to their compact dtypes.
+
+    Parameters:
+    - df (pd.DataFrame): Preprocessed chat data or sentiment results.
+
+    Returns:
+    - pd.DataFrame: The same data with categorical users and message types, Int8
+      sentiment and float32 probabilities.
+    """
+    dtypes = {column: dtype for column, dtype in COLUMN_DTYPES.items() if column in df.columns}
+    return df.astype(dtypes)
+
+def read_results_csv(file_path):
+    """
+    Read saved sentiment results from CSV directly into their compact dtypes.
+
+    Parameters:
+    - file_path (str): Path to a CSV file written by the 'sample' or 'request' mode.
+
+    Returns:
+    - pd.DataFrame: Sentiment results with 'StrTime' parsed to datetime.
+    """
+    columns = pd.read_csv(file_path, nrows=0).columns
+    dtype = {column: COLUMN_DTYPES[column] for column in columns if column in COLUMN_DTYPES}
+    df = pd.read_csv(file_path, dtype=dtype)
+    df['StrTime'] = pd.to_datetime(df['StrTime'], format='%Y-%m-%d %H:%M:%S')
+    return df
+
+def read_results_arrow(file_path):
+    """
+    Read sentiment results written as an Arrow IPC stream (see chatanalyzer.result_writer),
+    memory-mapped and without any text parsing.
+
+    Parameters:
+    - file_path (str): Path to an .arrow file written by the 'request' mode.
+
+    Returns:
+    - pd.DataFrame: Sentiment results in their compact dtypes.
+    """
+    with pa.memory_map(file_path) as source:
+        table = pa.ipc.open_stream(source).read_all()
+    return apply_schema(table.to_pandas())
@@ -0,0 +1,222 @@
+import re
+import numpy as np
+import pandas as pd
+from chatanalyzer.auth import BaiduAuth, load_credentials
+from chatanalyzer.sentiment_cache import SentimentCache
+from chatanalyzer.sentiment_client import (DEFAULT_CONCURRENCY, Credential, CredentialPool, SentimentBackend,
+                                          SentimentClient)
+from chatanalyzer.sentiment_model import DEFAULT_MODEL_PATH, DistilledSentimentBackend
+
+# Backends selectable with create_sentiment_backend
+SENTIMENT_BACKENDS = ['baidu', 'lexicon', 'model', 'hybrid']
+
+# Confidence of the local model below which the hybrid backend asks the API
+DEFAULT_CONFIDENCE_THRESHOLD = 0.8
+
+# Words and WeChat emoji codes carrying sentiment in casual chat
+POSITIVE_WORDS = [
+    '好', '好的', '好啊', '好呀', '好滴', '不错', '挺好', '很好', '太好了', '真好', '棒', '好棒', '厉害', '牛', '优秀',
+    '喜欢', '爱', '爱你', '想你', '开心', '高兴', '快乐', '幸福', '舒服', '满意', '温暖', '感动', '放心', '轻松',
+    '哈哈', '嘿嘿', '嘻嘻', '好玩', '有趣', '好笑', '可爱', '漂亮', '美', '帅', '好看', '好吃',
+    '谢谢', '感谢', '多谢', '辛苦了', '加油', '期待', '恭喜', '祝', '生日快乐', '晚安', '么么', '抱抱', '耶', '赞',
+    '[微笑]', '[呲牙]', '[愉快]', '[憨笑]', '[偷笑]', '[得意]', '[可爱]', '[色]', '[爱心]', '[强]', '[胜利]',
+    '[耶]', '[拥抱]', '[玫瑰]', '[亲亲]', '[庆祝]', '[鼓掌]', '[哇]', '[奸笑]', '[嘿哈]', '[机智]', '[好的]',
+]
+NEGATIVE_WORDS = [
+    '坏', '差', '糟糕', '烂', '垃圾', '讨厌', '烦', '好烦', '烦死了', '累', '好累', '困', '难过', '伤心', '难受',
+    '痛苦', '郁闷', '失望', '生气', '气死', '崩溃', '无语', '无聊', '害怕', '担心', '焦虑', '紧张', '后悔', '委屈',
+    '哭', '呜呜', '惨', '可怜', '疼', '痛', '病', '恶心', '吵架', '分手', '滚', '闭嘴', '算了', '呵呵',
+    '对不起', '抱歉', '不好意思', '遗憾', '可惜', '麻烦', '倒霉', '丢人', '尴尬', '孤独', '寂寞', '想哭', '完了',
+    '[哭]', '[流泪]', '[大哭]', '[难过]', '[发怒]', '[撇嘴]', '[委屈]', '[抓狂]', '[吐]', '[衰]', '[快哭了]',
+    '[尴尬]', '[汗]', '[叹气]', '[心碎]', '[弱]', '[生病]', '[捂脸]', '[裂开]', '[苦涩]', '[白眼]', '[鄙视]',
+]
+# A negation turns the sentiment word that follows it neutral or around: '不好' is negative
+NEGATIONS = ['不', '不太', '不是很', '不怎么', '没', '没有', '没那么', '别', '不要', '不会']
+
+# Share of the probability above or below 0.5 within which a text is neutral
+NEUTRAL_MARGIN = 0.1
+
+def _alternation(words):
+    # Longest words first, so that '太好了' matches before '好'
+    return "|".join(re.escape(word) for word in sorted(set(words), key=len, reverse=True))
+
+class LexiconSentimentBackend(SentimentBackend):
+    """
+    A local sentiment backend scoring texts by the sentiment words they contain, without network access.
+
+    Each text's positive and negative words are counted with vectorized regular
+    expressions over the whole batch (negated words count for the other side, or
+    not at all when a negative word is negated). The probabilities are then
+    smoothed as (positive + 1) / (positive + negative + 2).
+
+    Parameters:
+    - positive_words, negative_words (list): The lexicon, POSITIVE_WORDS and NEGATIVE_WORDS by default.
+    - negations (list): Words reversing the sentiment word that follows.
+    """
+    name = "lexicon"
+
+    def __init__(self, positive_words=None, negative_words=None, negations=None):
+        positive = _alternation(POSITIVE_WORDS if positive_words is None else positive_words)
+        negative = _alternation(NEGATIVE_WORDS if negative_words is None else negative_words)
+        negation = _alternation(NEGATIONS if negations is None else negations)
+        self.negated_positive_pattern = f"(?:{negation})(?:{positive})"
+        self.negated_negative_pattern = f"(?:{negation})(?:{negative})"
+        self.positive_pattern = positive
+        self.negative_pattern = negative
+
+    def score(self, texts):
+        """
+        Score texts in a vectorized way.
+
+        Returns:
+        - pd.DataFrame: 'Sentiment', 'Confidence', 'Positive_Prob' and 'Negative_Prob'
+          of each text, in the order of texts.
+        """
+        texts = pd.Series(texts, dtype="string[pyarrow]").fillna("")
+        # Repeated texts are only scored once
+        codes, unique_texts = pd.factorize(texts)
+        unique_texts = pd.Series(unique_texts, dtype="string[pyarrow]")
+
+        negated_positive = unique_texts.str.count(self.negated_positive_pattern).to_numpy()
+        remaining = unique_texts.str.replace(self.negated_positive_pattern, " ", regex=True)
+        remaining = remaining.str.replace(self.negated_negative_pattern, " ", regex=True)
+        negative_count = remaining.str.count(self.negative_pattern).to_numpy() + negated_positive
+        # Negative words are removed first, so that '烦死了' does not also count a positive word
+        remaining = remaining.str.replace(self.negative_pattern, " ", regex=True)
+        positive_count = remaining.str.count(self.positive_pattern).to_numpy()
+
+        positive_prob = (positive_count + 1) / (positive_count + negative_count + 2)
+        sentiment = np.where(positive_prob > 0.5 + NEUTRAL_MARGIN, 2,
+                             np.where(positive_prob < 0.5 - NEUTRAL_MARGIN, 0, 1))
+        return pd.DataFrame({
+            "Sentiment": sentiment[codes],
+            "Confidence": np.abs(2 * positive_prob - 1)[codes],
+            "Positive_Prob": positive_prob[codes],
+            "Negative_Prob": (1 - positive_prob)[codes],
+        })
+
+    def analyze_many(self, texts):
+        scores = self.score(texts)
+        results = scores.to_dict("records")
+        return [result if text.strip() else None for text, result in zip(texts, results)]
+
+class HybridSentimentBackend(SentimentBackend):
+    """
+    Score every text with a local backend and only send the uncertain ones to a remote backend.
+
+    Parameters:
+    - local (SentimentBackend): A backend with a vectorized score(texts) method, such as DistilledSentimentBackend.
+    - remote (SentimentBackend): The backend asked when the local confidence is below threshold, usually the API client.
+    - threshold (float): The local confidence from which a result is kept.
+    """
+    name = "hybrid"
+
+    def __init__(self, local, remote, threshold=DEFAULT_CONFIDENCE_THRESHOLD):
+        self.local = local
+        self.remote = remote
+        self.threshold = threshold
+        self.local_count = 0
+        self.remote_count = 0
+
+    def close(self):
+        self.local.close()
+        self.remote.close()
+
+    def analyze_many(self, texts):
+        scores = self.local.score(texts)
+        results = scores.to_dict("records")
+        uncertain = [i for i, (text, confidence) in enumerate(zip(texts, scores['Confidence']))
+                     if text.strip() and confidence < self.threshold]
+        if uncertain:
+            for i, result in zip(uncertain, self.remote.analyze_many([texts[i] for i in uncertain])):
+                results[i] = result
+        self.remote_count += len(uncertain)
+        self.local_count += sum(bool(text.strip()) for text in texts) - len(uncertain)
+        return [result if text.strip() else None for text, result in zip(texts, results)]
+
+    def print_statistics(self):
+        """
+        Print the share of messages sent to the remote backend, then its own statistics.
+        """
+        total = self.local_count + self.remote_count
+        if total:
+            print(f"Hybrid scoring: {self.local_count} messages scored locally, {self.remote_count} sent to "
+                  f"{self.remote.name} ({self.remote_count / total:.1%}, confidence below {self.threshold}).")
+        self.remote.print_statistics()
+
+def create_baidu_client(qps=None, concurrency=DEFAULT_CONCURRENCY, retries=3, timeout=10, cache_path=None,
+                        credentials_path=None, qps_share=1.0, telemetry=None):
+    """
+    Create a client of the Baidu API, authenticating with the saved or a new access token.
+    The token is refreshed in the background before it expires, through the token file
+    shared with other processes.
+
+    With a credentials_path (see chatanalyzer.auth.load_credentials), requests are spread
+    over a pool of its API keys, each limited to its own qps or else to qps. Keys that
+    cannot be authenticated are left out. When several processes use the same keys,
+    each key's own qps is scaled by qps_share, the share of it for this process.
+    """
+    if credentials_path is None:
+        auth_clients = [(BaiduAuth(), qps)]
+    else:
+        auth_clients = [(auth_client, key_qps * qps_share if key_qps else qps)
+                        for auth_client, key_qps in load_credentials(credentials_path)]
+
+    credentials = []
+    for auth_client, key_qps in auth_clients:
+        name = auth_client.api_key[:8] if auth_client.api_key else "default"
+        try:
+            auth_client.load_or_generate_access_token()
+        except ValueError as error:
+            if credentials_path is None:
+                raise
+            print(f"Leaving API key {name} out of the pool: {error}")
+            continue
+        auth_client.start_background_refresh()
+        credentials.append(Credential(auth=auth_client, qps=key_qps, name=name))
+    if not credentials:
+        raise ValueError(f"None of the API keys of {credentials_path} could be authenticated.")
+    if credentials_path is not None:
+        print(f"Spreading requests over {len(credentials)} API keys.")
+
+    cache = SentimentCache(cache_path) if cache_path is not None else None
+    return SentimentClient(concurrency=concurrency, retries=retries, timeout=timeout, cache=cache,
+                           credentials=CredentialPool(credentials), telemetry=telemetry)
+
+def create_sentiment_backend(name="baidu", qps=None, concurrency=DEFAULT_CONCURRENCY, retries=3, timeout=10,
+                             cache_path=None, model_path=DEFAULT_MODEL_PATH,
+                             confidence_threshold=DEFAULT_CONFIDENCE_THRESHOLD, credentials_path=None, qps_share=1.0,
+                             telemetry=None):
+    """
+    Create the sentiment backend of the given name.
+
+    Parameters:
+    - name (str): 'baidu' for the Baidu API, 'lexicon' for the offline lexicon backend,
+      'model' for the local model trained from earlier API results (see
+      chatanalyzer.sentiment_model), or 'hybrid' for that model, asking the API
+      when its confidence is below confidence_threshold.
+    - qps, concurrency, retries, timeout: Options of the Baidu client, see SentimentClient.
+    - cache_path (str): SentimentCache database of the Baidu client. Local backends
+      score faster than a lookup and never use it, so it only holds Baidu results.
+    - model_path (str): The trained model of the 'model' and 'hybrid' backends.
+    - confidence_threshold (float): Confidence of the model from which 'hybrid' keeps its result.
+    - credentials_path (str): A file of several API keys to spread the Baidu requests over,
+      see create_baidu_client; the saved access token is used otherwise.
+    - qps_share (float): The share of each key's own qps this process may use.
+    - telemetry (Telemetry): Where the Baidu client records its requests, see chatanalyzer.telemetry.
+
+    Returns:
+    - SentimentBackend: The backend, to be closed after use.
+    """
+    options = {"qps": qps, "concurrency": concurrency, "retries": retries, "timeout": timeout, "cache_path": cache_path,
+               "credentials_path": credentials_path, "qps_share": qps_share, "telemetry": telemetry}
+    if name == 'baidu':
+        return create_baidu_client(**options)
+    if name == 'lexicon':
+        return LexiconSentimentBackend()
+    if name == 'model':
+        return DistilledSentimentBackend(model_path)
+    if name == 'hybrid':
+        return HybridSentimentBackend(DistilledSentimentBackend(model_path), create_baidu_client(**options),
+                                      threshold=confidence_threshold)
+    raise ValueError(f"Unknown sentiment backend '{name}', choose one of {', '.join(SENTIMENT_BACKENDS)}.")
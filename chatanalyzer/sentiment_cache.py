@@ -0,0 +1,128 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+DEFAULT_MAX_ENTRIES = 1000000
+
+# Share of max_entries kept when the cache overflows, so that eviction does not run on every write
+EVICTION_TARGET = 0.9
+
+WHITESPACE = re.compile(r"\s+")
+
+def normalize_text(text):
+    """
+    Normalize a message so that trivially different spellings share a cache entry:
+    Unicode NFKC (full-width to half-width), surrounding whitespace stripped and inner runs collapsed.
+    """
+    return WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+def text_key(text):
+    """
+    Return the cache key of a message: the SHA-256 digest of its normalized text.
+    """
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).digest()
+
+class SentimentCache:
+    """
+    An on-disk cache of sentiment results keyed by message content, shared across
+    runs, conversations and processes.
+
+    Entries live in a SQLite database in WAL mode, so several processes can read
+    and write it at once. When it holds more than max_entries results, the least
+    recently used ones are evicted: the cap is on the number of entries, not on
+    the size of the file.
+    """
+    def __init__(self, db_path="sentiment_cache.sqlite", max_entries=DEFAULT_MAX_ENTRIES):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            # Set up the database in one write transaction, so that processes opening it together take turns
+            self.connection.execute("BEGIN IMMEDIATE")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS sentiment ("
+                "key BLOB PRIMARY KEY, sentiment INTEGER, confidence REAL, "
+                "positive_prob REAL, negative_prob REAL, last_used REAL)"
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS sentiment_last_used ON sentiment (last_used)")
+            # The number of entries, kept up to date by triggers so that writes never count the table
+            self.connection.execute("CREATE TABLE IF NOT EXISTS sentiment_count (id INTEGER PRIMARY KEY, entries INTEGER)")
+            if self.connection.execute("SELECT 1 FROM sentiment_count").fetchone() is None:
+                self.connection.execute("INSERT INTO sentiment_count SELECT 0, COUNT(*) FROM sentiment")
+            self.connection.execute(
+                "CREATE TRIGGER IF NOT EXISTS sentiment_inserted AFTER INSERT ON sentiment "
+                "BEGIN UPDATE sentiment_count SET entries = entries + 1; END"
+            )
+            self.connection.execute(
+                "CREATE TRIGGER IF NOT EXISTS sentiment_deleted AFTER DELETE ON sentiment "
+                "BEGIN UPDATE sentiment_count SET entries = entries - 1; END"
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def get_many(self, keys):
+        """
+        Look up cached results by key, marking the ones found as recently used.
+
+        Returns:
+        - dict: The result of each key found, in the format of SentimentClient.analyze.
+        """
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        with self.lock:
+            # Stay below SQLite's limit on the number of query parameters
+            for start in range(0, len(keys), 500):
+                part = keys[start:start + 500]
+                rows = self.connection.execute(
+                    "SELECT key, sentiment, confidence, positive_prob, negative_prob FROM sentiment "
+                    f"WHERE key IN ({', '.join('?' * len(part))})", part
+                )
+                for key, sentiment, confidence, positive_prob, negative_prob in rows:
+                    found[key] = {"Sentiment": sentiment, "Confidence": confidence,
+                                  "Positive_Prob": positive_prob, "Negative_Prob": negative_prob}
+            if found:
+                now = time.time()
+                with self.connection:
+                    self.connection.executemany("UPDATE sentiment SET last_used = ? WHERE key = ?",
+                                                [(now, key) for key in found])
+        return found
+
+    def put_many(self, results):
+        """
+        Store results given as a dict of key to result, evicting old entries if the cache is full.
+        """
+        if not results:
+            return
+        now = time.time()
+        rows = [(key, result["Sentiment"], result["Confidence"], result["Positive_Prob"], result["Negative_Prob"], now)
+                for key, result in results.items()]
+        with self.lock, self.connection:
+            # An upsert rather than INSERT OR REPLACE, whose deletions would not fire the trigger
+            self.connection.executemany(
+                "INSERT INTO sentiment VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET "
+                "sentiment = excluded.sentiment, confidence = excluded.confidence, positive_prob = excluded.positive_prob, "
+                "negative_prob = excluded.negative_prob, last_used = excluded.last_used", rows
+            )
+            count = self.connection.execute("SELECT entries FROM sentiment_count").fetchone()[0]
+            if count > self.max_entries:
+                self.connection.execute(
+                    "DELETE FROM sentiment WHERE key IN (SELECT key FROM sentiment ORDER BY last_used LIMIT ?)",
+                    (count - int(self.max_entries * EVICTION_TARGET),)
+                )
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute("SELECT entries FROM sentiment_count").fetchone()[0]
@@ -0,0 +1,537 @@
+import asyncio
+import collections
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from chatanalyzer.sentiment_cache import text_key
+from chatanalyzer.sentiment_utils import (BACKOFF_BASE, NEUTRAL_RESULT, SENTIMENT_URL, backoff_delay, failed_result,
+                                         is_failed)
+from chatanalyzer.telemetry import Telemetry
+
+# Requests in flight at once; the API's QPS quota is the real limit
+DEFAULT_CONCURRENCY = 16
+
+# Error codes the API answers with (status 200) when the QPS or daily quota is exceeded
+THROTTLED_ERROR_CODES = {4, 18}
+
+# Error codes of an invalid or expired access token
+TOKEN_ERROR_CODES = {110, 111}
+
+# Error codes after which a key is left out for the rest of the run: no permission,
+# failed authentication, or its daily or total quota used up
+EXHAUSTED_ERROR_CODES = {6, 14, 17, 19}
+
+# Error codes of a temporary failure of the API, retried after a backoff:
+# unknown error, service unavailable, internal error
+TRANSIENT_ERROR_CODES = {1, 2, 282000}
+
+# Outcomes of a request counting against the health of the API in the circuit breaker
+BREAKER_FAILURES = {"network_error", "server_error", "api_error"}
+
+# Seconds a throttled key is left out of its credential pool
+THROTTLE_COOLDOWN = 1.0
+
+class TokenBucket:
+    """
+    A thread-safe token-bucket rate limiter.
+
+    Tokens are added at `rate` per second up to `capacity`; acquire() takes one,
+    sleeping until it is available. With the default capacity of 1, calls are
+    spaced exactly 1/rate seconds apart.
+    """
+    def __init__(self, rate, capacity=1):
+        if rate <= 0:
+            raise ValueError("The rate of a token bucket must be positive.")
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Take a token, waiting for it if the bucket is empty.
+        """
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    def reserve(self):
+        """
+        Take a token without waiting, and return the seconds to wait before using it.
+        """
+        with self.lock:
+            self._refill()
+            # Reserve the token now and wait outside the lock, so that callers are served in turn
+            self.tokens -= 1
+            return -self.tokens / self.rate if self.tokens < 0 else 0
+
+    def delay(self):
+        """
+        Return the seconds before a token would be available, without taking it.
+        """
+        with self.lock:
+            self._refill()
+            return (1 - self.tokens) / self.rate if self.tokens < 1 else 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+class CircuitBreaker:
+    """
+    Pause all requests while the API is failing, instead of spending the quota and
+    filling the results with failures during an outage.
+
+    The breaker opens when at least failure_rate of the last `window` requests (and
+    at least min_requests of them) failed. Requests then wait `pause` seconds, after
+    which a single probe request is let through: the breaker closes if it succeeds,
+    and opens again for twice as long (up to max_pause) if it fails.
+    """
+    def __init__(self, window=50, min_requests=20, failure_rate=0.5, pause=30, max_pause=300):
+        self.outcomes = collections.deque(maxlen=window)
+        self.min_requests = min_requests
+        self.failure_rate = failure_rate
+        self.pause = pause
+        self.max_pause = max_pause
+        self.current_pause = pause
+        # Monotonic time the pause ends, and whether the breaker is waiting for a probe to close
+        self.open_until = 0
+        self.half_open = False
+        self.probing = False
+        self.opened_count = 0
+        self.condition = threading.Condition()
+
+    def wait(self):
+        """
+        Wait until a request may be sent: at once while closed, after the pause while open,
+        and one request at a time while probing whether the API has recovered.
+        Returns True when the request is that probe.
+        """
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                if now < self.open_until:
+                    self.condition.wait(self.open_until - now)
+                elif self.half_open and self.probing:
+                    self.condition.wait()
+                else:
+                    if self.half_open:
+                        self.probing = True
+                    return self.half_open
+
+    def record(self, success, probe=False):
+        """
+        Record the outcome of a request: True for a success, False for a failure of the
+        API, None for an outcome saying nothing of its health. While the breaker is open,
+        only the outcome of the probe counts, not those of requests sent before it opened.
+        Returns True when the breaker opened.
+        """
+        with self.condition:
+            if self.half_open:
+                if not probe:
+                    return False
+                if success is None:
+                    self.probing = False
+                elif success:
+                    self.half_open = self.probing = False
+                    self.current_pause = self.pause
+                    self.outcomes.clear()
+                    print("The sentiment API recovered, resuming requests.")
+                else:
+                    self.current_pause = min(self.current_pause * 2, self.max_pause)
+                    self._open()
+                self.condition.notify_all()
+                return success is False
+            if success is None:
+                return False
+            self.outcomes.append(success)
+            failures = self.outcomes.count(False)
+            if len(self.outcomes) >= self.min_requests and failures >= self.failure_rate * len(self.outcomes):
+                print(f"{failures} of the last {len(self.outcomes)} requests to the sentiment API failed, "
+                      f"pausing requests for {self.current_pause:g} seconds.")
+                self._open()
+                return True
+            return False
+
+    def _open(self):
+        self.open_until = time.monotonic() + self.current_pause
+        self.half_open = True
+        self.probing = False
+        self.opened_count += 1
+
+class Credential:
+    """
+    One API identity of a CredentialPool.
+
+    Parameters:
+    - access_token (str): A fixed access token, when there is no auth.
+    - auth (BaiduAuth): The source of the access token, refreshed when the API rejects it.
+    - qps (float): Requests per second allowed for this key, or None for no limit.
+    - name (str): How the key is called in messages.
+    """
+    def __init__(self, access_token=None, auth=None, qps=None, name="default"):
+        self.access_token = access_token
+        self.auth = auth
+        self.limiter = TokenBucket(qps) if qps else None
+        self.name = name
+        # Monotonic time the key is usable again after being throttled
+        self.available_at = 0
+        # Why the key was taken out of the pool, None while usable
+        self.disabled = None
+        self.requests = 0
+        self.throttled_count = 0
+
+    @property
+    def token(self):
+        return self.auth.access_token if self.auth is not None else self.access_token
+
+class CredentialPool:
+    """
+    Spread requests over several API keys, each with its own access token and rate limit,
+    so that throughput adds up across the accounts' quotas.
+
+    Each request goes to the usable key that can send it soonest. A throttled key is
+    left out for `cooldown` seconds, and a revoked or exhausted key for the rest of the run.
+    """
+    def __init__(self, credentials, cooldown=THROTTLE_COOLDOWN):
+        if not credentials:
+            raise ValueError("A credential pool needs at least one credential.")
+        self.credentials = list(credentials)
+        self.cooldown = cooldown
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.credentials)
+
+    def acquire(self):
+        """
+        Return the credential to send the next request with, once its rate limit allows it.
+        Raises ValueError when every key has been taken out of the pool.
+        """
+        with self.lock:
+            usable = [credential for credential in self.credentials if credential.disabled is None]
+            if not usable:
+                reasons = "; ".join(f"{credential.name}: {credential.disabled}" for credential in self.credentials)
+                raise ValueError(f"No usable API key left ({reasons}).")
+            now = time.monotonic()
+
+            def ready_at(credential):
+                delay = credential.limiter.delay() if credential.limiter is not None else 0
+                return max(credential.available_at, now + delay), credential.requests
+
+            credential = min(usable, key=ready_at)
+            credential.requests += 1
+            wait = credential.available_at - now
+            if credential.limiter is not None:
+                wait = max(wait, credential.limiter.reserve())
+        if wait > 0:
+            time.sleep(wait)
+        return credential
+
+    def throttle(self, credential):
+        """
+        Leave a throttled key out of the pool for the cooldown.
+        """
+        with self.lock:
+            credential.throttled_count += 1
+            credential.available_at = time.monotonic() + self.cooldown
+
+    def disable(self, credential, reason):
+        """
+        Take a revoked or exhausted key out of the pool for the rest of the run.
+        """
+        with self.lock:
+            if credential.disabled is not None:
+                return
+            credential.disabled = reason
+        print(f"API key {credential.name} removed from the pool: {reason}")
+
+    def close(self):
+        """
+        Stop the background token refresh of every key.
+        """
+        for credential in self.credentials:
+            if credential.auth is not None:
+                credential.auth.stop_background_refresh()
+
+class SentimentBackend:
+    """
+    Base class of the sentiment backends used by the 'sample' and 'request' modes.
+
+    A backend scores texts with analyze_many, returning for each text a dict with
+    'Sentiment' (0 negative, 1 neutral, 2 positive), 'Confidence', 'Positive_Prob'
+    and 'Negative_Prob', as the Baidu API does, or None for a blank text.
+    """
+    name = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Release the resources held by the backend.
+        """
+
+    def analyze(self, text):
+        """
+        Analyze the sentiment of one text, or return None for a blank text.
+        """
+        return self.analyze_many([text])[0]
+
+    def analyze_many(self, texts):
+        """
+        Analyze the sentiment of many texts, returning the results in the order of texts.
+        """
+        raise NotImplementedError
+
+    def print_statistics(self):
+        """
+        Print what is worth knowing about the backend's work at the end of a run.
+        """
+
+class SentimentClient(SentimentBackend):
+    """
+    A client of the Baidu sentiment API, reusing keep-alive connections across requests.
+
+    Parameters:
+    - access_token (str): Baidu API access token.
+    - url (str): Endpoint of the sentiment API.
+    - qps (float): Requests allowed per second by the account's quota, or None for no limit.
+    - concurrency (int): Requests in flight at once in analyze_many, also the size of the connection pool.
+    - retries (int): Attempts per message on network errors and throttling.
+    - timeout (float): Timeout of each request in seconds.
+    - cache (SentimentCache): Cache checked before sending a request, or None; closed with the client.
+    - auth (BaiduAuth): When given, the token is read from it before each request and refreshed
+      when the API rejects it as invalid or expired; its background refresh is stopped with the client.
+    - credentials (CredentialPool): Several API keys to spread the requests over, instead of
+      access_token, auth and qps; closed with the client.
+    - telemetry (Telemetry): Where request latencies, outcomes, retries and cache hits are
+      recorded, a private one by default.
+    - backoff (float): Base of the exponential backoff between retries, in seconds.
+    - breaker (CircuitBreaker): Pauses the requests while the API is failing, a default one if None.
+    """
+    name = "baidu"
+
+    def __init__(self, access_token=None, url=SENTIMENT_URL, qps=None, concurrency=DEFAULT_CONCURRENCY, retries=3,
+                 timeout=10, cache=None, auth=None, credentials=None, telemetry=None, backoff=BACKOFF_BASE,
+                 breaker=None):
+        if credentials is None:
+            credentials = CredentialPool([Credential(access_token, auth=auth, qps=qps)])
+        self.credentials = credentials
+        self.url = url
+        self.concurrency = concurrency
+        self.retries = retries
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.executor = None
+        self.cache = cache
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.throttled_count = 0
+        self.failed_count = 0
+        self.telemetry = telemetry if telemetry is not None else Telemetry()
+        self.backoff = backoff
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.lock = threading.Lock()
+
+    def close(self):
+        """
+        Close the pooled connections, the request threads and the cache.
+        """
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        self.session.close()
+        if self.cache is not None:
+            self.cache.close()
+        self.credentials.close()
+
+    def cache_hit_rate(self):
+        """
+        Return the share of non-blank texts answered without a request, or None before any text.
+        """
+        total = self.cache_hits + self.cache_misses
+        return self.cache_hits / total if total else None
+
+    def print_statistics(self):
+        """
+        Print the cache hit rate, the number of throttled and failed requests, and the use of each key of a pool.
+        """
+        if self.cache is not None and self.cache_hit_rate() is not None:
+            print(f"Sentiment cache: {self.cache_hits} hits, {self.cache_misses} requests sent "
+                  f"({self.cache_hit_rate():.1%} of messages answered without a request).")
+        if self.throttled_count:
+            print(f"{self.throttled_count} requests were throttled by the API, consider lowering qps.")
+        if self.failed_count:
+            print(f"{self.failed_count} messages could not be scored by the API.")
+        if self.breaker.opened_count:
+            print(f"Requests were paused {self.breaker.opened_count} times while the API was failing.")
+        if len(self.credentials) > 1:
+            for credential in self.credentials.credentials:
+                status = f", removed: {credential.disabled}" if credential.disabled is not None else ""
+                print(f"API key {credential.name}: {credential.requests} requests, "
+                      f"{credential.throttled_count} throttled{status}")
+
+    def _request(self, text):
+        """
+        Send one text to the API and return its result, or a failed result (see failed_result)
+        when it could not be scored.
+
+        Network errors, server errors and transient API errors are retried after an
+        exponential backoff with jitter, throttled requests on another key or after the
+        key's cooldown. Every attempt first waits for the circuit breaker to be closed,
+        and is recorded in the telemetry.
+        """
+        error = "no attempt made"
+        for attempt in range(self.retries):
+            if attempt:
+                self.telemetry.increment("chatanalyzer_api_retries_total")
+            probe = self.breaker.wait()
+            try:
+                credential = self.credentials.acquire()
+                access_token = credential.token
+            except BaseException:
+                # Give up the probe slot, or the other requests would wait for it forever
+                self.breaker.record(None, probe)
+                raise
+            started = time.perf_counter()
+            try:
+                response = self.session.post(self.url, params={"access_token": access_token},
+                                             json={"text": text}, timeout=self.timeout)
+            except requests.exceptions.RequestException as exception:
+                error = f"network error ({type(exception).__name__})"
+                self._record_attempt(credential, started, "network_error", "network_error", probe)
+                self._backoff(attempt)
+                continue
+            if response.status_code != 200:
+                error = f"HTTP status {response.status_code}"
+                if response.status_code == 429 or response.status_code >= 500:
+                    self._record_attempt(credential, started, response.status_code, "server_error", probe)
+                    self._backoff(attempt)
+                    continue
+                self._record_attempt(credential, started, response.status_code, "http_error", probe)
+                return failed_result(error)
+
+            try:
+                response_json = response.json()
+            except ValueError:
+                error = "invalid response"
+                self._record_attempt(credential, started, response.status_code, "server_error", probe)
+                self._backoff(attempt)
+                continue
+            error_code = response_json.get("error_code")
+            if error_code in THROTTLED_ERROR_CODES:
+                error = f"throttled (error {error_code})"
+                self._record_attempt(credential, started, response.status_code, "throttled", probe)
+                self.credentials.throttle(credential)
+                with self.lock:
+                    self.throttled_count += 1
+                continue
+            if error_code in TOKEN_ERROR_CODES and credential.auth is not None:
+                error = f"access token rejected (error {error_code})"
+                self._record_attempt(credential, started, response.status_code, "token_rejected", probe)
+                try:
+                    # Only the first thread to see the stale token gets a new one
+                    with self.lock:
+                        credential.auth.refresh_access_token(stale_token=access_token)
+                except (ValueError, requests.exceptions.RequestException) as exception:
+                    self.credentials.disable(credential, f"the access token could not be refreshed ({exception})")
+                continue
+            if error_code in EXHAUSTED_ERROR_CODES:
+                error = f"API key unusable (error {error_code})"
+                self._record_attempt(credential, started, response.status_code, "key_exhausted", probe)
+                self.credentials.disable(credential, response_json.get("error_msg", f"error {error_code}"))
+                continue
+            if error_code is not None:
+                error = f"API error {error_code}: {response_json.get('error_msg', '')}".strip()
+                self._record_attempt(credential, started, response.status_code, "api_error", probe)
+                if error_code in TRANSIENT_ERROR_CODES:
+                    self._backoff(attempt)
+                    continue
+                return failed_result(error)
+            self._record_attempt(credential, started, response.status_code, "ok", probe)
+            items = response_json.get("items", [])
+            if items:
+                return {
+                    "Sentiment": items[0].get("sentiment", 1),  # Default neutral sentiment
+                    "Confidence": items[0].get("confidence", 0.0),
+                    "Positive_Prob": items[0].get("positive_prob", 0.0),
+                    "Negative_Prob": items[0].get("negative_prob", 0.0),
+                }
+            return dict(NEUTRAL_RESULT)
+
+        return failed_result(error)
+
+    def _backoff(self, attempt):
+        # No need to wait after the last attempt
+        if attempt < self.retries - 1:
+            time.sleep(backoff_delay(attempt, self.backoff))
+
+    def _record_attempt(self, credential, started, status, outcome, probe):
+        self.telemetry.observe("chatanalyzer_api_request_duration_seconds", time.perf_counter() - started)
+        self.telemetry.increment("chatanalyzer_api_requests_total", status=str(status), outcome=outcome,
+                                 key=credential.name)
+        # Throttling and key problems say nothing of the API's health
+        success = True if outcome == "ok" else False if outcome in BREAKER_FAILURES else None
+        if self.breaker.record(success, probe):
+            self.telemetry.increment("chatanalyzer_circuit_breaker_opened_total")
+
+    def analyze_many(self, texts):
+        """
+        Analyze many texts concurrently, with at most `concurrency` requests in flight.
+
+        Texts found in the cache, and repeats of a text within texts, are answered without
+        a request. Each request runs in a thread of the client's pool so that the waits on
+        the network overlap; no event loop is involved, so this also works where one is
+        already running, as in Jupyter. Results are returned in the order of texts, None for
+        blank texts; texts the API could not score get a failed result (neutral, with the
+        reason in 'Error').
+        """
+        keys = [text_key(text) if text.strip() else None for text in texts]
+        results = self.cache.get_many([key for key in keys if key is not None]) if self.cache is not None else {}
+
+        # One request per distinct text missing from the cache
+        pending = {}
+        for text, key in zip(texts, keys):
+            if key is not None and key not in results and key not in pending:
+                pending[key] = text
+        self.cache_misses += len(pending)
+        self.cache_hits += sum(key is not None for key in keys) - len(pending)
+        self.telemetry.increment("chatanalyzer_cache_misses_total", len(pending))
+        self.telemetry.increment("chatanalyzer_cache_hits_total", sum(key is not None for key in keys) - len(pending))
+
+        if pending:
+            if len(pending) == 1:
+                # A single text, as in sample mode, needs no thread
+                responses = [self._request(text) for text in pending.values()]
+            else:
+                if self.executor is None:
+                    self.executor = ThreadPoolExecutor(max_workers=self.concurrency)
+                # The pool has `concurrency` threads, and map keeps the order of the texts
+                responses = list(self.executor.map(self._request, pending.values()))
+            responses = dict(zip(pending, responses))
+            answered = {key: response for key, response in responses.items() if not is_failed(response)}
+            self.failed_count += len(pending) - len(answered)
+            self.telemetry.increment("chatanalyzer_failed_messages_total", len(pending) - len(answered))
+            if self.cache is not None:
+                # Failed requests are not cached, so that they are tried again next time
+                self.cache.put_many(answered)
+            results.update(responses)
+
+        return [None if key is None else dict(results[key]) for key in keys]
+
+    async def analyze_many_async(self, texts):
+        """
+        Awaitable version of analyze_many, for callers running an event loop.
+        """
+        return await asyncio.get_running_loop().run_in_executor(None, self.analyze_many, texts)
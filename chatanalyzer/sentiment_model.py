@@ -0,0 +1,179 @@
+import os
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from chatanalyzer.cache import load_cached_results
+from chatanalyzer.result_writer import read_result_backends
+from chatanalyzer.sentiment_client import SentimentBackend
+
+DEFAULT_MODEL_PATH = "sentiment_model.joblib"
+
+# Share of the labelled messages held out to measure agreement with the API
+HOLDOUT_SHARE = 0.2
+
+# Confidence thresholds reported by train_sentiment_model, to choose the hybrid threshold from
+REPORTED_THRESHOLDS = [0.5, 0.6, 0.7, 0.8, 0.9, 0.95]
+
+def fit_sentiment_model(texts, labels):
+    """
+    Fit a TF-IDF + logistic regression classifier of the sentiment labels (0, 1, 2) of texts.
+
+    Character 1- to 3-grams are used rather than jieba words: chat messages are short,
+    full of slang and emoji codes, and characters need no segmentation.
+
+    Returns:
+    - tuple: (fitted TfidfVectorizer, fitted LogisticRegression).
+    """
+    vectorizer = TfidfVectorizer(analyzer="char_wb", ngram_range=(1, 3), sublinear_tf=True, max_features=200000)
+    features = vectorizer.fit_transform(texts)
+    classifier = LogisticRegression(max_iter=1000, C=4.0)
+    classifier.fit(features, labels)
+    return vectorizer, classifier
+
+def load_training_data(results_path):
+    """
+    Load the messages labelled by the API from saved results, one row per distinct text.
+
+    Blank texts, missing labels and the neutral placeholders of failed requests
+    (confidence and both probabilities 0) are left out.
+
+    Only results scored by the Baidu API are used: a file with results of the lexicon,
+    model or hybrid backends, as recorded next to it by the 'request' mode, raises
+    ValueError, as the model would learn its own (or the lexicon's) answers.
+
+    Returns:
+    - pd.DataFrame: 'Text' and 'Sentiment' columns.
+    """
+    backends = read_result_backends(results_path)
+    if backends is None:
+        print(f"{results_path} does not record the backend that scored it, assuming the Baidu API.")
+    elif backends != ['baidu']:
+        raise ValueError(f"{results_path} holds results of the {', '.join(backends)} backends, only results of "
+                         f"the Baidu API can be trained on. Run 'request --backend baidu' to label the messages.")
+    df = load_cached_results(results_path)
+    df = df[df['Text'].notna() & df['Sentiment'].notna()]
+    df = df[df['Text'].astype(str).str.strip() != '']
+    failed = (df['Confidence'] == 0) & (df['Positive_Prob'] == 0) & (df['Negative_Prob'] == 0)
+    df = df[~failed]
+    # The latest answer for a text wins, and repeats do not leak from the training to the holdout set
+    df = df.drop_duplicates('Text', keep='last')
+    return pd.DataFrame({'Text': df['Text'].astype(str).to_numpy(), 'Sentiment': df['Sentiment'].astype(int).to_numpy()})
+
+def report_agreement(labels, predictions, confidence, thresholds=REPORTED_THRESHOLDS):
+    """
+    Describe how the model agrees with the API labels, overall and in hybrid mode at each threshold.
+
+    In hybrid mode the messages below the threshold are sent to the API, so they agree by definition.
+
+    Returns:
+    - pd.DataFrame: For each threshold, the share of messages scored locally, the agreement
+      on those and the agreement of the hybrid results as a whole.
+    """
+    agree = predictions == labels
+    rows = []
+    for threshold in thresholds:
+        local = confidence >= threshold
+        rows.append({
+            'Threshold': threshold,
+            'Local_Share': local.mean(),
+            'API_Share': 1 - local.mean(),
+            'Local_Agreement': agree[local].mean() if local.any() else np.nan,
+            'Hybrid_Agreement': (agree | ~local).mean(),
+        })
+    return pd.DataFrame(rows)
+
+def train_sentiment_model(results_path, model_path=DEFAULT_MODEL_PATH, random_state=0):
+    """
+    Distill the API's sentiment labels into a local model. The results must have been
+    scored by the Baidu API alone, see load_training_data.
+
+    The model is fitted on all but a random HOLDOUT_SHARE of the labelled messages of
+    results_path, its agreement with the API labels is measured on the rest and printed,
+    then it is fitted again on all messages and saved to model_path.
+
+    Parameters:
+    - results_path (str): Results of the 'request' mode, CSV or Arrow.
+    - model_path (str): File the model is saved to, with joblib.
+    - random_state (int): Seed of the holdout split.
+
+    Returns:
+    - pd.DataFrame: The agreement report, see report_agreement.
+    """
+    data = load_training_data(results_path)
+    if data['Sentiment'].nunique() < 2:
+        raise ValueError(f"{results_path} needs messages of at least two sentiments to train a model.")
+
+    holdout = np.random.RandomState(random_state).random_sample(len(data)) < HOLDOUT_SHARE
+    train, test = data[~holdout], data[holdout]
+    report = None
+    if len(test) and train['Sentiment'].nunique() >= 2:
+        vectorizer, classifier = fit_sentiment_model(train['Text'], train['Sentiment'])
+        probabilities = classifier.predict_proba(vectorizer.transform(test['Text']))
+        predictions = classifier.classes_[probabilities.argmax(axis=1)]
+        labels = test['Sentiment'].to_numpy()
+        report = report_agreement(labels, predictions, probabilities.max(axis=1))
+        print(f"Agreement with the API on {len(test)} held-out messages: {(predictions == labels).mean():.1%}")
+        print(report.to_string(index=False, float_format=lambda value: f"{value:.3f}"))
+
+    vectorizer, classifier = fit_sentiment_model(data['Text'], data['Sentiment'])
+    model = {"vectorizer": vectorizer, "classifier": classifier, "trained_on": len(data),
+             "agreement": report.to_dict("records") if report is not None else None}
+    temp_path = f"{model_path}.{os.getpid()}.tmp"
+    joblib.dump(model, temp_path)
+    os.replace(temp_path, model_path)
+    print(f"Model trained on {len(data)} messages saved to {model_path}")
+    return report
+
+class DistilledSentimentBackend(SentimentBackend):
+    """
+    A local sentiment backend using a model trained by train_sentiment_model.
+
+    'Sentiment' is the most probable label and 'Confidence' its probability;
+    'Positive_Prob' counts half of the neutral probability, so that it and
+    'Negative_Prob' add up to 1 as in the API's results.
+
+    Models are pickled, so only load the ones you trained.
+
+    Parameters:
+    - model_path (str): The saved model.
+    """
+    name = "model"
+
+    def __init__(self, model_path=DEFAULT_MODEL_PATH):
+        if not os.path.exists(model_path):
+            raise ValueError(f"No sentiment model at {model_path}, train one with the 'train' mode first.")
+        model = joblib.load(model_path)
+        self.vectorizer = model["vectorizer"]
+        self.classifier = model["classifier"]
+
+    def score(self, texts):
+        """
+        Score texts in a vectorized way.
+
+        Returns:
+        - pd.DataFrame: 'Sentiment', 'Confidence', 'Positive_Prob' and 'Negative_Prob'
+          of each text, in the order of texts.
+        """
+        texts = pd.Series(texts, dtype="string[pyarrow]").fillna("")
+        # Repeated texts are only scored once
+        codes, unique_texts = pd.factorize(texts)
+        if not len(unique_texts):
+            return pd.DataFrame(columns=["Sentiment", "Confidence", "Positive_Prob", "Negative_Prob"])
+        probabilities = self.classifier.predict_proba(self.vectorizer.transform(np.asarray(unique_texts, dtype=object)))
+        by_label = {label: probabilities[:, i] for i, label in enumerate(self.classifier.classes_)}
+        zeros = np.zeros(len(unique_texts))
+        positive_prob = by_label.get(2, zeros) + by_label.get(1, zeros) / 2
+
+        return pd.DataFrame({
+            "Sentiment": self.classifier.classes_[probabilities.argmax(axis=1)][codes],
+            "Confidence": probabilities.max(axis=1)[codes],
+            "Positive_Prob": positive_prob[codes],
+            "Negative_Prob": (1 - positive_prob)[codes],
+        })
+
+    def analyze_many(self, texts):
+        scores = self.score(texts)
+        results = scores.to_dict("records")
+        return [result if text.strip() else None for text, result in zip(texts, results)]
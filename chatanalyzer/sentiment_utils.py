@@ -1,55 +1,71 @@
-import requests
-import jieba
+import random
 from collections import Counter
 from sklearn.feature_extraction.text import TfidfVectorizer, CountVectorizer
 from sklearn.decomposition import LatentDirichletAllocation
 import pandas as pd
+from chatanalyzer.analysis_context import SILENCE_HOURS, VANISH_HOURS, as_context
+from chatanalyzer.keyword_matcher import count_keywords
+from chatanalyzer.sentiment_cache import SentimentCache
 
-def analyze_sentiment(access_token, text, retries=3, timeout=10):
+SENTIMENT_URL = "https://aip.baidubce.com/rpc/2.0/nlp/v1/sentiment_classify"
+
+# Base and cap, in seconds, of the exponential backoff between retries of a failed request
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30
+
+NEUTRAL_RESULT = {"Sentiment": 1, "Confidence": 0.0, "Positive_Prob": 0.0, "Negative_Prob": 0.0}
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_MAX):
+    """
+    Return the seconds to wait after the given failed attempt (0 for the first):
+    exponential backoff with full jitter, so that clients failing together do not retry together.
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+def failed_result(reason):
+    """
+    Return the result of a text the API could not score: neutral, with the reason in 'Error'
+    so that it is not mistaken for a neutral answer.
+    """
+    return {**NEUTRAL_RESULT, "Error": reason}
+
+def is_failed(result):
+    """
+    Check whether a sentiment result is a failed one, see failed_result.
+    """
+    return result is not None and "Error" in result
+
+def analyze_sentiment(access_token, text, retries=3, timeout=10, url=SENTIMENT_URL, backoff=BACKOFF_BASE,
+                      cache_path=None):
     """
     Analyze sentiment using Baidu's API.
+
+    The text is sent by a SentimentClient, with its retries, throttling and error
+    handling; for many texts, reuse one client rather than calling this for each.
+    With a cache_path, the SentimentCache there is checked before any request is sent.
+    A text that could not be scored gets a failed result (see failed_result).
     """
-    if not text.strip():
-        return None
-
-    url = f"https://aip.baidubce.com/rpc/2.0/nlp/v1/sentiment_classify?access_token={access_token}"
-    headers = {"Content-Type": "application/json"}
-    payload = {"text": text}
-
-    for attempt in range(retries):
-        try:
-            response = requests.post(url, headers=headers, json=payload, timeout=timeout)
-            if response.status_code == 200:
-                response_json = response.json()
-                items = response_json.get("items", [])
-                if items:
-                    return {
-                        "Sentiment": items[0].get("sentiment", 1),  # Default neutral sentiment
-                        "Confidence": items[0].get("confidence", 0.0),
-                        "Positive_Prob": items[0].get("positive_prob", 0.0),
-                        "Negative_Prob": items[0].get("negative_prob", 0.0),
-                    }
-                else:
-                    return {"Sentiment": 1, "Confidence": 0.0, "Positive_Prob": 0.0, "Negative_Prob": 0.0}
-            else:
-                return {"Sentiment": 1, "Confidence": 0.0, "Positive_Prob": 0.0, "Negative_Prob": 0.0}
-
-        except requests.exceptions.RequestException:
-            continue
-
-    return {"Sentiment": 1, "Confidence": 0.0, "Positive_Prob": 0.0, "Negative_Prob": 0.0}
+    # Imported here, as the client depends on this module
+    from chatanalyzer.sentiment_client import SentimentClient
+
+    cache = SentimentCache(cache_path) if cache_path is not None else None
+    with SentimentClient(access_token, url=url, concurrency=1, retries=retries, timeout=timeout,
+                         backoff=backoff, cache=cache) as client:
+        return client.analyze(text)
 
 
 def calculate_emotional_variability(df):
     """
     Calculate emotional variability for each user by calculating the standard deviation of sentiment scores.
+    df is a DataFrame of results or an AnalysisContext, as for the other metric functions.
     """
+    context = as_context(df)
     # Ensure the data contains 'Positive_Prob' and 'Negative_Prob' columns
-    if 'Positive_Prob' not in df.columns or 'Negative_Prob' not in df.columns:
+    if 'Positive_Prob' not in context.df.columns or 'Negative_Prob' not in context.df.columns:
         raise ValueError("The DataFrame must contain 'Positive_Prob' and 'Negative_Prob' columns.")
 
     # Group by user and calculate the standard deviation of positive and negative sentiments
-    variability = df.groupby('User')[['Positive_Prob', 'Negative_Prob']].std()
+    variability = context.by_user[['Positive_Prob', 'Negative_Prob']].std()
 
     # Fill any missing values with 0 (e.g., if a user has only one record and cannot calculate std dev)
     variability = variability.fillna(0)
@@ -58,32 +74,40 @@ def calculate_emotional_variability(df):
 
 
 def calculate_sentiment_proportion(df):
-    sentiment_counts = df.groupby('User')['Sentiment'].value_counts().unstack(fill_value=0)
-    total_words = df.groupby('User')['Text'].apply(lambda x: x.str.len().count())
+    context = as_context(df)
+    sentiment_counts = context.by_user['Sentiment'].value_counts().unstack(fill_value=0)
+    total_words = context.by_user['Text'].count()
     sentiment_proportion = sentiment_counts.div(total_words, axis=0)
     sentiment_proportion.columns = ['Negative_Proportion', 'Neutral_Proportion', 'Positive_Proportion'][:len(sentiment_proportion.columns)]
     return sentiment_proportion
 
-def word_frequency_analysis(df):
-    all_text = ' '.join(df['Text'].dropna())
-    words = [word for word in jieba.lcut(all_text) if len(word.strip()) > 1]
-    word_counts = Counter(words)
+def word_frequency_analysis(df, cache_path=None, workers=None):
+    """
+    Count the words of two characters or more in the messages, each message cut into
+    words on its own, in parallel and through the token cache at cache_path if given
+    (see chatanalyzer.tokenization.tokenize_texts).
+    """
+    word_counts = Counter()
+    for tokens in as_context(df).tokens(cache_path, workers):
+        word_counts.update(word for word in tokens if len(word.strip()) > 1)
     return word_counts
 
 def calculate_silence_breakers(df):
     """
     Calculate who breaks silences and who vanishes, based on message time intervals.
     """
-    df['Time_Diff'] = df['StrTime'].diff().dt.total_seconds().div(3600).fillna(0)
-    df['Is_Breaker'] = df['Time_Diff'] > 12  # Threshold for silence breaker: 12 hours
-    df['Is_Vanisher'] = (df['Time_Diff'] > 1) & (~df['Is_Breaker'])  # Threshold for vanisher: 1 hour
+    context = as_context(df)
+    time_diff = context.df['Time_Diff']
+    is_breaker = time_diff > SILENCE_HOURS
+    is_vanisher = (time_diff > VANISH_HOURS) & ~is_breaker
 
-    breaker_counts = df[df['Is_Breaker']].groupby('User').size()
-    vanish_counts = df[df['Is_Vanisher']].groupby('User').size()
-    total_counts = df.groupby('User').size()
+    users = context.df['User']
+    breaker_counts = users[is_breaker].value_counts(sort=False)
+    vanish_counts = users[is_vanisher].value_counts(sort=False)
+    total_counts = context.message_counts
 
-    breaker_ratio = breaker_counts / total_counts
-    vanish_ratio = vanish_counts / total_counts
+    breaker_ratio = breaker_counts[breaker_counts > 0] / total_counts
+    vanish_ratio = vanish_counts[vanish_counts > 0] / total_counts
 
     return {'breaker_ratio': breaker_ratio, 'vanish_ratio': vanish_ratio}
 
@@ -91,7 +115,7 @@ def get_first_chat_date(df):
     """
     Output the date of the first chat.
     """
-    first_date = df['StrTime'].min().date()
+    first_date = as_context(df).df['StrTime'].iloc[0].date()
     print(f"Date of the first chat: {first_date}")
     return first_date
 
@@ -99,8 +123,9 @@ def get_date_difference(df):
     """
     Calculate the time difference between the first and last chat dates.
     """
-    first_date = df['StrTime'].min().date()
-    last_date = df['StrTime'].max().date()
+    times = as_context(df).df['StrTime']
+    first_date = times.iloc[0].date()
+    last_date = times.iloc[-1].date()
     difference = (last_date - first_date).days
     print(f"The time difference between the first and last chat dates is {difference} days.")
     return difference
@@ -109,10 +134,11 @@ def get_peak_hour_activity(df):
     """
     Output the hour of the day with the highest message frequency, the number of messages, and the percentage.
     """
-    df['Hour'] = df['StrTime'].dt.hour
-    peak_hour = df['Hour'].value_counts().idxmax()
-    peak_count = df['Hour'].value_counts().max()
-    total_messages = len(df)
+    context = as_context(df)
+    hour_counts = context.df['Hour'].value_counts()
+    peak_hour = hour_counts.idxmax()
+    peak_count = hour_counts.max()
+    total_messages = len(context)
     peak_percentage = (peak_count / total_messages) * 100
     print(f"The hour with the highest message frequency is {peak_hour}, with {peak_count} messages, accounting for {peak_percentage:.2f}%.")
     return peak_hour, peak_count, peak_percentage
@@ -121,10 +147,11 @@ def get_peak_month_activity(df):
     """
     Output the month with the highest message frequency, the number of messages, and the percentage.
     """
-    df['Month'] = df['StrTime'].dt.to_period('M')
-    peak_month = df['Month'].value_counts().idxmax()
-    peak_month_count = df['Month'].value_counts().max()
-    total_messages = len(df)
+    context = as_context(df)
+    month_counts = context.df['Month'].value_counts()
+    peak_month = month_counts.idxmax()
+    peak_month_count = month_counts.max()
+    total_messages = len(context)
     peak_month_percentage = (peak_month_count / total_messages) * 100
     print(f"The month with the highest message frequency is {peak_month}, with {peak_month_count} messages, accounting for {peak_month_percentage:.2f}%.")
     return peak_month, peak_month_count, peak_month_percentage
@@ -133,7 +160,7 @@ def get_active_days_count(df):
     """
     Calculate the number of days with messages.
     """
-    active_days = df['StrTime'].dt.date.nunique()
+    active_days = as_context(df).active_days
     print(f"There are {active_days} days with message records.")
     return active_days
 
@@ -141,18 +168,38 @@ def get_longest_silence(df):
     """
     Calculate the longest silence period and who broke the silence.
     """
-    df['Time_Diff'] = df['StrTime'].diff().dt.total_seconds().div(3600).fillna(0)
-    max_silence = df['Time_Diff'].max()
-    silence_breaker = df.loc[df['Time_Diff'].idxmax(), 'User']
+    context = as_context(df)
+    silence_index = context.df['Time_Diff'].idxmax()
+    max_silence = context.df.at[silence_index, 'Time_Diff']
+    silence_breaker = context.df.at[silence_index, 'User']
     return max_silence, silence_breaker
 
-def count_specific_word(df):
+def count_specific_word(df, keywords=None, period='M'):
     """
     Allow the user to input a word and count its total occurrence in the chat records.
-    """
+    For headless runs, a list of keywords can be given instead; they are counted in one
+    pass over the messages, for each user and period (see count_keywords).
+
+    Returns:
+    - pd.DataFrame: With keywords, the output of count_keywords; None otherwise.
+    """
+    context = as_context(df)
+    if keywords is not None:
+        keyword_counts = count_keywords(context, keywords, period)
+        per_user = keyword_counts.groupby(['Keyword', 'User'], observed=False)['Count'].sum().unstack(fill_value=0)
+        per_user.columns = per_user.columns.astype(object)
+        per_user['Total'] = per_user.sum(axis=1)
+        print(f"\nOccurrences of {len(per_user)} keywords by user:")
+        print(per_user.sort_values('Total', ascending=False, kind='stable'))
+        return keyword_counts
+
     word = input("Enter a word to count its frequency: ")
-    total_occurrences = df['Text'].str.count(word).sum()
-    occurrences_per_user = df.groupby('User')['Text'].apply(lambda x: x.str.count(word).sum())
+    if not word:
+        print("No word entered.")
+        return
+    occurrences = context.count_occurrences(word)
+    total_occurrences = occurrences.sum()
+    occurrences_per_user = context.token_index().frequency(occurrences, 'User')
     
     print(f"\nTotal occurrences of '{word}': {total_occurrences}")
     print(f"Occurrences of '{word}' by user:")
@@ -0,0 +1,134 @@
+import glob
+import os
+import re
+import numpy as np
+import pandas as pd
+from chatanalyzer.checkpoint import RequestCheckpoint
+from chatanalyzer.data_preprocessing import merge_csv_files
+from chatanalyzer.dead_letter import get_dead_letter_path
+from chatanalyzer.result_writer import get_backend_record_path, is_arrow_results, read_result_backends, write_result_backends
+
+# Columns hashed to pick the shard of a message when the export has no localId
+FALLBACK_SHARD_COLUMNS = ['StrTime', 'User', 'StrContent']
+
+def parse_shard(spec):
+    """
+    Parse a shard given as 'i/N', the i-th of N shards, counted from 1.
+
+    Returns:
+    - tuple: (i, N).
+    """
+    match = re.fullmatch(r"\s*(\d+)\s*/\s*(\d+)\s*", str(spec))
+    if not match:
+        raise ValueError(f"Invalid shard {spec!r}, expected 'i/N', e.g. 3/16.")
+    index, count = int(match.group(1)), int(match.group(2))
+    if not 1 <= index <= count:
+        raise ValueError(f"Invalid shard {spec!r}, i must be between 1 and N.")
+    return index, count
+
+def get_shard_path(file_path, index, count):
+    """
+    Return the file of one shard of a run, e.g. api_output.shard-03-of-16.csv for api_output.csv.
+    """
+    base, extension = os.path.splitext(file_path)
+    return f"{base}.shard-{index:0{len(str(count))}d}-of-{count}{extension}"
+
+def get_shard_run(shard, output_path, watermark_path=None, metrics_path=None, qps=None, backend_options=None):
+    """
+    Give one shard (i, N) of a 'request' run its own output, watermarks and metrics,
+    e.g. api_output.shard-03-of-16.csv for shard 3 of 16 of api_output.csv, and an
+    even share of the qps and of the keys' quotas.
+
+    Returns:
+    - tuple: The output_path, watermark_path, metrics_path, qps and backend_options of the shard.
+    """
+    index, count = shard
+    if is_arrow_results(output_path):
+        raise ValueError("Sharded runs write CSV results, use a .csv output.")
+    return (get_shard_path(output_path, index, count),
+            get_shard_path(watermark_path, index, count) if watermark_path is not None else None,
+            get_shard_path(metrics_path, index, count) if metrics_path is not None else None,
+            qps / count if qps else None,
+            {**(backend_options or {}), "qps_share": 1 / count})
+
+def filter_shard(df, index, count):
+    """
+    Keep the messages of df belonging to shard index of count.
+
+    Messages are assigned by hashing their localId (or their time, user and content
+    when the export has none) with pandas' fixed-key hash, so every process and host
+    splits a conversation the same way.
+    """
+    has_id = df['localId'].notna().to_numpy() if 'localId' in df.columns else np.zeros(len(df), dtype=bool)
+    hashes = np.empty(len(df), dtype=np.uint64)
+    if has_id.any():
+        hashes[has_id] = pd.util.hash_array(df['localId'][has_id].to_numpy(dtype=np.int64))
+    if not has_id.all():
+        hashes[~has_id] = pd.util.hash_pandas_object(df.loc[~has_id, FALLBACK_SHARD_COLUMNS].astype(str),
+                                                     index=False).to_numpy()
+    return df[hashes % count == index - 1]
+
+def find_shard_outputs(output_path):
+    """
+    Find the shard outputs of a sharded 'request' run of output_path.
+
+    Returns:
+    - list: The path of each shard, in order.
+
+    Raises ValueError when no shard was run, when the shards were run with different
+    counts, or when some are missing or were interrupted.
+    """
+    base, extension = os.path.splitext(output_path)
+    pattern = re.compile(re.escape(f"{base}.shard-") + r"(\d+)-of-(\d+)" + re.escape(extension) + "$")
+    found = {}
+    for path in glob.glob(f"{glob.escape(base)}.shard-*-of-*{glob.escape(extension)}"):
+        match = pattern.match(path)
+        if match:
+            found[(int(match.group(1)), int(match.group(2)))] = path
+    if not found:
+        raise ValueError(f"No shard outputs of {output_path} found, run 'request --shard i/N' first.")
+    counts = {count for _, count in found}
+    if len(counts) > 1:
+        raise ValueError(f"Shard outputs of {output_path} were written with different shard counts {sorted(counts)}, "
+                         f"remove the stale ones.")
+
+    count = counts.pop()
+    missing = [index for index in range(1, count + 1) if (index, count) not in found]
+    if missing:
+        raise ValueError(f"Shards {missing} of {count} have not been run for {output_path}.")
+    shard_paths = [found[(index, count)] for index in range(1, count + 1)]
+    interrupted = [path for path in shard_paths if os.path.exists(RequestCheckpoint(path).manifest_path)]
+    if interrupted:
+        raise ValueError(f"The runs of {interrupted} were interrupted, finish them before merging.")
+    return shard_paths
+
+def merge_shard_outputs(output_path, chunksize=100000):
+    """
+    Reassemble the outputs of a sharded 'request' run into output_path, ordered by time.
+
+    The shard outputs are left in place, so that later incremental runs of each shard
+    append to them and the merge can be run again. Failed messages stay in the
+    dead-letter file of their shard, to be replayed with 'replay --shard i/N' before merging again.
+
+    Returns:
+    - int: The number of results written to output_path.
+    """
+    if is_arrow_results(output_path):
+        raise ValueError("Sharded runs write CSV results, merge them into a .csv output.")
+    shard_paths = find_shard_outputs(output_path)
+    print(f"Merging {len(shard_paths)} shard outputs into {output_path}")
+    # Every message belongs to a single shard, so identical messages sent in the same second are all kept
+    written_count, _ = merge_csv_files(shard_paths, output_path, key=None, chunksize=chunksize)
+
+    # The merged results are scored by the backends of all shards, unknown if any shard's are
+    shard_backends = [read_result_backends(path) for path in shard_paths]
+    if all(backends is not None for backends in shard_backends):
+        write_result_backends(output_path, [backend for backends in shard_backends for backend in backends])
+    elif os.path.exists(get_backend_record_path(output_path)):
+        os.remove(get_backend_record_path(output_path))
+
+    failed = [path for path in map(get_dead_letter_path, shard_paths) if os.path.exists(path)]
+    if failed:
+        print(f"{len(failed)} shards have messages that could not be scored ({', '.join(failed)}), "
+              f"run 'replay --shard i/N' for them and merge again.")
+    return written_count
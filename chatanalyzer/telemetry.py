@@ -0,0 +1,255 @@
+import bisect
+import json
+import os
+import threading
+import time
+
+# Upper bounds, in seconds, of the buckets of the request latency histogram
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 15.0)
+
+# Seconds between two writes of the metric files during a run
+DEFAULT_INTERVAL = 10
+
+METRIC_HELP = {
+    "chatanalyzer_api_requests_total": "Requests sent to the sentiment API, by HTTP status, outcome and API key.",
+    "chatanalyzer_api_request_duration_seconds": "Latency of the requests sent to the sentiment API.",
+    "chatanalyzer_api_retries_total": "Requests sent again after a network error, throttling or a rejected token.",
+    "chatanalyzer_cache_hits_total": "Messages answered without a request, from the cache or a repeat in the batch.",
+    "chatanalyzer_cache_misses_total": "Messages sent to the sentiment API.",
+    "chatanalyzer_failed_messages_total": "Messages the API could not score, even after retries.",
+    "chatanalyzer_circuit_breaker_opened_total": "Times requests were paused because the sentiment API kept failing.",
+    "chatanalyzer_messages_total": "Text messages processed by the run.",
+    "chatanalyzer_results_saved_total": "Sentiment results durably written to the output.",
+    "chatanalyzer_batches_total": "Batches completed by the run.",
+    "chatanalyzer_messages_per_second": "Text messages processed per second since the start of the run.",
+    "chatanalyzer_run_start_time_seconds": "Unix time the run started at.",
+    "chatanalyzer_last_update_time_seconds": "Unix time the metrics were written at.",
+}
+
+class Histogram:
+    """
+    A cumulative histogram of observed values, as exported to Prometheus.
+    """
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        # One count per bucket plus the +Inf bucket, not cumulative
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """
+        Estimate a quantile by linear interpolation within its bucket, as Prometheus'
+        histogram_quantile does. Returns None before any observation.
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            if count and cumulative + count >= rank:
+                if i == len(self.buckets):
+                    # The +Inf bucket has no upper bound, give the highest finite one
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+class Telemetry:
+    """
+    Thread-safe counters, gauges and histograms describing a run, written as a
+    Prometheus textfile (for node_exporter's textfile collector) and as a JSON summary.
+
+    Parameters:
+    - labels (dict): Labels added to every series, such as the source of the run.
+    """
+    def __init__(self, labels=None):
+        self.labels = dict(labels or {})
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.started = time.time()
+        self.set("chatanalyzer_run_start_time_seconds", self.started)
+
+    def increment(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def total(self, name, **labels):
+        """
+        Return the sum of the series of a counter having the given labels.
+        """
+        with self.lock:
+            return sum(value for (counter, series_labels), value in self.counters.items()
+                       if counter == name and set(labels.items()) <= set(series_labels))
+
+    def summary(self):
+        """
+        Describe the run so far: throughput, requests by outcome and status, retries,
+        cache hit rate and latency quantiles, along with every series.
+        """
+        now = time.time()
+        elapsed = now - self.started
+        messages = self.total("chatanalyzer_messages_total")
+        hits = self.total("chatanalyzer_cache_hits_total")
+        misses = self.total("chatanalyzer_cache_misses_total")
+        with self.lock:
+            requests_by = {"outcome": {}, "status": {}}
+            for (name, labels), value in self.counters.items():
+                if name == "chatanalyzer_api_requests_total":
+                    for label, label_value in labels:
+                        if label in requests_by:
+                            requests_by[label][label_value] = requests_by[label].get(label_value, 0) + value
+            latency = {}
+            for (name, labels), histogram in self.histograms.items():
+                if name == "chatanalyzer_api_request_duration_seconds" and histogram.count:
+                    latency = {
+                        "count": histogram.count,
+                        "mean": histogram.sum / histogram.count,
+                        "p50": histogram.quantile(0.5),
+                        "p90": histogram.quantile(0.9),
+                        "p99": histogram.quantile(0.99),
+                    }
+            series = {
+                "counters": [{"name": name, "labels": dict(labels), "value": value}
+                             for (name, labels), value in sorted(self.counters.items())],
+                "gauges": [{"name": name, "labels": dict(labels), "value": value}
+                           for (name, labels), value in sorted(self.gauges.items())],
+            }
+        return {
+            "labels": self.labels,
+            "started_at": self.started,
+            "updated_at": now,
+            "elapsed_seconds": elapsed,
+            "messages": messages,
+            "messages_per_second": messages / elapsed if elapsed > 0 else 0.0,
+            "requests": {
+                "total": self.total("chatanalyzer_api_requests_total"),
+                "by_outcome": requests_by["outcome"],
+                "by_status": requests_by["status"],
+                "retries": self.total("chatanalyzer_api_retries_total"),
+            },
+            "cache": {"hits": hits, "misses": misses, "hit_rate": hits / (hits + misses) if hits + misses else None},
+            "failed_messages": self.total("chatanalyzer_failed_messages_total"),
+            "latency_seconds": latency,
+            **series,
+        }
+
+    def to_prometheus(self):
+        """
+        Return the metrics in the Prometheus text exposition format.
+        """
+        now = time.time()
+        elapsed = now - self.started
+        self.set("chatanalyzer_messages_per_second",
+                 self.total("chatanalyzer_messages_total") / elapsed if elapsed > 0 else 0.0)
+        self.set("chatanalyzer_last_update_time_seconds", now)
+
+        lines = []
+        described = set()
+
+        def describe(name, kind):
+            if name not in described:
+                described.add(name)
+                if name in METRIC_HELP:
+                    lines.append(f"# HELP {name} {METRIC_HELP[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        with self.lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                describe(name, "counter")
+                lines.append(f"{name}{self._format_labels(labels)} {_format_value(value)}")
+            for (name, labels), value in sorted(self.gauges.items()):
+                describe(name, "gauge")
+                lines.append(f"{name}{self._format_labels(labels)} {_format_value(value)}")
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                describe(name, "histogram")
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                    cumulative += count
+                    bucket_labels = labels + (("le", "+Inf" if bound == float("inf") else _format_value(bound)),)
+                    lines.append(f"{name}_bucket{self._format_labels(bucket_labels)} {cumulative}")
+                lines.append(f"{name}_sum{self._format_labels(labels)} {_format_value(histogram.sum)}")
+                lines.append(f"{name}_count{self._format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, prometheus_path=None, json_path=None):
+        """
+        Write the Prometheus textfile and the JSON summary, each replaced atomically so
+        that a collector never reads a partial file.
+        """
+        if prometheus_path is not None:
+            _write_atomic(prometheus_path, self.to_prometheus())
+        if json_path is not None:
+            _write_atomic(json_path, json.dumps(self.summary(), indent=2))
+
+    def _format_labels(self, labels):
+        labels = tuple(self.labels.items()) + tuple(labels)
+        if not labels:
+            return ""
+        escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in labels)
+        return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+class TelemetryExporter:
+    """
+    Write the metrics of a Telemetry to files every `interval` seconds from a daemon
+    thread, and once more when closed.
+
+    Parameters:
+    - telemetry (Telemetry): The metrics to write.
+    - prometheus_path (str): The Prometheus textfile, e.g. chatanalyzer.prom.
+    - json_path (str): The JSON summary, next to the textfile by default.
+    - interval (float): Seconds between two writes.
+    """
+    def __init__(self, telemetry, prometheus_path, json_path=None, interval=DEFAULT_INTERVAL):
+        self.telemetry = telemetry
+        self.prometheus_path = prometheus_path
+        self.json_path = json_path or f"{os.path.splitext(prometheus_path)[0]}.json"
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="TelemetryExporter", daemon=True)
+        self.thread.start()
+
+    def close(self):
+        """
+        Stop the thread and write the final metrics.
+        """
+        self.stop_event.set()
+        self.thread.join()
+        self.telemetry.write(self.prometheus_path, self.json_path)
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.telemetry.write(self.prometheus_path, self.json_path)
+            except OSError as error:
+                print(f"Failed to write the metrics to {self.prometheus_path}: {error}")
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _write_atomic(path, content):
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as file:
+        file.write(content)
+    os.replace(temp_path, path)
@@ -0,0 +1,131 @@
+import numpy as np
+import pandas as pd
+from chatanalyzer.tokenization import tokenize_texts
+
+class TokenIndex:
+    """
+    An inverted index of the jieba tokens of a conversation, built once so that word
+    and phrase queries only read the messages holding them instead of scanning every text.
+
+    The postings of each token are the ids (row numbers in the context's df) of the
+    messages it occurs in, with its position among their tokens, one per occurrence.
+    The user, time and other features of a message are read from its row of the context.
+
+    Parameters:
+    - context (AnalysisContext): The conversation to index.
+    - token_lists (list): The tokens of every message of the context, see AnalysisContext.tokens.
+    """
+    def __init__(self, context, token_lists):
+        self.df = context.df
+        self.texts = self.df['Text'].fillna('').to_numpy(dtype=object)
+
+        lengths = np.fromiter((len(tokens) for tokens in token_lists), dtype=np.int64, count=len(token_lists))
+        flat = [token for tokens in token_lists for token in tokens]
+        message_ids = np.repeat(np.arange(len(lengths), dtype=np.int64), lengths)
+        positions = np.arange(len(flat), dtype=np.int64) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+
+        # Occurrences sorted by token (then message and position), the postings of
+        # token code c being the slice offsets[c]:offsets[c + 1]
+        codes, vocabulary = pd.factorize(pd.Series(flat, dtype=object))
+        order = np.argsort(codes, kind='stable')
+        self.message_ids = message_ids[order]
+        self.positions = positions[order]
+        self.sizes = np.bincount(codes, minlength=len(vocabulary))
+        self.offsets = np.concatenate(([0], np.cumsum(self.sizes)))
+        self.codes = {token: code for code, token in enumerate(vocabulary)}
+
+        # Codes of the tokens holding each character, to find the messages holding any string
+        self.char_codes = {}
+        for code, token in enumerate(vocabulary):
+            for char in set(token):
+                self.char_codes.setdefault(char, []).append(code)
+        # Sorted values of each column grouped by in frequency
+        self.groups = {}
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __contains__(self, token):
+        return token in self.codes
+
+    def postings(self, token):
+        """
+        Return the message ids and positions of every occurrence of a token (two arrays,
+        empty if it never occurs).
+        """
+        code = self.codes.get(token)
+        if code is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        start, end = self.offsets[code], self.offsets[code + 1]
+        return self.message_ids[start:end], self.positions[start:end]
+
+    def per_message(self, message_ids):
+        """
+        Return the number of times each message id is given, as a Series over every message.
+        """
+        counts = np.bincount(message_ids, minlength=len(self.texts)).astype(np.int32)
+        return pd.Series(counts, index=self.df.index)
+
+    def term(self, token):
+        """
+        Return the occurrences of a whole token in each message.
+        """
+        return self.per_message(self.postings(token)[0])
+
+    def phrase(self, phrase):
+        """
+        Return the occurrences of a phrase in each message: its tokens one after another.
+
+        Parameters:
+        - phrase (str or list): The phrase, cut with jieba if a string, or its list of tokens.
+        """
+        tokens = tokenize_texts([phrase], workers=1)[0] if isinstance(phrase, str) else list(phrase)
+        if not tokens:
+            raise ValueError("The phrase has no tokens.")
+        message_ids, positions = self.postings(tokens[0])
+        # Each occurrence is encoded as one integer (message id, position of its first token)
+        stride = int(self.positions.max(initial=0)) + len(tokens) + 1
+        matches = message_ids * stride + positions
+        for offset, token in enumerate(tokens[1:], start=1):
+            next_ids, next_positions = self.postings(token)
+            matches = np.intersect1d(matches, next_ids * stride + next_positions - offset, assume_unique=True)
+        return self.per_message(matches // stride)
+
+    def count(self, word):
+        """
+        Return the occurrences of a literal string in the text of each message, the same
+        as Series.str.count with special characters escaped. The string may span several
+        tokens or be part of one.
+        """
+        if not word:
+            raise ValueError("The word to count must not be empty.")
+        # Any occurrence holds each of its characters, so reading the messages with the
+        # tokens holding its least frequent character finds all of them
+        codes = min((np.asarray(self.char_codes.get(char, []), dtype=np.int64) for char in set(word)),
+                    key=lambda codes: self.sizes[codes].sum())
+        if not len(codes):
+            return self.per_message(np.empty(0, dtype=np.int64))
+        message_ids = np.unique(np.concatenate([self.message_ids[self.offsets[code]:self.offsets[code + 1]]
+                                                for code in codes]))
+        counts = np.zeros(len(self.texts), dtype=np.int32)
+        counts[message_ids] = [text.count(word) for text in self.texts[message_ids]]
+        return pd.Series(counts, index=self.df.index)
+
+    def frequency(self, counts, by='User'):
+        """
+        Sum per-message occurrences (as returned by term, phrase or count) for each value
+        of a column of the context, reading only the messages that have any.
+
+        Parameters:
+        - counts (pd.Series): Occurrences in each message.
+        - by (str): The column to group by, such as 'User', 'Month', 'Date' or 'Hour'.
+
+        Returns:
+        - pd.Series: Occurrences for each value of the column, 0 for those without any.
+        """
+        column = self.df[by]
+        if by not in self.groups:
+            self.groups[by] = column.dropna().drop_duplicates().sort_values()
+        found = np.flatnonzero(counts.to_numpy())
+        totals = counts.iloc[found].groupby(column.iloc[found], observed=True).sum()
+        return totals.reindex(self.groups[by], fill_value=0).rename_axis(by)
@@ -0,0 +1,140 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import jieba
+
+TOKEN_CACHE_FILE = "token_cache.sqlite"
+
+# Separates the tokens of a message in the cache (the ASCII unit separator), much
+# faster to split than JSON to parse; messages holding it are not cached
+TOKEN_SEPARATOR = "\x1f"
+
+# Fewer distinct texts than this to tokenize are cut in this process, as starting
+# workers (each loading jieba's dictionary) would take longer than the work itself
+PARALLEL_THRESHOLD = 20000
+
+# Texts sent to a worker at a time
+BATCH_SIZE = 2000
+
+def token_key(text):
+    """
+    Return the cache key of a message: the SHA-256 digest of its exact text, as its
+    tokens depend on every character of it.
+    """
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+class TokenCache:
+    """
+    An on-disk cache of the jieba tokens of each message, keyed by its text, shared
+    across runs, conversations and processes (a SQLite database in WAL mode).
+    """
+    def __init__(self, db_path=TOKEN_CACHE_FILE):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS tokens (key BLOB PRIMARY KEY, tokens TEXT)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def get_many(self, keys):
+        """
+        Look up the tokens of messages by key.
+
+        Returns:
+        - dict: The token list of each key found.
+        """
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        with self.lock:
+            # Stay below SQLite's limit on the number of query parameters
+            for start in range(0, len(keys), 500):
+                part = keys[start:start + 500]
+                rows = self.connection.execute(
+                    f"SELECT key, tokens FROM tokens WHERE key IN ({','.join('?' * len(part))})", part
+                ).fetchall()
+                found.update((key, tokens.split(TOKEN_SEPARATOR) if tokens else []) for key, tokens in rows)
+        return found
+
+    def put_many(self, tokens):
+        """
+        Store token lists given as a dict of key to list, except those holding TOKEN_SEPARATOR.
+        """
+        rows = [(key, TOKEN_SEPARATOR.join(token_list)) for key, token_list in tokens.items()
+                if not any(TOKEN_SEPARATOR in token for token in token_list)]
+        if not rows:
+            return
+        with self.lock, self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO tokens VALUES (?, ?)", rows)
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM tokens").fetchone()[0]
+
+def init_tokenizer():
+    """
+    Load jieba's dictionary once per worker process, before its first batch.
+    """
+    jieba.setLogLevel(60)
+    jieba.initialize()
+
+def cut_texts(texts):
+    """
+    Cut each text into its jieba tokens, keeping every token (spaces and punctuation included).
+    """
+    return [jieba.lcut(text) for text in texts]
+
+def tokenize_texts(texts, cache_path=None, workers=None):
+    """
+    Return the jieba tokens of each message, cutting each distinct text once.
+
+    With a cache_path, tokens cut before (in any run or conversation) are read from
+    that TokenCache, and the new ones are saved to it, so a rerun or a history with a
+    few new messages only cuts the texts not seen yet. Large amounts of new texts are
+    cut in a pool of `workers` processes (the number of CPUs by default).
+
+    Parameters:
+    - texts (iterable): The messages; a missing one (None or NaN) gets no tokens.
+    - cache_path (str): The token cache, or None for no cache.
+    - workers (int): Maximum number of worker processes, 1 to cut in this process.
+
+    Returns:
+    - list: A list of tokens for each text.
+    """
+    texts = [text if isinstance(text, str) else "" for text in texts]
+    distinct = list(dict.fromkeys(texts))
+    tokens = {}
+    cache = TokenCache(cache_path) if cache_path is not None else None
+    try:
+        keys = {text: token_key(text) for text in distinct}
+        if cache is not None:
+            cached = cache.get_many(keys.values())
+            tokens = {text: cached[key] for text, key in keys.items() if key in cached}
+        pending = [text for text in distinct if text not in tokens]
+
+        workers = min(workers or os.cpu_count() or 1, -(-len(pending) // BATCH_SIZE))
+        if workers > 1 and len(pending) >= PARALLEL_THRESHOLD:
+            batches = [pending[start:start + BATCH_SIZE] for start in range(0, len(pending), BATCH_SIZE)]
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_tokenizer) as executor:
+                cut = [token_list for batch in executor.map(cut_texts, batches) for token_list in batch]
+        else:
+            cut = cut_texts(pending)
+        tokens.update(zip(pending, cut))
+
+        if cache is not None:
+            cache.put_many({keys[text]: token_list for text, token_list in zip(pending, cut)})
+    finally:
+        if cache is not None:
+            cache.close()
+    return [tokens[text] for text in texts]
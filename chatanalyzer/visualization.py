@@ -1,23 +1,23 @@
 import matplotlib.pyplot as plt
 import seaborn as sns
-import pandas as pd
 from itertools import cycle
 from matplotlib.colors import to_hex
 import matplotlib.cm as cm
 from matplotlib import font_manager
 from wordcloud import WordCloud
+from chatanalyzer.analysis_context import as_context
 
 def assign_colors(df):
     """
     Assign a consistent color for each unique user in the dataset.
 
     Parameters:
-    - df: DataFrame containing a 'User' column.
+    - df: DataFrame containing a 'User' column, or an AnalysisContext.
 
     Returns:
     - dict: A dictionary mapping users to unique colors.
     """
-    unique_users = df['User'].unique()
+    unique_users = as_context(df).df['User'].unique()
     cmap = cm.get_cmap('tab10', len(unique_users))  # Use 'tab10' colormap for distinct colors
     colors = {user: to_hex(cmap(i)) for i, user in enumerate(unique_users)}
     return colors
@@ -51,7 +51,7 @@ def plot_sentiment_trend(df, user_colors, output_path="sentiment_trend.png"):
     """
     Plot sentiment trends over time, including user contribution percentages.
     """
-    df['Date'] = pd.to_datetime(df['StrTime']).dt.date
+    df = as_context(df).df
     daily_sentiment = df.groupby(['Date', 'Sentiment']).size().unstack(fill_value=0)
     daily_sentiment = daily_sentiment.rename(columns={0: 'Negative', 1: 'Neutral', 2: 'Positive'})
 
@@ -78,7 +78,7 @@ def plot_sentiment_volatility(df, user_colors, output_path="sentiment_volatility
     """
     Plot sentiment volatility by hour as a line plot, including user contribution percentages.
     """
-    df['Hour'] = pd.to_datetime(df['StrTime']).dt.hour
+    df = as_context(df).df
     hourly_sentiment = df.groupby(['Hour', 'Sentiment']).size().unstack(fill_value=0)
     hourly_sentiment = hourly_sentiment.rename(columns={0: 'Negative', 1: 'Neutral', 2: 'Positive'})
 
@@ -105,8 +105,8 @@ def plot_active_hours_distribution(df, user_colors, output_path="active_hours_di
     """
     Plot active hours distribution for each user, with percentage labels for better comparison.
     """
-    df['Hour'] = pd.to_datetime(df['StrTime']).dt.hour
-    user_hourly_counts = df.groupby(['Hour', 'User']).size().unstack(fill_value=0)
+    df = as_context(df).df
+    user_hourly_counts = df.groupby(['Hour', 'User'], observed=True).size().unstack(fill_value=0)
 
     plt.figure(figsize=(10, 6))
     user_hourly_counts.plot(kind='bar', stacked=True, color=[user_colors[user] for user in user_hourly_counts.columns])
@@ -131,8 +131,8 @@ def plot_monthly_message_distribution(df, user_colors, output_path="monthly_mess
     """
     Plot monthly message distribution for each user, with percentage labels for better comparison.
     """
-    df['Month'] = pd.to_datetime(df['StrTime']).dt.to_period('M')
-    monthly_counts = df.groupby(['Month', 'User']).size().unstack(fill_value=0)
+    df = as_context(df).df
+    monthly_counts = df.groupby(['Month', 'User'], observed=True).size().unstack(fill_value=0)
 
     plt.figure(figsize=(12, 6))
     monthly_counts.plot(kind='bar', stacked=True, color=[user_colors[user] for user in monthly_counts.columns])
@@ -158,6 +158,7 @@ def plot_sentiment_distribution(df, user_colors, output_path="sentiment_distribu
     """
     Plot the sentiment distribution for each user.
     """
+    df = as_context(df).df
     plt.figure(figsize=(10, 6))
     sns.countplot(data=df, x='Sentiment', hue='User', palette=user_colors)
     plt.xlabel('Sentiment', fontsize=12)
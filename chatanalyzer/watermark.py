@@ -0,0 +1,91 @@
+import json
+import os
+import pandas as pd
+
+class WatermarkStore:
+    """
+    Remember, for each conversation, the newest message already processed.
+
+    A watermark holds the highest 'localId' and 'CreateTime' seen, and is stored
+    in a JSON file keyed by conversation: the export's 'TalkerId', or the name of
+    the input file when it has no such column.
+    """
+    def __init__(self, file_path="watermarks.json"):
+        self.file_path = file_path
+        self.watermarks = {}
+        if os.path.exists(file_path):
+            with open(file_path, "r") as file:
+                self.watermarks = json.load(file)
+
+    def is_empty(self):
+        """
+        Check whether no conversation has been processed yet.
+        """
+        return not self.watermarks
+
+    def clear(self):
+        """
+        Forget every watermark, so that all messages are processed again.
+        """
+        self.watermarks = {}
+
+    def get(self, conversation):
+        """
+        Return the watermark of a conversation, e.g. {'localId': 1275542, 'CreateTime': 1625124056}, or None.
+        """
+        return self.watermarks.get(str(conversation))
+
+    def filter_new(self, df, default_conversation):
+        """
+        Keep only the messages newer than the watermark of their conversation.
+
+        Messages are compared by 'localId' when both the frame and the watermark have it,
+        otherwise by 'CreateTime'. A frame with neither column is returned unchanged.
+        """
+        if self.is_empty() or df.empty:
+            return df
+
+        conversations = get_conversations(df, default_conversation)
+        is_new = pd.Series(True, index=df.index)
+        for conversation in conversations.unique():
+            watermark = self.get(conversation)
+            if watermark is None:
+                continue
+            rows = conversations == conversation
+            if 'localId' in df.columns and watermark.get('localId') is not None:
+                is_new[rows] = df.loc[rows, 'localId'] > watermark['localId']
+            elif 'CreateTime' in df.columns and watermark.get('CreateTime') is not None:
+                is_new[rows] = df.loc[rows, 'CreateTime'] > watermark['CreateTime']
+        return df[is_new.fillna(True).astype(bool)]
+
+    def advance(self, df, default_conversation):
+        """
+        Move the watermarks forward past the messages of a processed frame.
+        """
+        if df.empty:
+            return
+
+        conversations = get_conversations(df, default_conversation)
+        for conversation, rows in df.groupby(conversations.to_numpy()):
+            watermark = self.watermarks.setdefault(str(conversation), {})
+            for column in ('localId', 'CreateTime'):
+                if column in rows.columns and rows[column].notna().any():
+                    newest = int(rows[column].max())
+                    watermark[column] = max(newest, watermark.get(column, newest))
+
+    def save(self):
+        """
+        Write the watermarks to their file, replacing it atomically.
+        """
+        temp_path = f"{self.file_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump(self.watermarks, file, indent=2)
+        os.replace(temp_path, self.file_path)
+
+def get_conversations(df, default_conversation):
+    """
+    Return the conversation of each message: its 'TalkerId', or default_conversation.
+    """
+    if 'TalkerId' in df.columns:
+        return df['TalkerId'].astype(object).where(df['TalkerId'].notna(), default_conversation).astype(str)
+    return pd.Series(str(default_conversation), index=df.index)
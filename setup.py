@@ -12,6 +12,7 @@ setup(
         'tqdm',
         'jieba',
         'wordcloud',
+        'pyarrow',
     ],
     entry_points={
         'console_scripts': [
@@ -0,0 +1,78 @@
+import os
+import unittest
+from unittest.mock import patch
+import numpy as np
+import pandas as pd
+from chatanalyzer.analysis_context import AnalysisContext, as_context
+from chatanalyzer.schema import read_results_csv
+from chatanalyzer.sentiment_utils import (
+    calculate_emotional_variability,
+    calculate_sentiment_proportion,
+    calculate_silence_breakers,
+    count_specific_word,
+    get_active_days_count,
+    get_longest_silence,
+    get_peak_hour_activity,
+    get_peak_month_activity,
+)
+
+SAMPLES_DIR = os.path.join(os.path.dirname(__file__), '..', 'samples')
+
+class TestAnalysisContext(unittest.TestCase):
+    def setUp(self):
+        self.df = read_results_csv(os.path.join(SAMPLES_DIR, 'api_output.csv'))
+
+    def test_features(self):
+        # 乱序输入按时间排序，且不修改调用者的 DataFrame
+        shuffled = self.df.sample(frac=1, random_state=0)
+        columns = list(shuffled.columns)
+        context = AnalysisContext(shuffled)
+        self.assertEqual(list(shuffled.columns), columns)
+        df = context.df
+        self.assertTrue(df['StrTime'].is_monotonic_increasing)
+        self.assertEqual(len(context), len(self.df))
+
+        expected_diff = df['StrTime'].diff().dt.total_seconds().div(3600).fillna(0)
+        np.testing.assert_allclose(df['Time_Diff'], expected_diff)
+        self.assertEqual(df['Hour'].dtype, np.int8)
+        self.assertEqual(df['Hour'].tolist(), df['StrTime'].dt.hour.tolist())
+        self.assertEqual(df['Date'].dt.date.tolist(), df['StrTime'].dt.date.tolist())
+        self.assertEqual(df['Month'].astype(str).tolist(), df['StrTime'].dt.strftime('%Y-%m').tolist())
+        self.assertEqual(df['Text_Length'].dtype, np.int32)
+        self.assertEqual(df['Text_Length'].sum(), self.df['Text'].str.len().sum())
+        self.assertEqual(context.active_days, self.df['StrTime'].dt.date.nunique())
+        self.assertIs(as_context(context), context)
+
+    def test_metrics_match_dataframe_computations(self):
+        df = self.df.sort_values('StrTime', kind='stable', ignore_index=True)
+        context = AnalysisContext(df)
+        time_diff = df['StrTime'].diff().dt.total_seconds().div(3600).fillna(0)
+        hours = df['StrTime'].dt.hour
+
+        self.assertEqual(get_peak_hour_activity(context)[:2], (hours.value_counts().idxmax(), hours.value_counts().max()))
+        self.assertEqual(get_peak_month_activity(context)[1], df['StrTime'].dt.to_period('M').value_counts().max())
+        self.assertEqual(get_active_days_count(context), df['StrTime'].dt.date.nunique())
+        self.assertEqual(get_longest_silence(context), (time_diff.max(), df.loc[time_diff.idxmax(), 'User']))
+
+        breakers = calculate_silence_breakers(context)
+        total_counts = df.groupby('User', observed=True).size()
+        expected = df[time_diff > 12].groupby('User', observed=True).size() / total_counts
+        pd.testing.assert_series_equal(breakers['breaker_ratio'], expected, check_names=False)
+
+        proportion = calculate_sentiment_proportion(context)
+        self.assertAlmostEqual(proportion['Positive_Proportion'].sum(),
+                               ((df['Sentiment'] == 2).groupby(df['User'], observed=True).mean()).sum())
+        # DataFrame 与 AnalysisContext 均可作为参数
+        pd.testing.assert_frame_equal(calculate_emotional_variability(df), calculate_emotional_variability(context))
+
+    def test_word_counts_are_computed_once(self):
+        context = AnalysisContext(self.df)
+        occurrences = context.count_occurrences('哈')
+        self.assertIs(context.count_occurrences('哈'), occurrences)
+        self.assertEqual(occurrences.sum(), self.df['Text'].str.count('哈').sum())
+        with patch('builtins.input', return_value='哈'), patch('builtins.print') as mock_print:
+            count_specific_word(context)
+        self.assertIn(f"\nTotal occurrences of '哈': {occurrences.sum()}", [call.args[0] for call in mock_print.call_args_list])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,12 +1,23 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
 import unittest
 from unittest.mock import patch, mock_open
-from chatanalyzer.auth import BaiduAuth
+from chatanalyzer.auth import BaiduAuth, load_credentials
 
 class TestBaiduAuth(unittest.TestCase):
     def setUp(self):
         self.invalid_api_key = "fake_api_key"
         self.invalid_secret_key = "fake_secret_key"
         self.auth_client_invalid = BaiduAuth(self.invalid_api_key, self.invalid_secret_key)
+        self.temp_dir = tempfile.mkdtemp()
+        self.token_path = os.path.join(self.temp_dir, "access_token.txt")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
 
     @patch('requests.post')
     def test_invalid_credentials(self, mock_post):
@@ -28,13 +39,92 @@ class TestBaiduAuth(unittest.TestCase):
         auth_client.load_access_token("access_token.txt")
         self.assertEqual(auth_client.access_token, "mock_access_token")
 
-    @patch("builtins.open", new_callable=mock_open)
-    def test_save_access_token(self, mock_file):
+    def test_save_access_token(self):
         auth_client = BaiduAuth("api_key", "secret_key")
         auth_client.access_token = "new_mock_access_token"
-        auth_client.save_access_token("access_token.txt")
+        auth_client.expires_at = time.time() + 3600
+        auth_client.save_access_token(self.token_path)
+
+        # 令牌与过期时间一起保存，且不留下临时文件
+        loaded = BaiduAuth("api_key", "secret_key")
+        loaded.load_access_token(self.token_path)
+        self.assertEqual(loaded.access_token, "new_mock_access_token")
+        self.assertEqual(loaded.expires_at, auth_client.expires_at)
+        self.assertEqual(os.listdir(self.temp_dir), ["access_token.txt"])
+
+    def test_load_missing_access_token(self):
+        with self.assertRaises(FileNotFoundError):
+            BaiduAuth().load_access_token(self.token_path)
+
+    def test_token_expiry(self):
+        auth_client = BaiduAuth("api_key", "secret_key", refresh_margin=60)
+        self.assertFalse(auth_client.is_token_valid())
+        auth_client.access_token = "token"
+        # 过期时间未知（旧格式文件）时视为有效
+        self.assertTrue(auth_client.is_token_valid(60))
+        self.assertIsNone(auth_client.seconds_until_refresh())
+        auth_client.expires_at = time.time() + 30
+        self.assertTrue(auth_client.is_token_valid())
+        self.assertFalse(auth_client.is_token_valid(60))
+        self.assertEqual(auth_client.seconds_until_refresh(), 0)
+
+    @patch("requests.post")
+    def test_get_access_token_records_expiry(self, mock_post):
+        mock_post.return_value.status_code = 200
+        mock_post.return_value.json.return_value = {"access_token": "token", "expires_in": 2592000}
+        auth_client = BaiduAuth("api_key", "secret_key")
+        auth_client.get_access_token()
+        self.assertAlmostEqual(auth_client.expires_at, time.time() + 2592000, delta=5)
+
+    def test_refresh_reuses_token_saved_by_another_process(self):
+        other = BaiduAuth()
+        other.access_token, other.expires_at = "fresh_token", time.time() + 7 * 24 * 3600
+        other.save_access_token(self.token_path)
+
+        auth_client = BaiduAuth()
+        with patch.object(BaiduAuth, "get_access_token") as mock_get:
+            token = auth_client.refresh_access_token(self.token_path, stale_token="expired_token")
+        mock_get.assert_not_called()
+        self.assertEqual(token, "fresh_token")
+
+    def test_concurrent_refreshes_fetch_one_token(self):
+        calls = []
+
+        def fetch(auth_client):
+            calls.append(auth_client)
+            time.sleep(0.1)
+            auth_client.access_token = f"token_{len(calls)}"
+            auth_client.expires_at = time.time() + 7 * 24 * 3600
+            return auth_client.access_token
 
-        mock_file().write.assert_called_once_with("new_mock_access_token")
+        # 每个线程使用独立的 BaiduAuth，如同多个工作进程共享同一个令牌文件
+        clients = [BaiduAuth() for _ in range(4)]
+        with patch.object(BaiduAuth, "get_access_token", autospec=True, side_effect=fetch):
+            threads = [threading.Thread(target=client.refresh_access_token, args=(self.token_path, None))
+                       for client in clients]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual({client.access_token for client in clients}, {"token_1"})
+
+    def test_background_refresh(self):
+        auth_client = BaiduAuth(refresh_margin=3600)
+        auth_client.access_token, auth_client.expires_at = "old_token", time.time() + 3600.2
+        auth_client.save_access_token(self.token_path)
+
+        def fetch(client):
+            client.access_token, client.expires_at = "new_token", time.time() + 7200
+            return client.access_token
+
+        with patch.object(BaiduAuth, "get_access_token", autospec=True, side_effect=fetch):
+            auth_client.start_background_refresh(self.token_path)
+            deadline = time.time() + 5
+            while auth_client.access_token != "new_token" and time.time() < deadline:
+                time.sleep(0.05)
+            auth_client.stop_background_refresh()
+        self.assertEqual(auth_client.access_token, "new_token")
 
     @patch("chatanalyzer.auth.BaiduAuth.load_access_token")
     @patch("chatanalyzer.auth.BaiduAuth.get_access_token")
@@ -44,10 +134,35 @@ class TestBaiduAuth(unittest.TestCase):
         mock_get.return_value = "new_generated_token"
 
         auth_client = BaiduAuth("api_key", "secret_key")
-        auth_client.load_or_generate_access_token()
+        auth_client.load_or_generate_access_token(self.token_path)
 
         mock_get.assert_called_once()  # 应该调用 get_access_token
         mock_save.assert_called_once()  # 应该保存新的 token
 
+class TestLoadCredentials(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.credentials_path = os.path.join(self.temp_dir, "credentials.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_each_key_has_its_own_token_file(self):
+        with open(self.credentials_path, "w") as file:
+            json.dump([{"api_key": "key1", "secret_key": "secret1", "qps": 2},
+                       {"api_key": "key2", "secret_key": "secret2"}], file)
+        credentials = load_credentials(self.credentials_path)
+
+        self.assertEqual([(auth.api_key, qps) for auth, qps in credentials], [("key1", 2), ("key2", None)])
+        token_paths = {auth.token_path for auth, _ in credentials}
+        self.assertEqual(len(token_paths), 2)
+        self.assertTrue(all(os.path.dirname(path) == self.temp_dir for path in token_paths))
+
+    def test_invalid_credentials_file(self):
+        with open(self.credentials_path, "w") as file:
+            json.dump([{"api_key": "key1"}], file)
+        with self.assertRaises(ValueError):
+            load_credentials(self.credentials_path)
+
 if __name__ == "__main__":
     unittest.main()
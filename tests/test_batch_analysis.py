@@ -0,0 +1,79 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+import pandas as pd
+from chatanalyzer.batch_analysis import analyze_conversation, find_exports, run_batch
+from chatanalyzer.cache import read_cache
+from chatanalyzer.data_preprocessing import iter_preprocessed_data
+
+SAMPLES_DIR = os.path.join(os.path.dirname(__file__), '..', 'samples')
+
+class TestBatchAnalysis(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.exports_dir = os.path.join(self.temp_dir, 'exports')
+        self.output_dir = os.path.join(self.temp_dir, 'batch_output')
+        os.makedirs(self.exports_dir)
+        for name in ['alice.csv', 'bob.csv']:
+            shutil.copy(os.path.join(SAMPLES_DIR, 'full_data.csv'), os.path.join(self.exports_dir, name))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_find_exports_in_directory_and_manifest(self):
+        with open(os.path.join(self.exports_dir, 'notes.txt'), 'w') as file:
+            file.write('not an export')
+        self.assertEqual([name for name, _ in find_exports(self.exports_dir)], ['alice', 'bob'])
+
+        manifest_path = os.path.join(self.temp_dir, 'manifest.txt')
+        with open(manifest_path, 'w') as file:
+            file.write('# 每行一个导出文件\nexports/alice.csv\n\nexports/bob.csv\nexports/alice.csv\n')
+        exports = find_exports(manifest_path)
+        self.assertEqual([name for name, _ in exports], ['alice', 'bob', 'alice-2'])
+        self.assertEqual(exports[1][1], os.path.join(self.temp_dir, 'exports/bob.csv'))
+
+    def test_run_batch_writes_layout_and_index(self):
+        # alice 已有 API 结果，bob 只做预处理
+        os.makedirs(os.path.join(self.output_dir, 'alice'))
+        shutil.copy(os.path.join(SAMPLES_DIR, 'api_output.csv'), os.path.join(self.output_dir, 'alice', 'api_output.csv'))
+        with open(os.path.join(self.exports_dir, 'broken.csv'), 'w') as file:
+            file.write('no,chat,columns\n1,2,3\n')
+
+        index = run_batch(self.exports_dir, self.output_dir, workers=2, request=False, chunksize=1000)
+
+        self.assertEqual(index['Conversation'].tolist(), ['alice', 'bob', 'broken'])
+        self.assertEqual(index['Status'].tolist(), ['ok', 'preprocessed', 'failed'])
+        expected_messages = len(pd.read_csv(os.path.join(SAMPLES_DIR, 'full_data.csv')))
+        self.assertEqual(index.loc[0, 'Messages'], expected_messages)
+        self.assertEqual(index.loc[1, 'Messages'], expected_messages)
+        self.assertEqual(index.loc[0, 'Results'], len(pd.read_csv(os.path.join(SAMPLES_DIR, 'api_output.csv'))))
+
+        with open(os.path.join(self.output_dir, 'alice', 'summary.json'), encoding='utf-8') as file:
+            summary = json.load(file)
+        self.assertEqual(summary['messages'], index.loc[0, 'Results'])
+        self.assertTrue(os.path.exists(os.path.join(self.output_dir, 'bob', 'log.txt')))
+        self.assertFalse(os.path.exists(os.path.join(self.output_dir, 'bob', 'summary.json')))
+        self.assertEqual(len(pd.read_csv(os.path.join(self.output_dir, 'index.csv'))), 3)
+
+    def test_conversation_is_read_once(self):
+        file_path = os.path.join(self.exports_dir, 'alice.csv')
+        conversation_dir = os.path.join(self.output_dir, 'alice')
+        # 缓存为空时，统计消息与请求 API 共用同一次读取
+        with patch('chatanalyzer.cache.iter_preprocessed_data', wraps=iter_preprocessed_data) as mock_parse, \
+                patch('chatanalyzer.cache.read_cache', wraps=read_cache) as mock_read:
+            row = analyze_conversation('alice', file_path, conversation_dir, chunksize=1000, backend='lexicon')
+        self.assertEqual(mock_parse.call_count, 1)
+        self.assertEqual(mock_read.call_count, 0)
+        self.assertEqual(row['Status'], 'ok')
+        self.assertEqual(row['Messages'], len(pd.read_csv(file_path)))
+        self.assertLessEqual(row['Results'], row['Text_Messages'])
+
+        # 再次运行只读取上次之后的消息，没有新的文本消息
+        row = analyze_conversation('alice', file_path, conversation_dir, chunksize=1000, backend='lexicon')
+        self.assertEqual(row['Text_Messages'], 0)
+
+if __name__ == "__main__":
+    unittest.main()
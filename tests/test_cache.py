@@ -0,0 +1,63 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+import pandas as pd
+from chatanalyzer.cache import (
+    hash_file,
+    get_cache_path,
+    get_preprocessed_options,
+    is_cache_valid,
+    iter_cached_preprocessed_data,
+    load_cached_results
+)
+from chatanalyzer.data_preprocessing import load_and_preprocess_data
+
+SAMPLES_DIR = os.path.join(os.path.dirname(__file__), '..', 'samples')
+
+class TestCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.data_path = shutil.copy(os.path.join(SAMPLES_DIR, 'full_data.csv'), self.temp_dir)
+        self.results_path = shutil.copy(os.path.join(SAMPLES_DIR, 'api_output.csv'), self.temp_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_preprocessed_cache_round_trip(self):
+        expected = load_and_preprocess_data(self.data_path)
+        built = pd.concat(iter_cached_preprocessed_data(self.data_path, chunksize=1000))
+        cache_path = get_cache_path(self.data_path, 'preprocessed')
+        self.assertTrue(is_cache_valid(cache_path, self.data_path, get_preprocessed_options()))
+
+        cached = pd.concat(iter_cached_preprocessed_data(self.data_path, chunksize=1000))
+        pd.testing.assert_frame_equal(built, expected, check_dtype=False)
+        pd.testing.assert_frame_equal(cached, expected, check_dtype=False)
+
+    def test_partial_read_leaves_no_cache(self):
+        chunks = iter_cached_preprocessed_data(self.data_path, chunksize=1000)
+        next(chunks)
+        chunks.close()
+        self.assertFalse(os.path.exists(get_cache_path(self.data_path, 'preprocessed')))
+
+    def test_results_cache_invalidated_by_change(self):
+        expected = load_cached_results(self.results_path)
+        cache_path = get_cache_path(self.results_path, 'results')
+        pd.testing.assert_frame_equal(load_cached_results(self.results_path), expected, check_dtype=False)
+
+        # 只修改时间戳时，内容哈希相同，缓存仍然有效
+        os.utime(self.results_path, (0, 0))
+        with patch('chatanalyzer.cache.hash_file', wraps=hash_file) as mock_hash:
+            self.assertTrue(is_cache_valid(cache_path, self.results_path))
+            # 新的修改时间已记录，之后不再重新计算哈希
+            self.assertTrue(is_cache_valid(cache_path, self.results_path))
+        self.assertEqual(mock_hash.call_count, 1)
+
+        with open(self.results_path, 'a') as file:
+            file.write("新消息,2024-01-01 00:00:00,R,text,2,0.9,0.95,0.05\n")
+        self.assertFalse(is_cache_valid(cache_path, self.results_path))
+        self.assertEqual(len(load_cached_results(self.results_path)), len(expected) + 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import os
+import shutil
+import tempfile
+import unittest
+import pandas as pd
+from chatanalyzer.checkpoint import RequestCheckpoint, get_message_keys
+
+class TestRequestCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.output_path = os.path.join(self.temp_dir, 'api_output.csv')
+        self.batch = pd.DataFrame({
+            'StrContent': ['哈哈', '哈哈', '好的'],
+            'StrTime': pd.to_datetime(['2021-07-01 12:00:00', '2021-07-01 12:00:05', '2021-07-01 12:00:09']),
+            'User': ['R', 'Matteo', 'R'],
+            'localId': pd.array([1, None, 3], dtype='Int64'),
+            'TalkerId': pd.array([6, 6, 41], dtype='Int64'),
+        })
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_message_keys(self):
+        keys = get_message_keys(self.batch)
+        self.assertEqual(keys[0], 'id:6:1')
+        self.assertEqual(keys[2], 'id:41:3')
+        # 没有 localId 时使用时间、发送者和内容的哈希
+        self.assertTrue(keys[1].startswith('sha1:'))
+        self.assertNotEqual(keys[1], get_message_keys(self.batch.drop(columns=['localId', 'TalkerId']))[0])
+
+    def test_resume_truncates_partial_writes(self):
+        with open(self.output_path, 'w') as file:
+            file.write('Text\n哈哈\n')
+        checkpoint = RequestCheckpoint(self.output_path, {'incremental': True})
+        checkpoint.commit(self.batch.iloc[:2], os.path.getsize(self.output_path))
+        with open(self.output_path, 'a') as file:
+            file.write('好')
+        with open(checkpoint.keys_path, 'a') as file:
+            file.write('id:41:')
+
+        resumed = RequestCheckpoint(self.output_path, {'incremental': True})
+        self.assertTrue(resumed.resume())
+        self.assertEqual(resumed.batches, 1)
+        with open(self.output_path) as file:
+            self.assertEqual(file.read(), 'Text\n哈哈\n')
+        self.assertEqual(resumed.filter_new(self.batch)['StrContent'].tolist(), ['好的'])
+
+    def test_checkpoint_of_other_options_is_discarded(self):
+        with open(self.output_path, 'w') as file:
+            file.write('Text\n')
+        RequestCheckpoint(self.output_path, {'incremental': True}).commit(self.batch, 5)
+
+        checkpoint = RequestCheckpoint(self.output_path, {'incremental': False})
+        self.assertFalse(checkpoint.resume())
+        self.assertFalse(os.path.exists(checkpoint.manifest_path))
+        self.assertEqual(len(checkpoint.filter_new(self.batch)), 3)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+import pandas as pd
+from chatanalyzer.data_preprocessing import (
+    classify_message_type,
+    classify_message_types,
+    load_and_preprocess_data,
+    iter_preprocessed_data,
+    parse_message_times,
+    find_row_offsets,
+    find_time_ordered_runs,
+    merge_csv_files
+)
+
+SAMPLES_DIR = os.path.join(os.path.dirname(__file__), '..', 'samples')
+
+class TestClassifyMessageTypes(unittest.TestCase):
+    def setUp(self):
+        # 覆盖各种消息类型以及容易混淆的边界情况
+        self.contents = pd.Series([
+            'md我从来没有',
+            '',
+            '   \n\t',
+            None,
+            '<msg><img src="a.jpg"/></msg>',
+            '<?xml version="1.0"?>\n<msg>\n\t<img aeskey="x" />\n</msg>',
+            '<msg><img src="a.jpg"/> trailing text </msg>',
+            '<msg><emoji md5="abc" /></msg>',
+            '<msg> <emoji md5="abc"</msg>',
+            '<msg><voicemsg voicelength="35260" /></msg>',
+            '<msg>unterminated',
+            '</msg> before <msg>',
+            'I typed <msg>hello</msg> by hand',
+            '<msg><emoji md5="abc" /></msg><msg><img /></msg>',
+            '<msg><img src="a.jpg"</msg>',
+        ])
+
+    def test_matches_row_by_row_classifier(self):
+        expected = self.contents.fillna('').apply(classify_message_type)
+        actual = classify_message_types(self.contents)
+        self.assertEqual(actual.tolist(), expected.tolist())
+
+    def test_sample_export(self):
+        df = pd.read_csv(os.path.join(SAMPLES_DIR, 'full_data.csv'))
+        expected = df['StrContent'].fillna('').apply(classify_message_type)
+        actual = classify_message_types(df['StrContent'])
+        self.assertEqual(actual.tolist(), expected.tolist())
+        self.assertTrue(actual.index.equals(df.index))
+
+class TestIterPreprocessedData(unittest.TestCase):
+    def test_chunks_match_full_load(self):
+        file_path = os.path.join(SAMPLES_DIR, 'full_data.csv')
+        expected = load_and_preprocess_data(file_path)
+        chunks = list(iter_preprocessed_data(file_path, chunksize=1000))
+        self.assertGreater(len(chunks), 1)
+        pd.testing.assert_frame_equal(pd.concat(chunks), expected)
+
+class TestParseMessageTimes(unittest.TestCase):
+    def test_epochs_match_str_time(self):
+        # 样例数据导出时所在时区为美国东部时间（含夏令时）
+        df = pd.read_csv(os.path.join(SAMPLES_DIR, 'full_data.csv'))
+        expected = pd.to_datetime(df['StrTime'], format='%Y-%m-%d %H:%M:%S')
+        actual = parse_message_times(df['StrTime'], df['CreateTime'], timezone='America/New_York')
+        self.assertTrue((actual == expected).all())
+
+    def test_time_zone_inferred_from_str_time(self):
+        # 在非导出时区（非 CST、非美东）的机器上运行，结果仍与导出的 StrTime 一致
+        expected = pd.to_datetime(pd.read_csv(os.path.join(SAMPLES_DIR, 'full_data.csv'))['StrTime'],
+                                  format='%Y-%m-%d %H:%M:%S')
+        try:
+            with patch.dict(os.environ, {'TZ': 'Europe/London'}):
+                time.tzset()
+                actual = load_and_preprocess_data(os.path.join(SAMPLES_DIR, 'full_data.csv'))['StrTime']
+        finally:
+            time.tzset()
+        self.assertEqual(actual.tolist(), expected.tolist())
+
+    def test_default_time_zone_without_str_time(self):
+        # 没有 StrTime 可供推断时（如 MSG 数据库）按中国标准时间转换，与运行机器无关
+        str_time = pd.Series([None, None])
+        create_time = pd.Series([1625124056, 1640995200], dtype='Int64')
+        actual = parse_message_times(str_time, create_time)
+        self.assertEqual(actual.tolist(), pd.to_datetime(['2021-07-01 15:20:56', '2022-01-01 08:00:00']).tolist())
+
+    def test_missing_epochs_fall_back_to_str_time(self):
+        str_time = pd.Series(['2021-07-01 03:20:56', '2021-07-01 23:41:04'])
+        create_time = pd.Series([1625124056, None], dtype='Int64')
+        actual = parse_message_times(str_time, create_time, timezone='America/New_York')
+        self.assertEqual(actual.tolist(), pd.to_datetime(str_time).tolist())
+
+class TestMergeCsvFiles(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_merge_overlapping_shards(self):
+        source = os.path.join(SAMPLES_DIR, 'full_data.csv')
+        df = pd.read_csv(source, dtype=str, keep_default_na=False)
+        shard1 = os.path.join(self.temp_dir, 'shard1.csv')
+        shard2 = os.path.join(self.temp_dir, 'shard2.csv')
+        df.iloc[3000:].to_csv(shard1, index=False)
+        df.iloc[:4000].to_csv(shard2, index=False)
+
+        output = os.path.join(self.temp_dir, 'merged.csv')
+        written, duplicates = merge_csv_files([shard1, shard2], output, key=('localId',), chunksize=700)
+        self.assertEqual((written, duplicates), (len(df), 1000))
+        with open(output, encoding='utf-8') as merged, open(source, encoding='utf-8') as original:
+            self.assertEqual(merged.read().rstrip("\n"), original.read().rstrip("\n"))
+
+    def test_merge_appended_runs_in_place(self):
+        # 样例结果由多次运行追加而成，包含重复且时间乱序的记录
+        output = shutil.copy(os.path.join(SAMPLES_DIR, 'api_output.csv'), self.temp_dir)
+        self.assertEqual(len(find_time_ordered_runs(output, chunksize=1000)), 3)
+
+        merge_csv_files([output], output, chunksize=1000)
+        df = pd.read_csv(output)
+        self.assertEqual(find_time_ordered_runs(output), [(0, len(df))])
+        self.assertFalse(df.duplicated(['StrTime', 'User', 'Text']).any())
+
+    def test_runs_are_read_from_their_byte_offsets(self):
+        # 消息中含有引号内的换行、逗号和引号时，仍按字节偏移找到每段的起点
+        path = os.path.join(self.temp_dir, 'appended.csv')
+        pd.DataFrame({
+            'StrTime': ['2024-01-02 00:00:00', '2024-01-03 00:00:00', '2024-01-01 00:00:00', '2024-01-04 00:00:00'],
+            'User': ['A', 'B', 'A', 'B'],
+            'Text': ['第一行\n第二行', '"引号"', 'a,b', 'c'],
+        }).to_csv(path, index=False)
+        self.assertEqual(find_time_ordered_runs(path), [(0, 2), (2, 4)])
+        offsets = find_row_offsets(path, [0, 2, 3], block_size=5)
+        with open(path, 'rb') as file:
+            content = file.read()
+        self.assertEqual([content[offset:offset + 10] for offset in offsets], [b'2024-01-02', b'2024-01-01', b'2024-01-04'])
+
+        output = os.path.join(self.temp_dir, 'merged.csv')
+        merge_csv_files([path], output, chunksize=1)
+        self.assertEqual(pd.read_csv(output)['Text'].tolist(), ['a,b', '第一行\n第二行', '"引号"', 'c'])
+
+if __name__ == "__main__":
+    unittest.main()
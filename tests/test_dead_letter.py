@@ -0,0 +1,94 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+import pandas as pd
+from chatanalyzer.dead_letter import get_dead_letter_path, read_dead_letters, replay_dead_letters
+from chatanalyzer.full_analysis import batch_request_api
+from chatanalyzer.sample_analysis import analyze_sample_data
+from chatanalyzer.sentiment_utils import failed_result
+
+SAMPLES_DIR = os.path.join(os.path.dirname(__file__), '..', 'samples')
+
+def fake_sentiment(client, text):
+    return {"Sentiment": 2, "Confidence": 0.9, "Positive_Prob": 0.95, "Negative_Prob": 0.05}
+
+def flaky_sentiment(client, text):
+    # 每三条消息中有一条在重试后仍然失败
+    if len(text) % 3 == 0:
+        return failed_result("server error (HTTP 503)")
+    return fake_sentiment(client, text)
+
+@patch("chatanalyzer.sentiment_backends.BaiduAuth")
+class TestDeadLetters(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        export = pd.read_csv(os.path.join(SAMPLES_DIR, 'full_data.csv'))
+        export = export[export['Type'] == 1].iloc[:300]
+        self.texts = export['StrContent'].tolist()
+        self.input_path = os.path.join(self.temp_dir, 'full_data.csv')
+        export.to_csv(self.input_path, index=False)
+        self.output_path = os.path.join(self.temp_dir, 'api_output.csv')
+        self.dead_letter_path = get_dead_letter_path(self.output_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_failed_messages_are_replayed(self, mock_auth):
+        failing = [text for text in self.texts if len(text) % 3 == 0]
+        with patch("chatanalyzer.sentiment_client.SentimentClient._request", autospec=True,
+                   side_effect=flaky_sentiment):
+            batch_request_api(self.input_path, self.output_path, batch_size=50)
+
+        # 失败的消息不写入结果，而是写入死信文件
+        results = pd.read_csv(self.output_path)
+        self.assertFalse(results['Text'].isin(failing).any())
+        self.assertEqual(len(results), len(self.texts) - len(failing))
+        dead_letters = read_dead_letters(self.dead_letter_path)
+        self.assertEqual(sorted(dead_letters['Text']), sorted(failing))
+        self.assertTrue((dead_letters['Error'] == "server error (HTTP 503)").all())
+
+        with patch("chatanalyzer.sentiment_client.SentimentClient._request", autospec=True,
+                   side_effect=fake_sentiment) as mock_sentiment:
+            replayed = replay_dead_letters(self.output_path, batch_size=20)
+        self.assertEqual({call.args[1] for call in mock_sentiment.call_args_list}, set(failing))
+        self.assertEqual(replayed, len(dead_letters))
+        self.assertEqual(len(pd.read_csv(self.output_path)), len(self.texts))
+        self.assertFalse(os.path.exists(self.dead_letter_path))
+
+    def test_messages_failing_again_stay_in_dead_letters(self, mock_auth):
+        with patch("chatanalyzer.sentiment_client.SentimentClient._request", autospec=True,
+                   side_effect=flaky_sentiment):
+            batch_request_api(self.input_path, self.output_path, batch_size=50)
+            dead_letters = read_dead_letters(self.dead_letter_path)
+            self.assertEqual(replay_dead_letters(self.output_path, batch_size=20), 0)
+        pd.testing.assert_frame_equal(read_dead_letters(self.dead_letter_path), dead_letters)
+
+    def test_full_run_clears_dead_letters(self, mock_auth):
+        with patch("chatanalyzer.sentiment_client.SentimentClient._request", autospec=True,
+                   side_effect=flaky_sentiment):
+            batch_request_api(self.input_path, self.output_path, batch_size=50)
+        with patch("chatanalyzer.sentiment_client.SentimentClient._request", autospec=True,
+                   side_effect=fake_sentiment):
+            batch_request_api(self.input_path, self.output_path, batch_size=50)
+        self.assertFalse(os.path.exists(self.dead_letter_path))
+        self.assertEqual(len(pd.read_csv(self.output_path)), len(self.texts))
+
+    def test_sample_mode_leaves_failed_messages_out(self, mock_auth):
+        sample_path = os.path.join(self.temp_dir, 'output_sample.csv')
+        with patch("chatanalyzer.sentiment_client.SentimentClient._request", autospec=True,
+                   side_effect=flaky_sentiment), patch('builtins.print') as mock_print:
+            analyze_sample_data(self.input_path, sample_path, sample_size=60)
+
+        # 抽样模式同样不把失败结果当作中性结果写入
+        results = pd.read_csv(sample_path)
+        self.assertFalse((results['Text'].str.len() % 3 == 0).any())
+        dead_letters = read_dead_letters(get_dead_letter_path(sample_path))
+        self.assertEqual(len(results) + len(dead_letters), 60)
+        self.assertGreater(len(dead_letters), 0)
+        self.assertTrue(any(f"{len(dead_letters)} of 60 sampled messages could not be scored" in str(call.args[0])
+                            for call in mock_print.call_args_list if call.args))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+import pandas as pd
+from chatanalyzer.cache import load_cached_results
+from chatanalyzer.data_preprocessing import preprocess_chat_data
+from chatanalyzer.full_analysis import batch_request_api
+
+SAMPLES_DIR = os.path.join(os.path.dirname(__file__), '..', 'samples')
+
+def fake_sentiment(client, text):
+    return {"Sentiment": 2, "Confidence": 0.9, "Positive_Prob": 0.95, "Negative_Prob": 0.05}
+
+@patch("chatanalyzer.sentiment_backends.BaiduAuth")
+@patch("chatanalyzer.sentiment_client.SentimentClient._request", autospec=True, side_effect=fake_sentiment)
+class TestBatchRequestApi(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        export = pd.read_csv(os.path.join(SAMPLES_DIR, 'full_data.csv'))
+        self.export = export[export['Type'] == 1]
+        self.input_path = os.path.join(self.temp_dir, 'full_data.csv')
+        self.output_path = os.path.join(self.temp_dir, 'api_output.csv')
+        self.watermark_path = os.path.join(self.temp_dir, 'watermarks.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def requested_texts(self, mock_sentiment):
+        return {call.args[1] for call in mock_sentiment.call_args_list}
+
+    def run_request(self, rows, **kwargs):
+        rows.to_csv(self.input_path, index=False)
+        batch_request_api(self.input_path, self.output_path, batch_size=50, chunksize=200,
+                          watermark_path=self.watermark_path, **kwargs)
+
+    def test_incremental_runs_only_score_new_messages(self, mock_sentiment, mock_auth):
+        self.run_request(self.export.iloc[:300])
+        self.assertEqual(self.requested_texts(mock_sentiment), set(self.export['StrContent'].iloc[:300]))
+
+        # 第二天的导出包含之前的全部消息以及新消息
+        mock_sentiment.reset_mock()
+        self.run_request(self.export.iloc[:450])
+        self.assertEqual(self.requested_texts(mock_sentiment), set(self.export['StrContent'].iloc[300:450]))
+
+        results = pd.read_csv(self.output_path)
+        self.assertEqual(results['Text'].tolist(), self.export['StrContent'].iloc[:450].tolist())
+
+        mock_sentiment.reset_mock()
+        self.run_request(self.export.iloc[:450])
+        self.assertEqual(mock_sentiment.call_count, 0)
+        self.assertEqual(len(pd.read_csv(self.output_path)), 450)
+
+    def test_daily_export_only_preprocesses_new_messages(self, mock_sentiment, mock_auth):
+        self.run_request(self.export.iloc[:300])
+
+        # 新的导出使缓存失效，旧消息在预处理前就被水位线过滤
+        with patch("chatanalyzer.data_preprocessing.preprocess_chat_data", wraps=preprocess_chat_data) as mock_preprocess:
+            self.run_request(self.export.iloc[:450])
+        self.assertEqual(sum(len(call.args[0]) for call in mock_preprocess.call_args_list), 150)
+        self.assertEqual(len(pd.read_csv(self.output_path)), 450)
+
+    def test_full_run_replaces_output(self, mock_sentiment, mock_auth):
+        self.run_request(self.export.iloc[:100])
+        mock_sentiment.reset_mock()
+        self.run_request(self.export.iloc[:200], incremental=False)
+        self.assertEqual(self.requested_texts(mock_sentiment), set(self.export['StrContent'].iloc[:200]))
+        self.assertEqual(len(pd.read_csv(self.output_path)), 200)
+
+    def test_sentiment_cache_is_shared_across_runs(self, mock_sentiment, mock_auth):
+        cache_path = os.path.join(self.temp_dir, 'sentiment_cache.sqlite')
+        self.run_request(self.export.iloc[:200], sentiment_cache_path=cache_path)
+        # 同一批次内重复的消息只请求一次
+        self.assertEqual(mock_sentiment.call_count, len(self.requested_texts(mock_sentiment)))
+
+        mock_sentiment.reset_mock()
+        self.run_request(self.export.iloc[:200], incremental=False, sentiment_cache_path=cache_path)
+        self.assertEqual(mock_sentiment.call_count, 0)
+        results = pd.read_csv(self.output_path)
+        self.assertEqual(len(results), 200)
+        self.assertTrue((results['Sentiment'] == 2).all())
+
+    def test_interrupted_run_resumes_after_last_completed_batch(self, mock_sentiment, mock_auth):
+        texts = self.export['StrContent'].iloc[:300]
+
+        # 第三个批次中首次出现的消息触发中断
+        crash_texts = set(texts.iloc[120:150]) - set(texts.iloc[:120])
+
+        def crash_on_late_message(client, text):
+            if text in crash_texts:
+                raise RuntimeError("connection lost")
+            return fake_sentiment(client, text)
+
+        mock_sentiment.side_effect = crash_on_late_message
+        with self.assertRaises(RuntimeError):
+            self.run_request(self.export.iloc[:300])
+        self.assertTrue(os.path.exists(self.output_path + '.checkpoint.json'))
+        # 模拟写了一半的批次
+        with open(self.output_path, 'a', encoding='utf-8') as file:
+            file.write('半条记录,2021-')
+
+        mock_sentiment.reset_mock()
+        mock_sentiment.side_effect = fake_sentiment
+        self.run_request(self.export.iloc[:300])
+
+        # 已完成的两个批次（100 条）不会再次请求
+        self.assertTrue(self.requested_texts(mock_sentiment).isdisjoint(set(texts.iloc[:100]) - set(texts.iloc[100:])))
+        results = pd.read_csv(self.output_path)
+        self.assertEqual(results['Text'].tolist(), texts.tolist())
+        self.assertFalse(os.path.exists(self.output_path + '.checkpoint.json'))
+        self.assertFalse(os.path.exists(self.output_path + '.checkpoint.keys'))
+
+    def test_arrow_output_matches_csv_output(self, mock_sentiment, mock_auth):
+        self.run_request(self.export.iloc[:120])
+
+        arrow_path = os.path.join(self.temp_dir, 'api_output.arrow')
+        export_path = os.path.join(self.temp_dir, 'exported.csv')
+        self.export.iloc[:120].to_csv(self.input_path, index=False)
+        batch_request_api(self.input_path, arrow_path, batch_size=50, chunksize=200,
+                          watermark_path=os.path.join(self.temp_dir, 'arrow_watermarks.json'),
+                          csv_export_path=export_path)
+
+        with open(self.output_path, encoding='utf-8') as expected, open(export_path, encoding='utf-8') as exported:
+            self.assertEqual(exported.read(), expected.read())
+        arrow_results = load_cached_results(arrow_path)
+        csv_results = load_cached_results(self.output_path)
+        # 时间精度单位不同（ns 与 us），数值相同
+        arrow_results['StrTime'] = arrow_results['StrTime'].astype(csv_results['StrTime'].dtype)
+        pd.testing.assert_frame_equal(arrow_results, csv_results)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import os
+import re
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+import pandas as pd
+from chatanalyzer.keyword_matcher import KeywordMatcher, count_keywords, read_keywords
+from chatanalyzer.schema import read_results_csv
+from chatanalyzer.sentiment_utils import count_specific_word
+
+SAMPLES_DIR = os.path.join(os.path.dirname(__file__), '..', 'samples')
+
+class TestKeywordMatcher(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.df = read_results_csv(os.path.join(SAMPLES_DIR, 'api_output.csv'))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_matcher_counts_like_str_count(self):
+        matcher = KeywordMatcher(['he', 'she', 'his', 'hers', '哈', '哈哈', 'a.b'])
+        counts = {matcher.keywords[keyword_id]: count for keyword_id, count in matcher.count('ushers hishe').items()}
+        self.assertEqual(counts, {'he': 2, 'she': 2, 'his': 1, 'hers': 1})
+        # 同一关键词不重叠计数，特殊字符按字面匹配
+        self.assertEqual(matcher.count('哈哈哈哈哈'), {4: 5, 5: 2})
+        self.assertEqual(matcher.count('a.b axb'), {6: 1})
+        with self.assertRaises(ValueError):
+            KeywordMatcher(['哈', ''])
+
+    def test_count_keywords_by_user_and_period(self):
+        keywords = ['哈', '哈哈', '好的', '我们', '?', '[', '不存在的词']
+        keyword_counts = count_keywords(self.df, keywords)
+        self.assertEqual(list(keyword_counts.columns), ['Keyword', 'User', 'Period', 'Count'])
+
+        df = self.df
+        months = df['StrTime'].dt.to_period('M')
+        for keyword in keywords:
+            expected = df['Text'].str.count(re.escape(keyword)).fillna(0).groupby([df['User'], months], observed=True).sum()
+            expected = expected[expected > 0]
+            actual = keyword_counts[keyword_counts['Keyword'] == keyword].set_index(['User', 'Period'])['Count']
+            self.assertEqual(actual.to_dict(), {(str(user), period): count for (user, period), count in expected.items()})
+
+        yearly = count_keywords(self.df, ['哈'], period='Y')
+        self.assertEqual(yearly['Count'].sum(), self.df['Text'].str.count('哈').sum())
+        expected_years = self.df.loc[self.df['Text'].str.contains('哈', na=False), 'StrTime'].dt.year.unique()
+        self.assertEqual(set(yearly['Period'].dt.year), set(expected_years))
+
+    def test_keywords_file_replaces_input(self):
+        keywords_path = os.path.join(self.temp_dir, 'keywords.txt')
+        with open(keywords_path, 'w', encoding='utf-8') as file:
+            file.write('哈\n\n好的\n哈\n晚安\n')
+        keywords = read_keywords(keywords_path)
+        self.assertEqual(keywords, ['哈', '好的', '晚安'])
+
+        with patch('builtins.input') as mock_input, patch('builtins.print'):
+            keyword_counts = count_specific_word(self.df, keywords=keywords)
+        mock_input.assert_not_called()
+        totals = keyword_counts.groupby('Keyword', observed=False)['Count'].sum()
+        self.assertEqual(totals['哈'], self.df['Text'].str.count('哈').sum())
+
+if __name__ == "__main__":
+    unittest.main()
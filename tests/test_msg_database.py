@@ -0,0 +1,55 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import pandas as pd
+from chatanalyzer.cache import iter_cached_preprocessed_data
+from chatanalyzer.data_preprocessing import load_and_preprocess_data
+from chatanalyzer.msg_database import is_msg_database, iter_msg_database
+
+SAMPLES_DIR = os.path.join(os.path.dirname(__file__), '..', 'samples')
+
+class TestMsgDatabase(unittest.TestCase):
+    def setUp(self):
+        # 用样例导出数据构造一个 MSG 数据库
+        self.temp_dir = tempfile.mkdtemp()
+        self.csv_path = os.path.join(SAMPLES_DIR, 'full_data.csv')
+        self.db_path = os.path.join(self.temp_dir, 'MSG0.db')
+        export = pd.read_csv(self.csv_path)
+        with sqlite3.connect(self.db_path) as connection:
+            export[['localId', 'TalkerId', 'Type', 'SubType', 'IsSender', 'CreateTime', 'StrContent']].assign(
+                StrTalker='wxid_bw1xnecir2p22'
+            ).to_sql('MSG', connection, index=False)
+        connection.close()
+        self.user_names = {1: 'R', 0: 'Matteo'}
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_matches_csv_export(self):
+        expected = load_and_preprocess_data(self.csv_path, timezone='America/New_York')
+        chunks = list(iter_msg_database(self.db_path, user_names=self.user_names, chunksize=1000,
+                                        timezone='America/New_York'))
+        self.assertGreater(len(chunks), 1)
+        actual = pd.concat(chunks, ignore_index=True)
+        pd.testing.assert_frame_equal(actual, expected, check_dtype=False, check_categorical=False)
+
+    def test_filters(self):
+        df = pd.concat(iter_msg_database(self.db_path, types=[1], start_time='2022-01-01', end_time='2022-02-01',
+                                         timezone='America/New_York'))
+        self.assertTrue((df['StrTime'] >= '2022-01-01').all())
+        self.assertTrue((df['StrTime'] < '2022-02-01').all())
+        self.assertEqual(set(df['MessageType']), {'text'})
+        self.assertEqual(set(df['User']), {'Me', 'wxid_bw1xnecir2p22'})
+        self.assertEqual(len(list(iter_msg_database(self.db_path, talker_id=-1))), 0)
+
+    def test_cached_loader_reads_database(self):
+        self.assertTrue(is_msg_database(self.db_path))
+        self.assertFalse(is_msg_database(self.csv_path))
+        df = pd.concat(iter_cached_preprocessed_data(self.db_path))
+        self.assertEqual(len(df), len(load_and_preprocess_data(self.csv_path)))
+        self.assertFalse(os.path.exists(os.path.join(self.temp_dir, '.chatanalyzer_cache')))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import os
+import shutil
+import tempfile
+import unittest
+import pandas as pd
+from chatanalyzer.result_writer import ResultWriter, export_results_csv
+from chatanalyzer.schema import read_results_arrow
+
+def make_results(texts):
+    return pd.DataFrame({
+        "Text": texts,
+        "StrTime": pd.date_range('2021-07-01 12:00:00', periods=len(texts), freq='min'),
+        "User": ['R'] * len(texts),
+        "MessageType": ['text'] * len(texts),
+        "Sentiment": [2] * len(texts),
+        "Confidence": [0.9] * len(texts),
+        "Positive_Prob": [0.95] * len(texts),
+        "Negative_Prob": [0.05] * len(texts),
+    })
+
+class TestResultWriter(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.arrow_path = os.path.join(self.temp_dir, 'api_output.arrow')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_arrow_batches_are_appended_across_runs(self):
+        sizes = []
+        writer = ResultWriter(self.arrow_path)
+        writer.write(make_results(['哈哈', '好的']), sizes.append)
+        writer.write(None, sizes.append)
+        writer.close()
+
+        # 增量运行追加到同一个文件
+        writer = ResultWriter(self.arrow_path, append=True)
+        writer.write(make_results(['嗯嗯']), sizes.append)
+        writer.close()
+
+        self.assertEqual(sizes[0], sizes[1])
+        self.assertEqual(sizes[2], os.path.getsize(self.arrow_path))
+        results = read_results_arrow(self.arrow_path)
+        self.assertEqual(results['Text'].tolist(), ['哈哈', '好的', '嗯嗯'])
+        self.assertEqual(str(results['Sentiment'].dtype), 'Int8')
+
+    def test_export_matches_csv_writer(self):
+        csv_path = os.path.join(self.temp_dir, 'api_output.csv')
+        for path in (self.arrow_path, csv_path):
+            writer = ResultWriter(path)
+            writer.write(make_results(['哈哈', '好的']))
+            writer.write(make_results(['嗯嗯']))
+            writer.close()
+
+        export_path = os.path.join(self.temp_dir, 'exported.csv')
+        self.assertEqual(export_results_csv(self.arrow_path, export_path), 3)
+        with open(csv_path, encoding='utf-8') as expected, open(export_path, encoding='utf-8') as exported:
+            self.assertEqual(exported.read(), expected.read())
+
+    def test_write_errors_are_raised_in_caller(self):
+        writer = ResultWriter(os.path.join(self.temp_dir, 'missing', 'api_output.arrow'))
+        writer.write(make_results(['哈哈']))
+        with self.assertRaises(FileNotFoundError):
+            writer.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import os
+import shutil
+import tempfile
+import unittest
+import warnings
+from unittest.mock import patch
+import pandas as pd
+from chatanalyzer.cache import load_cached_results
+from chatanalyzer.sample_analysis import generate_summary_report
+from chatanalyzer.schema import MESSAGE_TYPE_DTYPE, apply_schema, read_results_csv
+
+SAMPLES_DIR = os.path.join(os.path.dirname(__file__), '..', 'samples')
+
+class TestSchema(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.results_path = shutil.copy(os.path.join(SAMPLES_DIR, 'api_output.csv'), self.temp_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def assert_compact(self, df):
+        self.assertIsInstance(df['User'].dtype, pd.CategoricalDtype)
+        self.assertEqual(df['MessageType'].dtype, MESSAGE_TYPE_DTYPE)
+        self.assertEqual(df['Sentiment'].dtype, 'Int8')
+        self.assertEqual(df['Positive_Prob'].dtype, 'float32')
+
+    def test_csv_round_trip(self):
+        df = read_results_csv(self.results_path)
+        self.assert_compact(df)
+
+        # 写回 CSV 再读取，类型保持不变
+        output_path = os.path.join(self.temp_dir, 'round_trip.csv')
+        df.to_csv(output_path, index=False)
+        pd.testing.assert_frame_equal(read_results_csv(output_path), df)
+
+    def test_cache_round_trip(self):
+        built = load_cached_results(self.results_path)
+        cached = load_cached_results(self.results_path)
+        self.assert_compact(cached)
+        pd.testing.assert_frame_equal(cached, built, check_index_type=False)
+
+    def test_apply_schema_skips_missing_columns(self):
+        df = apply_schema(pd.DataFrame({'User': ['R', 'Matteo', 'R']}))
+        self.assertEqual(list(df.columns), ['User'])
+        self.assertEqual(df['User'].cat.categories.tolist(), ['Matteo', 'R'])
+
+    def test_summary_report_leaves_out_unobserved_users(self):
+        # 分类列中没有消息的用户不出现在摘要中，也不产生 FutureWarning
+        df = read_results_csv(self.results_path).head(200)
+        df['User'] = df['User'].cat.add_categories(['Nobody'])
+        with warnings.catch_warnings(), patch('builtins.print') as mock_print:
+            warnings.simplefilter('error')
+            generate_summary_report(df, 1000, len(df))
+        self.assertNotIn('Nobody', mock_print.call_args.args[0])
+
+if __name__ == "__main__":
+    unittest.main()
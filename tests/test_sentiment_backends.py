@@ -0,0 +1,70 @@
+import os
+import shutil
+import tempfile
+import unittest
+import pandas as pd
+from chatanalyzer.data_preprocessing import load_and_preprocess_data
+from chatanalyzer.full_analysis import batch_request_api
+from chatanalyzer.result_writer import read_result_backends
+from chatanalyzer.sentiment_backends import LexiconSentimentBackend, create_sentiment_backend
+from chatanalyzer.sentiment_model import load_training_data
+
+SAMPLES_DIR = os.path.join(os.path.dirname(__file__), '..', 'samples')
+
+class TestLexiconSentimentBackend(unittest.TestCase):
+    def setUp(self):
+        self.backend = LexiconSentimentBackend()
+
+    def test_sentiment_of_simple_messages(self):
+        texts = ['今天好开心[呲牙]', '烦死了，好累', '我明天去上班', '不开心', '不难过', '   ']
+        results = self.backend.analyze_many(texts)
+
+        self.assertEqual([result['Sentiment'] for result in results[:5]], [2, 0, 1, 0, 1])
+        # 空白消息与 API 一样返回 None
+        self.assertIsNone(results[5])
+        for result in results[:5]:
+            self.assertEqual(set(result), {'Sentiment', 'Confidence', 'Positive_Prob', 'Negative_Prob'})
+            self.assertAlmostEqual(result['Positive_Prob'] + result['Negative_Prob'], 1)
+            self.assertAlmostEqual(result['Confidence'], abs(result['Positive_Prob'] - result['Negative_Prob']))
+
+    def test_score_keeps_order_of_repeated_texts(self):
+        texts = ['哈哈', '难过', '哈哈', '难过', '哈哈']
+        scores = self.backend.score(texts)
+        self.assertEqual(scores['Sentiment'].tolist(), [2, 0, 2, 0, 2])
+
+    def test_custom_lexicon(self):
+        backend = LexiconSentimentBackend(positive_words=['绝了'], negative_words=['寄了'])
+        results = backend.analyze_many(['这家店绝了', '考试寄了', '好开心'])
+        self.assertEqual([result['Sentiment'] for result in results], [2, 0, 1])
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            create_sentiment_backend('unknown')
+
+class TestOfflineRequest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_request_mode_with_lexicon_backend(self):
+        input_path = shutil.copy(os.path.join(SAMPLES_DIR, 'full_data.csv'), self.temp_dir)
+        output_path = os.path.join(self.temp_dir, 'api_output.csv')
+        batch_request_api(input_path, output_path, batch_size=1000, backend='lexicon')
+
+        results = pd.read_csv(output_path)
+        chat = load_and_preprocess_data(input_path)
+        texts = chat.loc[chat['MessageType'] == 'text', 'StrContent']
+        self.assertEqual(len(results), (texts.str.strip() != '').sum())
+        self.assertEqual(list(results.columns), ['Text', 'StrTime', 'User', 'MessageType', 'Sentiment',
+                                                 'Confidence', 'Positive_Prob', 'Negative_Prob'])
+        self.assertTrue(results['Sentiment'].isin([0, 1, 2]).all())
+
+        # 记录结果来自词典后端，不能用于训练
+        self.assertEqual(read_result_backends(output_path), ['lexicon'])
+        with self.assertRaises(ValueError):
+            load_training_data(output_path)
+
+if __name__ == "__main__":
+    unittest.main()
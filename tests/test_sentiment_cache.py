@@ -0,0 +1,69 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from chatanalyzer.sentiment_cache import SentimentCache, normalize_text, text_key
+
+def make_result(sentiment):
+    return {"Sentiment": sentiment, "Confidence": 0.5, "Positive_Prob": 0.25, "Negative_Prob": 0.75}
+
+class TestSentimentCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, 'sentiment_cache.sqlite')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_normalized_texts_share_a_key(self):
+        # 全角与半角、多余空白视为同一条消息
+        self.assertEqual(normalize_text('  好的！\n\n ok  '), '好的! ok')
+        self.assertEqual(text_key('哈哈 哈'), text_key(' 哈哈\t哈 '))
+        self.assertNotEqual(text_key('哈哈'), text_key('哈哈哈'))
+
+    def test_results_persist_across_connections(self):
+        with SentimentCache(self.db_path) as cache:
+            cache.put_many({text_key('好的'): make_result(2), text_key('嗯嗯'): make_result(1)})
+
+        with SentimentCache(self.db_path) as cache:
+            found = cache.get_many([text_key('好的'), text_key('嗯嗯'), text_key('不存在')])
+        self.assertEqual(found, {text_key('好的'): make_result(2), text_key('嗯嗯'): make_result(1)})
+
+    def test_least_recently_used_entries_are_evicted(self):
+        with SentimentCache(self.db_path, max_entries=10) as cache:
+            cache.put_many({text_key(f'消息{i}'): make_result(1) for i in range(10)})
+            cache.get_many([text_key('消息0')])
+            cache.put_many({text_key('新消息'): make_result(2)})
+
+            self.assertEqual(len(cache), 9)
+            found = cache.get_many([text_key(f'消息{i}') for i in range(10)] + [text_key('新消息')])
+        # 最近使用过的和新写入的保留，其余最旧的两条被删除
+        self.assertIn(text_key('消息0'), found)
+        self.assertIn(text_key('新消息'), found)
+        self.assertEqual(len(found), 9)
+
+    def test_entry_count_is_kept_without_counting(self):
+        # 旧版本的缓存没有计数表，打开时统计一次
+        connection = sqlite3.connect(self.db_path)
+        connection.execute("CREATE TABLE sentiment (key BLOB PRIMARY KEY, sentiment INTEGER, confidence REAL, "
+                           "positive_prob REAL, negative_prob REAL, last_used REAL)")
+        connection.execute("INSERT INTO sentiment VALUES (?, 1, 0.5, 0.25, 0.75, 0)", (text_key('旧消息'),))
+        connection.commit()
+        connection.close()
+
+        with SentimentCache(self.db_path, max_entries=10) as cache:
+            statements = []
+            cache.connection.set_trace_callback(statements.append)
+            cache.put_many({text_key('好的'): make_result(2), text_key('旧消息'): make_result(0)})
+            cache.put_many({text_key('好的'): make_result(1)})
+            self.assertFalse([statement for statement in statements if 'COUNT(*)' in statement])
+            self.assertEqual(len(cache), 2)
+            self.assertEqual(cache.get_many([text_key('旧消息')])[text_key('旧消息')], make_result(0))
+
+            cache.put_many({text_key(f'消息{i}'): make_result(1) for i in range(10)})
+            self.assertEqual(len(cache), 9)
+            self.assertEqual(cache.connection.execute("SELECT COUNT(*) FROM sentiment").fetchone()[0], 9)
+
+if __name__ == "__main__":
+    unittest.main()
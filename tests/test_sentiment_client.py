@@ -0,0 +1,350 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from collections import Counter
+from chatanalyzer.sentiment_cache import SentimentCache
+from chatanalyzer.sentiment_client import CircuitBreaker, Credential, CredentialPool, SentimentClient, TokenBucket
+from chatanalyzer.sentiment_utils import analyze_sentiment
+from chatanalyzer.telemetry import Telemetry
+
+class MockSentimentHandler(BaseHTTPRequestHandler):
+    """
+    Answer like the sentiment endpoint, slower for shorter texts so that responses arrive out of order.
+    The first `throttle` requests are rejected with the API's QPS limit error,
+    and the first `server_errors` requests with HTTP 503.
+    """
+    lock = threading.Lock()
+    in_flight = 0
+    max_in_flight = 0
+    throttle = 0
+    server_errors = 0
+    requests_seen = 0
+    # When set, requests with another access token are rejected as expired
+    valid_token = None
+    tokens_seen = []
+    # Keys always throttled, and keys whose daily quota is used up
+    throttled_tokens = set()
+    exhausted_tokens = set()
+
+    def do_POST(self):
+        cls = type(self)
+        with cls.lock:
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+            cls.requests_seen += 1
+            throttled = cls.requests_seen <= cls.throttle
+            unavailable = cls.requests_seen <= cls.server_errors
+            token = parse_qs(urlparse(self.path).query).get("access_token", [None])[0]
+            cls.tokens_seen.append(token)
+        text = json.loads(self.rfile.read(int(self.headers['Content-Length'])))['text']
+        time.sleep(0.05 / len(text))
+        if throttled:
+            body = json.dumps({"error_code": 18, "error_msg": "Open api qps request limit reached"}).encode()
+        elif cls.valid_token is not None and token != cls.valid_token:
+            body = json.dumps({"error_code": 111, "error_msg": "Access token expired"}).encode()
+        elif token in cls.throttled_tokens:
+            body = json.dumps({"error_code": 18, "error_msg": "Open api qps request limit reached"}).encode()
+        elif token in cls.exhausted_tokens:
+            body = json.dumps({"error_code": 17, "error_msg": "Open api daily request limit reached"}).encode()
+        else:
+            body = json.dumps({"items": [{"sentiment": len(text) % 3, "confidence": 0.5,
+                                          "positive_prob": len(text) / 100, "negative_prob": 0.1}]}).encode()
+        with cls.lock:
+            cls.in_flight -= 1
+        self.send_response(503 if unavailable else 200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class TestSentimentClient(unittest.TestCase):
+    def setUp(self):
+        MockSentimentHandler.in_flight = MockSentimentHandler.max_in_flight = 0
+        MockSentimentHandler.throttle = MockSentimentHandler.requests_seen = 0
+        MockSentimentHandler.server_errors = 0
+        MockSentimentHandler.valid_token = None
+        MockSentimentHandler.tokens_seen = []
+        MockSentimentHandler.throttled_tokens = set()
+        MockSentimentHandler.exhausted_tokens = set()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), MockSentimentHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/sentiment"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_results_keep_order_of_texts(self):
+        texts = ['哈' * length for length in range(1, 41)] + ['  ']
+        with SentimentClient("token", url=self.url, concurrency=8) as client:
+            results = client.analyze_many(texts)
+
+        self.assertEqual(len(results), len(texts))
+        for text, result in zip(texts[:-1], results):
+            self.assertEqual(result['Sentiment'], len(text) % 3)
+            self.assertAlmostEqual(result['Positive_Prob'], len(text) / 100)
+        # 空白消息不发送请求
+        self.assertIsNone(results[-1])
+
+    def test_concurrency_is_bounded(self):
+        with SentimentClient("token", url=self.url, concurrency=4) as client:
+            client.analyze_many([f'好{i}' for i in range(30)])
+        self.assertGreater(MockSentimentHandler.max_in_flight, 1)
+        self.assertLessEqual(MockSentimentHandler.max_in_flight, 4)
+
+    def test_works_inside_running_event_loop(self):
+        # 在 Jupyter 等已有事件循环的环境中调用同步接口
+        async def run(client):
+            return client.analyze_many(['好', '很好']), client.analyze('好的'), await client.analyze_many_async(['好'])
+
+        with SentimentClient("token", url=self.url) as client:
+            many, one, awaited = asyncio.run(run(client))
+        self.assertEqual([result['Sentiment'] for result in many], [1, 2])
+        self.assertEqual(one['Sentiment'], 2)
+        self.assertEqual(awaited[0]['Sentiment'], 1)
+
+    def test_unreachable_endpoint_falls_back_to_neutral(self):
+        self.server.shutdown()
+        self.server.server_close()
+        with SentimentClient("token", url=self.url, retries=1, timeout=1) as client:
+            result = client.analyze('你好')
+        # 仍为中性结果，但带有失败原因，不会被当作 API 的中性回答
+        self.assertEqual(result, {"Sentiment": 1, "Confidence": 0.0, "Positive_Prob": 0.0, "Negative_Prob": 0.0,
+                                  "Error": "network error (ConnectionError)"})
+
+    def test_throttled_requests_are_retried(self):
+        MockSentimentHandler.throttle = 2
+        with SentimentClient("token", url=self.url, retries=3) as client:
+            result = client.analyze('哈哈')
+        self.assertEqual(result['Sentiment'], 2)
+        self.assertEqual(client.throttled_count, 2)
+
+    def test_analyze_sentiment_uses_the_client(self):
+        # 单条分析与客户端一致：限流错误码也会重试
+        MockSentimentHandler.throttle = 1
+        result = analyze_sentiment("token", '哈哈', url=self.url)
+        self.assertEqual(result['Sentiment'], 2)
+        self.assertEqual(MockSentimentHandler.requests_seen, 2)
+        self.assertIsNone(analyze_sentiment("token", '  ', url=self.url))
+
+    def test_analyze_sentiment_checks_the_cache_first(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache_path = os.path.join(temp_dir, 'sentiment_cache.sqlite')
+            first = analyze_sentiment("token", '哈哈', url=self.url, cache_path=cache_path)
+            second = analyze_sentiment("token", '哈哈', url=self.url, cache_path=cache_path)
+        self.assertEqual(first, second)
+        self.assertEqual(MockSentimentHandler.requests_seen, 1)
+
+    def test_server_errors_are_retried_with_backoff(self):
+        MockSentimentHandler.server_errors = 2
+        with SentimentClient("token", url=self.url, retries=3, backoff=0.01) as client:
+            result = client.analyze('哈哈')
+        self.assertEqual(result['Sentiment'], 2)
+        self.assertEqual(MockSentimentHandler.requests_seen, 3)
+
+    def test_failed_results_are_not_cached(self):
+        MockSentimentHandler.server_errors = 1
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache = SentimentCache(os.path.join(temp_dir, 'cache.sqlite'))
+            with SentimentClient("token", url=self.url, retries=1, cache=cache) as client:
+                self.assertEqual(client.analyze('哈哈')['Error'], "HTTP status 503")
+                # 失败的结果不缓存，下次会重新请求
+                self.assertEqual(client.analyze('哈哈')['Sentiment'], 2)
+                self.assertEqual(client.analyze('哈哈')['Sentiment'], 2)
+        self.assertEqual(MockSentimentHandler.requests_seen, 2)
+
+    def test_requests_are_recorded_in_telemetry(self):
+        MockSentimentHandler.throttle = 2
+        telemetry = Telemetry()
+        with SentimentClient("token", url=self.url, retries=3, telemetry=telemetry) as client:
+            client.analyze_many(['哈哈', '哈哈', '   '])
+        summary = telemetry.summary()
+        self.assertEqual(summary["requests"]["by_outcome"], {"throttled": 2, "ok": 1})
+        self.assertEqual(summary["requests"]["by_status"], {"200": 3})
+        self.assertEqual(summary["requests"]["retries"], 2)
+        self.assertEqual(summary["latency_seconds"]["count"], 3)
+        self.assertEqual((summary["cache"]["hits"], summary["cache"]["misses"]), (1, 1))
+
+    def test_rate_limit(self):
+        with SentimentClient("token", url=self.url, qps=20, concurrency=8) as client:
+            start = time.perf_counter()
+            client.analyze_many(['哈' * 50 + str(i) for i in range(11)])
+            elapsed = time.perf_counter() - start
+        # 第一个请求立即发送，其余 10 个按 20 QPS 间隔 0.05 秒
+        self.assertGreaterEqual(elapsed, 0.5)
+
+    def test_repeated_texts_are_requested_once(self):
+        with SentimentClient("token", url=self.url) as client:
+            results = client.analyze_many(['哈哈', '好的', ' 哈哈 ', '哈哈', '   '])
+        self.assertEqual(MockSentimentHandler.requests_seen, 2)
+        self.assertEqual(results[0], results[2])
+        self.assertEqual((client.cache_hits, client.cache_misses), (2, 2))
+
+    def test_expired_token_is_refreshed_once(self):
+        MockSentimentHandler.valid_token = "new_token"
+        auth = FakeAuth("expired_token")
+        with SentimentClient(auth.access_token, url=self.url, concurrency=8, auth=auth) as client:
+            results = client.analyze_many([f'好{i}' for i in range(20)])
+        # 令牌过期后只刷新一次，所有消息都用新令牌重试成功
+        self.assertEqual(auth.refreshes, ["expired_token"])
+        self.assertTrue(all(result['Confidence'] == 0.5 for result in results))
+        self.assertEqual(client.failed_count, 0)
+        self.assertTrue(auth.stopped)
+
+    def test_rejected_token_without_auth_is_not_cached(self):
+        MockSentimentHandler.valid_token = "new_token"
+        with SentimentClient("expired_token", url=self.url) as client:
+            result = client.analyze('你好')
+        self.assertEqual(result['Error'], "API error 111: Access token expired")
+        self.assertEqual(client.failed_count, 1)
+        self.assertEqual(MockSentimentHandler.requests_seen, 1)
+
+    def test_pool_spreads_requests_over_keys(self):
+        pool = CredentialPool([Credential(token, name=token) for token in ['a', 'b', 'c']])
+        with SentimentClient(url=self.url, concurrency=6, credentials=pool) as client:
+            results = client.analyze_many([f'好{i}' for i in range(30)])
+        self.assertTrue(all(result['Confidence'] == 0.5 for result in results))
+        counts = Counter(MockSentimentHandler.tokens_seen)
+        self.assertEqual(set(counts), {'a', 'b', 'c'})
+        self.assertTrue(all(count >= 5 for count in counts.values()))
+
+    def test_pool_rate_limits_each_key(self):
+        pool = CredentialPool([Credential(token, qps=20, name=token) for token in ['a', 'b']])
+        with SentimentClient(url=self.url, concurrency=8, credentials=pool) as client:
+            start = time.perf_counter()
+            client.analyze_many(['哈' * 50 + str(i) for i in range(22)])
+            elapsed = time.perf_counter() - start
+        # 两个密钥各 20 QPS：22 个请求约需 0.5 秒，而单个密钥需要 1 秒
+        self.assertGreaterEqual(elapsed, 0.5)
+        self.assertLess(elapsed, 0.95)
+        self.assertEqual(Counter(MockSentimentHandler.tokens_seen), {'a': 11, 'b': 11})
+
+    def test_throttled_key_is_left_out(self):
+        MockSentimentHandler.throttled_tokens = {'a'}
+        pool = CredentialPool([Credential(token, name=token) for token in ['a', 'b']], cooldown=60)
+        with SentimentClient(url=self.url, concurrency=4, credentials=pool) as client:
+            results = client.analyze_many([f'好{i}' for i in range(40)])
+        self.assertTrue(all(result['Confidence'] == 0.5 for result in results))
+        # 被限流的密钥在冷却期间不再使用
+        self.assertLessEqual(MockSentimentHandler.tokens_seen.count('a'), 4)
+        self.assertGreaterEqual(pool.credentials[0].throttled_count, 1)
+        self.assertIsNone(pool.credentials[0].disabled)
+
+    def test_exhausted_key_is_removed(self):
+        MockSentimentHandler.exhausted_tokens = {'a'}
+        pool = CredentialPool([Credential(token, name=token) for token in ['a', 'b']])
+        with SentimentClient(url=self.url, concurrency=4, credentials=pool) as client:
+            results = client.analyze_many([f'好{i}' for i in range(20)])
+            self.assertTrue(all(result['Confidence'] == 0.5 for result in results))
+            self.assertIn('daily request limit', pool.credentials[0].disabled)
+
+            # 所有密钥都不可用时报错，而不是返回中性结果
+            MockSentimentHandler.exhausted_tokens = {'a', 'b'}
+            with self.assertRaises(ValueError):
+                client.analyze_many(['新消息'])
+
+class FakeAuth:
+    """
+    Stand-in for BaiduAuth, handing out 'new_token' when the stale token is refreshed.
+    """
+    def __init__(self, access_token):
+        self.access_token = access_token
+        self.refreshes = []
+        self.stopped = False
+
+    def refresh_access_token(self, stale_token=None):
+        if self.access_token == stale_token:
+            self.refreshes.append(stale_token)
+            self.access_token = "new_token"
+        return self.access_token
+
+    def stop_background_refresh(self):
+        self.stopped = True
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_opens_when_most_requests_fail(self):
+        breaker = CircuitBreaker(window=10, min_requests=4, pause=0.1)
+        self.assertFalse(breaker.wait())
+        for success in (True, False, True):
+            self.assertFalse(breaker.record(success))
+        self.assertTrue(breaker.record(False))
+        self.assertEqual(breaker.opened_count, 1)
+
+        # 暂停期间只放行一个探测请求，之前发出的请求的结果不再计入
+        start = time.monotonic()
+        self.assertTrue(breaker.wait())
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+        self.assertFalse(breaker.record(False))
+        breaker.record(True, probe=True)
+        self.assertFalse(breaker.wait())
+
+    def test_failed_probe_doubles_pause(self):
+        breaker = CircuitBreaker(window=10, min_requests=2, pause=0.05, max_pause=0.15)
+        breaker.record(False)
+        breaker.record(False)
+        for expected in (0.1, 0.15):
+            self.assertTrue(breaker.wait())
+            self.assertTrue(breaker.record(False, probe=True))
+            self.assertAlmostEqual(breaker.current_pause, expected)
+        self.assertEqual(breaker.opened_count, 3)
+
+    def test_probe_waits_for_other_requests(self):
+        breaker = CircuitBreaker(window=10, min_requests=2, pause=0.01)
+        breaker.record(False)
+        breaker.record(False)
+        self.assertTrue(breaker.wait())
+        waiter = threading.Thread(target=breaker.wait)
+        waiter.start()
+        waiter.join(0.1)
+        self.assertTrue(waiter.is_alive())
+        breaker.record(True, probe=True)
+        waiter.join(1)
+        self.assertFalse(waiter.is_alive())
+
+    def test_probe_released_when_no_key_is_left(self):
+        # 探测请求因没有可用密钥而失败时，释放探测名额，其他请求不会永久等待
+        breaker = CircuitBreaker(window=10, min_requests=2, pause=0.01)
+        breaker.record(False)
+        breaker.record(False)
+        credential = Credential("token")
+        credential.disabled = "quota exhausted"
+        client = SentimentClient(credentials=CredentialPool([credential]), breaker=breaker, retries=1)
+        with self.assertRaisesRegex(ValueError, "No usable API key left"):
+            client._request('你好')
+        waiter = threading.Thread(target=breaker.wait, daemon=True)
+        waiter.start()
+        waiter.join(1)
+        self.assertFalse(waiter.is_alive())
+        client.close()
+
+class TestTokenBucket(unittest.TestCase):
+    def test_acquire_spaces_calls_at_rate(self):
+        bucket = TokenBucket(rate=100)
+        start = time.perf_counter()
+        for _ in range(21):
+            bucket.acquire()
+        self.assertGreaterEqual(time.perf_counter() - start, 0.2)
+
+    def test_reserve_and_delay(self):
+        bucket = TokenBucket(rate=10)
+        self.assertEqual(bucket.delay(), 0)
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertAlmostEqual(bucket.delay(), 0.1, delta=0.01)
+        self.assertAlmostEqual(bucket.reserve(), 0.1, delta=0.01)
+        self.assertAlmostEqual(bucket.reserve(), 0.2, delta=0.01)
+
+    def test_rate_must_be_positive(self):
+        with self.assertRaises(ValueError):
+            TokenBucket(rate=0)
+
+if __name__ == "__main__":
+    unittest.main()
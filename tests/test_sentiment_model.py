@@ -0,0 +1,118 @@
+import os
+import shutil
+import tempfile
+import unittest
+import pandas as pd
+from chatanalyzer.data_preprocessing import load_and_preprocess_data
+from chatanalyzer.result_writer import read_result_backends, record_result_backend
+from chatanalyzer.sentiment_backends import HybridSentimentBackend, LexiconSentimentBackend
+from chatanalyzer.sentiment_client import SentimentBackend
+from chatanalyzer.sentiment_model import DistilledSentimentBackend, load_training_data, train_sentiment_model
+
+SAMPLES_DIR = os.path.join(os.path.dirname(__file__), '..', 'samples')
+
+class RecordingBackend(SentimentBackend):
+    """
+    Stand-in for the API, answering every text as positive and recording what it was asked.
+    """
+    name = "recording"
+
+    def __init__(self):
+        self.texts = []
+
+    def analyze_many(self, texts):
+        self.texts.extend(texts)
+        return [{'Sentiment': 2, 'Confidence': 1.0, 'Positive_Prob': 1.0, 'Negative_Prob': 0.0} for _ in texts]
+
+class TestSentimentModel(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.temp_dir = tempfile.mkdtemp()
+        # 用词典后端的结果代替 API 标注，训练本地模型
+        chat = load_and_preprocess_data(os.path.join(SAMPLES_DIR, 'full_data.csv'))
+        texts = chat.loc[chat['MessageType'] == 'text', 'StrContent']
+        cls.texts = texts[texts.str.strip() != ''].tolist()
+        results = pd.DataFrame(LexiconSentimentBackend().analyze_many(cls.texts))
+        results.insert(0, 'Text', cls.texts)
+        results.insert(1, 'StrTime', '2024-01-01 00:00:00')
+        results.insert(2, 'User', 'User1')
+        results.insert(3, 'MessageType', 'text')
+        cls.results_path = os.path.join(cls.temp_dir, 'api_output.csv')
+        results.to_csv(cls.results_path, index=False)
+        cls.model_path = os.path.join(cls.temp_dir, 'sentiment_model.joblib')
+        cls.report = train_sentiment_model(cls.results_path, cls.model_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.temp_dir)
+
+    def test_report(self):
+        self.assertTrue(os.path.exists(self.model_path))
+        self.assertEqual(list(self.report.columns),
+                         ['Threshold', 'Local_Share', 'API_Share', 'Local_Agreement', 'Hybrid_Agreement'])
+        # 阈值越高，交给 API 的消息越多，整体一致率也越高
+        self.assertTrue(self.report['API_Share'].is_monotonic_increasing)
+        self.assertTrue(self.report['Hybrid_Agreement'].is_monotonic_increasing)
+        self.assertGreater(self.report['Hybrid_Agreement'].iloc[0], 0.7)
+
+    def test_failed_requests_are_not_trained_on(self):
+        path = os.path.join(self.temp_dir, 'failed.csv')
+        pd.DataFrame({
+            'Text': ['好', '好', '坏', '失败', '  '], 'StrTime': '2024-01-01 00:00:00', 'User': 'User1',
+            'MessageType': 'text', 'Sentiment': [1, 2, 0, 1, 2], 'Confidence': [0.5, 0.9, 0.9, 0.0, 0.9],
+            'Positive_Prob': [0.5, 0.9, 0.1, 0.0, 0.9], 'Negative_Prob': [0.5, 0.1, 0.9, 0.0, 0.1],
+        }).to_csv(path, index=False)
+        data = load_training_data(path)
+        self.assertEqual(data['Text'].tolist(), ['好', '坏'])
+        self.assertEqual(data['Sentiment'].tolist(), [2, 0])
+
+    def test_only_api_results_are_trained_on(self):
+        path = os.path.join(self.temp_dir, 'labelled.csv')
+        shutil.copy(self.results_path, path)
+        record_result_backend(path, 'baidu')
+        self.assertEqual(len(load_training_data(path)), len(load_training_data(self.results_path)))
+
+        # 混入词典或混合后端的结果时拒绝训练
+        record_result_backend(path, 'hybrid', append=True)
+        self.assertEqual(read_result_backends(path), ['baidu', 'hybrid'])
+        with self.assertRaises(ValueError):
+            train_sentiment_model(path, os.path.join(self.temp_dir, 'mixed.joblib'))
+        record_result_backend(path, 'lexicon')
+        with self.assertRaises(ValueError):
+            load_training_data(path)
+
+    def test_distilled_backend(self):
+        backend = DistilledSentimentBackend(self.model_path)
+        results = backend.analyze_many(self.texts[:200] + [' '])
+        self.assertIsNone(results[-1])
+        expected = LexiconSentimentBackend().analyze_many(self.texts[:200])
+        agreement = sum(result['Sentiment'] == lexicon['Sentiment'] for result, lexicon in zip(results, expected)) / 200
+        self.assertGreater(agreement, 0.8)
+        for result in results[:-1]:
+            self.assertAlmostEqual(result['Positive_Prob'] + result['Negative_Prob'], 1)
+
+    def test_missing_model(self):
+        with self.assertRaises(ValueError):
+            DistilledSentimentBackend(os.path.join(self.temp_dir, 'missing.joblib'))
+
+    def test_hybrid_only_sends_uncertain_messages(self):
+        local = DistilledSentimentBackend(self.model_path)
+        remote = RecordingBackend()
+        hybrid = HybridSentimentBackend(local, remote, threshold=0.9)
+        texts = self.texts[:500] + ['']
+        results = hybrid.analyze_many(texts)
+
+        scores = local.score(texts)
+        uncertain = [text for text, confidence in zip(texts, scores['Confidence']) if text and confidence < 0.9]
+        self.assertEqual(remote.texts, uncertain)
+        self.assertLess(len(uncertain), len(texts))
+        self.assertIsNone(results[-1])
+        for text, result, confidence in zip(texts[:-1], results, scores['Confidence']):
+            if confidence < 0.9:
+                self.assertEqual(result['Confidence'], 1.0)
+            else:
+                self.assertEqual(result['Confidence'], confidence)
+        self.assertEqual(hybrid.local_count + hybrid.remote_count, len(texts) - 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+import os
+import shutil
+import tempfile
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from unittest.mock import patch
+import pandas as pd
+from chatanalyzer.data_preprocessing import load_and_preprocess_data
+from chatanalyzer.full_analysis import batch_request_api
+from chatanalyzer.sharding import (filter_shard, find_shard_outputs, get_shard_path, get_shard_run, merge_shard_outputs,
+                                  parse_shard)
+
+SAMPLES_DIR = os.path.join(os.path.dirname(__file__), '..', 'samples')
+
+class TestShards(unittest.TestCase):
+    def test_parse_shard(self):
+        self.assertEqual(parse_shard("3/16"), (3, 16))
+        for spec in ("0/4", "5/4", "3", "a/b"):
+            with self.assertRaises(ValueError):
+                parse_shard(spec)
+
+    def test_get_shard_path(self):
+        self.assertEqual(get_shard_path("out/api_output.csv", 3, 16), "out/api_output.shard-03-of-16.csv")
+        self.assertEqual(get_shard_path("watermarks.json", 1, 2), "watermarks.shard-1-of-2.json")
+
+    def test_get_shard_run(self):
+        # 每个分片有自己的输出、水位线和指标文件，并平分 qps
+        self.assertEqual(get_shard_run((2, 4), "api_output.csv", "watermarks.json", None, 8, {"model_path": "m"}),
+                         ("api_output.shard-2-of-4.csv", "watermarks.shard-2-of-4.json", None, 2,
+                          {"model_path": "m", "qps_share": 0.25}))
+        with self.assertRaises(ValueError):
+            get_shard_run((1, 2), "api_output.arrow")
+
+    def test_shards_split_messages(self):
+        chat = load_and_preprocess_data(os.path.join(SAMPLES_DIR, 'full_data.csv'))
+        shards = [filter_shard(chat, index, 4) for index in range(1, 5)]
+        self.assertEqual(sorted(pd.concat(shards)['localId']), sorted(chat['localId']))
+        self.assertTrue(all(len(shard) > len(chat) / 8 for shard in shards))
+        # 分片只取决于消息本身，与分块方式无关
+        pieces = [filter_shard(chat.iloc[start:start + 100], 2, 4) for start in range(0, len(chat), 100)]
+        pd.testing.assert_frame_equal(pd.concat(pieces), shards[1])
+
+        # 没有 localId 的导出按时间、用户和内容分片
+        without_ids = chat.drop(columns=['localId', 'TalkerId', 'CreateTime'])
+        shards = [filter_shard(without_ids, index, 3) for index in range(1, 4)]
+        self.assertEqual(sum(map(len, shards)), len(chat))
+
+def run_shard(input_path, output_path, watermark_path, shard):
+    with patch("chatanalyzer.sentiment_backends.BaiduAuth"), \
+         patch("chatanalyzer.sentiment_client.SentimentClient._request", autospec=True, side_effect=fake_sentiment):
+        batch_request_api(input_path, output_path, batch_size=50, watermark_path=watermark_path, shard=shard)
+
+def fake_sentiment(client, text):
+    return {"Sentiment": len(text) % 3, "Confidence": 0.9, "Positive_Prob": 0.95, "Negative_Prob": 0.05}
+
+class TestShardedRequest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.input_path = shutil.copy(os.path.join(SAMPLES_DIR, 'full_data.csv'), self.temp_dir)
+        self.output_path = os.path.join(self.temp_dir, 'api_output.csv')
+        self.watermark_path = os.path.join(self.temp_dir, 'watermarks.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_merged_shards_match_single_run(self):
+        # 各分片在独立进程中运行，只通过文件系统协作
+        with ProcessPoolExecutor(max_workers=3) as executor:
+            for future in [executor.submit(run_shard, self.input_path, self.output_path, self.watermark_path,
+                                           (index, 3)) for index in range(1, 4)]:
+                future.result()
+        self.assertEqual(len(find_shard_outputs(self.output_path)), 3)
+        self.assertTrue(os.path.exists(get_shard_path(self.watermark_path, 2, 3)))
+        merge_shard_outputs(self.output_path)
+        merged = pd.read_csv(self.output_path)
+
+        single_path = os.path.join(self.temp_dir, 'single.csv')
+        run_shard(self.input_path, single_path, None, None)
+        single = pd.read_csv(single_path)
+        self.assertTrue(merged['StrTime'].is_monotonic_increasing)
+        self.assertEqual(len(merged), len(single))
+        key = ['StrTime', 'User', 'Text']
+        pd.testing.assert_frame_equal(merged.sort_values(key, ignore_index=True),
+                                      single.sort_values(key, ignore_index=True))
+
+    def test_merge_needs_every_shard(self):
+        with self.assertRaises(ValueError):
+            merge_shard_outputs(self.output_path)
+        run_shard(self.input_path, self.output_path, self.watermark_path, (1, 2))
+        with self.assertRaises(ValueError):
+            merge_shard_outputs(self.output_path)
+
+        # 空分片也会留下输出文件
+        run_shard(self.input_path, self.output_path, self.watermark_path, (2, 2))
+        empty_input = os.path.join(self.temp_dir, 'empty.csv')
+        pd.read_csv(self.input_path).iloc[:0].to_csv(empty_input, index=False)
+        empty_output = os.path.join(self.temp_dir, 'empty_output.csv')
+        run_shard(empty_input, empty_output, None, (1, 1))
+        self.assertEqual(merge_shard_outputs(empty_output), 0)
+        self.assertEqual(merge_shard_outputs(self.output_path),
+                         len(pd.read_csv(get_shard_path(self.output_path, 1, 2))) +
+                         len(pd.read_csv(get_shard_path(self.output_path, 2, 2))))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from chatanalyzer.data_preprocessing import load_and_preprocess_data
+from chatanalyzer.full_analysis import batch_request_api
+from chatanalyzer.telemetry import Histogram, Telemetry, TelemetryExporter
+
+SAMPLES_DIR = os.path.join(os.path.dirname(__file__), '..', 'samples')
+
+class TestHistogram(unittest.TestCase):
+    def test_quantile(self):
+        histogram = Histogram(buckets=(0.1, 0.2, 0.4))
+        self.assertIsNone(histogram.quantile(0.5))
+        for value in [0.05] * 50 + [0.15] * 40 + [0.3] * 9 + [1.0]:
+            histogram.observe(value)
+        self.assertEqual(histogram.count, 100)
+        # 与 Prometheus 的 histogram_quantile 一样在桶内线性插值
+        self.assertAlmostEqual(histogram.quantile(0.5), 0.1)
+        self.assertAlmostEqual(histogram.quantile(0.7), 0.15)
+        self.assertEqual(histogram.quantile(1.0), 0.4)
+
+class TestTelemetry(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_prometheus_format(self):
+        telemetry = Telemetry({"source": "chat.csv"})
+        telemetry.increment("chatanalyzer_api_requests_total", status="200", outcome="ok", key="default")
+        telemetry.increment("chatanalyzer_api_requests_total", status="200", outcome="ok", key="default")
+        telemetry.increment("chatanalyzer_api_requests_total", status="200", outcome="throttled", key="default")
+        for value in (0.02, 0.07, 20.0):
+            telemetry.observe("chatanalyzer_api_request_duration_seconds", value)
+        lines = telemetry.to_prometheus().splitlines()
+
+        self.assertIn("# TYPE chatanalyzer_api_requests_total counter", lines)
+        self.assertIn('chatanalyzer_api_requests_total{source="chat.csv",key="default",outcome="ok",status="200"} 2',
+                      lines)
+        self.assertIn('chatanalyzer_api_request_duration_seconds_bucket{source="chat.csv",le="0.05"} 1', lines)
+        self.assertIn('chatanalyzer_api_request_duration_seconds_bucket{source="chat.csv",le="+Inf"} 3', lines)
+        self.assertIn('chatanalyzer_api_request_duration_seconds_count{source="chat.csv"} 3', lines)
+        self.assertEqual(telemetry.total("chatanalyzer_api_requests_total", outcome="ok"), 2)
+
+        summary = telemetry.summary()
+        self.assertEqual(summary["requests"]["by_outcome"], {"ok": 2, "throttled": 1})
+        self.assertEqual(summary["latency_seconds"]["count"], 3)
+
+    def test_exporter_writes_periodically(self):
+        telemetry = Telemetry()
+        prometheus_path = os.path.join(self.temp_dir, "chatanalyzer.prom")
+        exporter = TelemetryExporter(telemetry, prometheus_path, interval=0.05)
+        telemetry.increment("chatanalyzer_messages_total", 10)
+        deadline = time.time() + 5
+        while not os.path.exists(prometheus_path) and time.time() < deadline:
+            time.sleep(0.02)
+        self.assertTrue(os.path.exists(prometheus_path))
+
+        telemetry.increment("chatanalyzer_messages_total", 5)
+        exporter.close()
+        with open(os.path.join(self.temp_dir, "chatanalyzer.json")) as file:
+            self.assertEqual(json.load(file)["messages"], 15)
+        # 原子替换，不留下临时文件
+        self.assertEqual(sorted(os.listdir(self.temp_dir)), ["chatanalyzer.json", "chatanalyzer.prom"])
+
+    def test_request_run_writes_metrics(self):
+        input_path = shutil.copy(os.path.join(SAMPLES_DIR, 'full_data.csv'), self.temp_dir)
+        metrics_path = os.path.join(self.temp_dir, 'chatanalyzer.prom')
+        batch_request_api(input_path, os.path.join(self.temp_dir, 'api_output.csv'), batch_size=1000,
+                          backend='lexicon', metrics_path=metrics_path)
+
+        chat = load_and_preprocess_data(input_path)
+        with open(os.path.join(self.temp_dir, 'chatanalyzer.json')) as file:
+            summary = json.load(file)
+        self.assertEqual(summary["messages"], (chat['MessageType'] == 'text').sum())
+        self.assertEqual(summary["labels"], {"source": "full_data.csv"})
+        self.assertGreater(summary["messages_per_second"], 0)
+        with open(metrics_path) as file:
+            self.assertIn('chatanalyzer_batches_total{source="full_data.csv"} 5', file.read().splitlines())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+import os
+import re
+import unittest
+import numpy as np
+import pandas as pd
+from chatanalyzer.analysis_context import AnalysisContext
+from chatanalyzer.schema import read_results_csv
+
+SAMPLES_DIR = os.path.join(os.path.dirname(__file__), '..', 'samples')
+
+class TestTokenIndex(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.context = AnalysisContext(read_results_csv(os.path.join(SAMPLES_DIR, 'api_output.csv')))
+        cls.index = cls.context.token_index()
+
+    def test_count_matches_str_count(self):
+        texts = self.context.df['Text']
+        users = self.context.df['User']
+        # 单字、跨词、包含正则特殊字符及不存在的词
+        for word in ['哈', '哈哈', '好的', '我们', '的了', '?', '[', '不存在的词']:
+            expected = texts.str.count(re.escape(word)).fillna(0)
+            occurrences = self.index.count(word)
+            np.testing.assert_array_equal(occurrences.to_numpy(), expected.to_numpy())
+            pd.testing.assert_series_equal(self.index.frequency(occurrences, 'User'),
+                                           expected.groupby(users, observed=True).sum(),
+                                           check_dtype=False, check_names=False, check_index_type=False)
+        with self.assertRaises(ValueError):
+            self.index.count('')
+
+    def test_term_and_phrase(self):
+        tokens = self.context.tokens()
+        token = tokens[tokens.map(len) > 1].iloc[0][0]
+        expected = tokens.map(lambda message: message.count(token))
+        np.testing.assert_array_equal(self.index.term(token).to_numpy(), expected.to_numpy())
+
+        # 短语：连续出现的词
+        context = AnalysisContext(pd.DataFrame({
+            'Text': ['Hello world', 'world Hello', 'Hello world Hello world'],
+            'StrTime': pd.to_datetime(['2023-01-01 10:00', '2023-02-01 10:00', '2023-02-02 10:00']),
+            'User': ['A', 'B', 'A'],
+        }))
+        index = context.token_index()
+        phrase = index.phrase(['Hello', ' ', 'world'])
+        self.assertEqual(phrase.tolist(), [1, 0, 2])
+        self.assertEqual(index.phrase('Hello world').tolist(), [1, 0, 2])
+        self.assertEqual(index.frequency(phrase, 'User').to_dict(), {'A': 3, 'B': 0})
+        self.assertEqual(index.frequency(phrase, 'Month').tolist(), [1, 2])
+        self.assertEqual(index.term('Hello').sum(), 4)
+        self.assertNotIn('Hello world', index)
+
+if __name__ == "__main__":
+    unittest.main()
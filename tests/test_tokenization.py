@@ -0,0 +1,69 @@
+import os
+import shutil
+import tempfile
+import unittest
+from collections import Counter
+from unittest.mock import patch
+import pandas as pd
+from chatanalyzer import tokenization
+from chatanalyzer.analysis_context import AnalysisContext
+from chatanalyzer.schema import read_results_csv
+from chatanalyzer.sentiment_utils import word_frequency_analysis
+from chatanalyzer.tokenization import TOKEN_SEPARATOR, TokenCache, tokenize_texts
+
+SAMPLES_DIR = os.path.join(os.path.dirname(__file__), '..', 'samples')
+
+class TestTokenization(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.cache_path = os.path.join(self.temp_dir, 'token_cache.sqlite')
+        self.df = read_results_csv(os.path.join(SAMPLES_DIR, 'api_output.csv'))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_tokens_cover_each_message(self):
+        texts = self.df['Text'].tolist()[:200] + [None]
+        tokens = tokenize_texts(texts, workers=1)
+        self.assertEqual(len(tokens), len(texts))
+        self.assertEqual([''.join(token_list) for token_list in tokens[:-1]], texts[:-1])
+        self.assertEqual(tokens[-1], [])
+
+    def test_cache_only_cuts_new_texts(self):
+        texts = self.df['Text'].dropna().tolist()[:100]
+        first = tokenize_texts(texts, cache_path=self.cache_path, workers=1)
+        with TokenCache(self.cache_path) as cache:
+            self.assertEqual(len(cache), len(set(texts)))
+
+        # 再次运行全部命中缓存，新增消息只切分它自己
+        with patch.object(tokenization, 'cut_texts', wraps=tokenization.cut_texts) as mock_cut:
+            self.assertEqual(tokenize_texts(texts, cache_path=self.cache_path, workers=1), first)
+            tokenize_texts(texts + ['一条新的消息'], cache_path=self.cache_path, workers=1)
+        self.assertEqual(mock_cut.call_args_list[0].args[0], [])
+        self.assertEqual(mock_cut.call_args_list[1].args[0], ['一条新的消息'])
+
+    def test_text_with_separator_is_not_cached(self):
+        text = f"你好{TOKEN_SEPARATOR}世界"
+        self.assertEqual(''.join(tokenize_texts([text], cache_path=self.cache_path, workers=1)[0]), text)
+        with TokenCache(self.cache_path) as cache:
+            self.assertEqual(len(cache), 0)
+
+    def test_process_pool_matches_single_process(self):
+        texts = self.df['Text'].dropna().tolist()[:300]
+        with patch.object(tokenization, 'PARALLEL_THRESHOLD', 10), patch.object(tokenization, 'BATCH_SIZE', 100):
+            pooled = tokenize_texts(texts, workers=2)
+        self.assertEqual(pooled, tokenize_texts(texts, workers=1))
+
+    def test_word_frequency_from_tokens(self):
+        df = pd.DataFrame({
+            'Text': ['今天', '天气很好'],
+            'StrTime': pd.to_datetime(['2023-01-01 10:00', '2023-01-01 10:01']),
+            'User': ['A', 'B'],
+        })
+        # 各条消息单独切分后统计，单字与空白不计入
+        context = AnalysisContext(df)
+        self.assertEqual(word_frequency_analysis(context), Counter({'今天': 1, '天气': 1}))
+        self.assertIs(context.tokens(), context.tokens())
+
+if __name__ == "__main__":
+    unittest.main()